@@ -0,0 +1,253 @@
+"""Verschiebt alte Zeilen der Sensortabellen (data_*) in ein spaltenweises Archiv aus NumPy Dateien:
+
+    python3 archive.py ../data/sensordata.db [../data/archive] [--days=90] [--compress]
+
+Archiviert werden ganze Kalendermonate (UTC), die vollständig älter als --days Tage sind. Pro
+Sensor und Monat entsteht ein Verzeichnis archive/<sensor>/<JJJJ-MM>/ mit meta.json und
+
+    ohne --compress   einer .npy Datei pro Spalte (TIMESTAMP.npy, OFFSET.npy, TEMP.npy, ...). Die
+                      Dateien können mit np.load(..., mmap_mode = 'r') eingeblendet werden, gelesen
+                      wird nur der benötigte Bereich.
+    mit --compress    einer data.npz (zip/deflate) mit allen Spalten. Deutlich kleiner, eine Spalte
+                      wird beim Lesen aber vollständig entpackt.
+
+Erst wenn ein Monat geschrieben und wieder gelesen wurde, werden genau die exportierten Zeilen in
+Blöcken zu batch_size Zeilen gelöscht. Jeder Block ist eine eigene kurze Transaktion, der laufende
+Writer kann dazwischen schreiben. Die Rollup Tabellen bleiben erhalten, Statistiken über
+archivierte Zeiträume funktionieren daher weiter. Das Ende der archivierten Monate jeder Tabelle
+steht in der Tabelle archive_state. rollup.backfill rechnet davor nicht neu und importlog.py lädt
+dort keine Zeilen nach. Die frei gewordenen Seiten verwendet SQLite für neue Zeilen wieder. Wird
+die Datenbank repliziert (siehe replicate.py), werden nur Monate archiviert, in denen keine Zeile
+mehr auf die Übertragung wartet.
+
+Ein Monat, der schon im Archiv liegt (z. B. nach einem Abbruch vor dem Löschen), wird mit den
+neuen Zeilen zusammengeführt. Archive liest das Archiv, query.Query(..., archive = ...) liest
+Archiv und Datenbank gemeinsam.
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import time
+import numpy as np               # pip install numpy
+import replicate
+from partition import month_start, next_month
+
+# Alter in Tagen, ab dem Zeilen archiviert werden
+MAX_AGE_DAYS = 90
+# Zeilen pro Löschtransaktion und Pause danach in Sekunden
+BATCH_SIZE = 1000
+BATCH_PAUSE = 0.05
+STATE_TABLE = 'archive_state'
+
+def archive(conn, directory, max_age = MAX_AGE_DAYS * 86400, table_prefix = 'data', compress = False,
+            batch_size = BATCH_SIZE, pause = BATCH_PAUSE, now = None):
+    """Archiviert alle ganzen Monate, die älter als max_age sind, und löscht sie aus der Datenbank.
+
+    Args:
+        conn (sqlite3.Connection): Datenbank mit den Sensortabellen.
+        directory (str): Verzeichnis des Archivs.
+        max_age (int, optional): Alter in Sekunden. Defaults to MAX_AGE_DAYS Tage.
+        table_prefix (str, optional): Prefix der Sensortabellen. Defaults to 'data'.
+        compress (bool, optional): data.npz statt .npy Dateien schreiben. Defaults to False.
+        batch_size (int, optional): Zeilen pro Löschtransaktion. Defaults to BATCH_SIZE.
+        pause (float, optional): Pause nach jeder Löschtransaktion in Sekunden. Defaults to BATCH_PAUSE.
+        now (int, optional): Aktuelle Zeit als UNIX Timestamp. Defaults to time.time().
+
+    Returns:
+        int: Anzahl der archivierten und gelöschten Zeilen.
+    """
+    now = int(time.time()) if now is None else int(now)
+    cutoff = month_start(now - max_age)
+    tables = [val[0] for val in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'", (table_prefix + '\\_%',))]
+    total = 0
+    for tablename in tables:
+        # Archive, die vor archive_state geschrieben wurden, werden hier nachgetragen.
+        months = Archive(directory).get_months(tablename[len(table_prefix) + 1:])
+        if len(months) > 0:
+            _set_archived_until(conn, tablename, next_month(max(meta['last'] for meta in months)))
+        columns = [val[1] for val in conn.execute('PRAGMA table_info({})'.format(tablename))
+                   if val[1].upper() not in ('TIMESTAMP', 'SENSOR')]
+        limit = cutoff
+        if replicate.is_replicated(conn):
+            # Der Monat mit der ältesten noch nicht übertragenen Zeile bleibt in der Datenbank.
+            until = replicate.get_replicated_until(conn, tablename)
+            if until is not None:
+                limit = min(limit, month_start(until) if until > -2**62 else until)
+        row = conn.execute('SELECT MIN(TIMESTAMP), MIN(TRIM(SENSOR)) FROM {} WHERE TIMESTAMP < ?'
+                           .format(tablename), (limit,)).fetchone()
+        if row[0] is None:
+            continue
+        sensor = row[1] if row[1] is not None else tablename[len(table_prefix) + 1:]
+        month = month_start(row[0])
+        while month < limit:
+            end = next_month(month)
+            rows = conn.execute('SELECT TIMESTAMP, {} FROM {} WHERE TIMESTAMP >= ? AND TIMESTAMP < ? ORDER BY TIMESTAMP'
+                                .format(', '.join(columns), tablename), (month, end)).fetchall()
+            if len(rows) > 0:
+                timestamps = _write_month(directory, sensor, month, columns, rows, compress)
+                count = _delete(conn, tablename, timestamps, batch_size, pause)
+                logging.info('%s %s: %d Zeilen archiviert.', tablename, _month_name(month), count)
+                total += count
+            _set_archived_until(conn, tablename, end)
+            month = end
+    return total
+
+def get_archived_until(conn, tablename):
+    """Liefert das Ende (exklusiv) der archivierten Monate einer Sensortabelle oder None, wenn
+    nichts archiviert ist. Davor liegen die Rohdaten nur im Archiv, die Rollups aber weiter in der
+    Datenbank."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (STATE_TABLE,)).fetchone() is None:
+        return None
+    row = conn.execute('SELECT ARCHIVED_UNTIL FROM {} WHERE TABLENAME = ?'.format(STATE_TABLE),
+                       (tablename.lower(),)).fetchone()
+    return row[0] if row is not None else None
+
+class Archive:
+    """Lesezugriff auf das von archive geschriebene Verzeichnis."""
+
+    def __init__(self, directory):
+        """Konstruktor
+
+        Args:
+            directory (str): Verzeichnis des Archivs.
+        """
+        self.__directory = directory
+
+    def get_sensors(self):
+        """Liefert die Namen (in Kleinbuchstaben) der archivierten Sensoren."""
+        if not os.path.isdir(self.__directory):
+            return []
+        return sorted(name for name in os.listdir(self.__directory)
+                      if os.path.isdir(os.path.join(self.__directory, name)))
+
+    def get_months(self, sensor):
+        """Liefert die Metadaten (Inhalt von meta.json) aller archivierten Monate eines Sensors."""
+        path = os.path.join(self.__directory, sensor.lower())
+        if not os.path.isdir(path):
+            return []
+        return [_read_meta(os.path.join(path, name)) for name in sorted(os.listdir(path))
+                if os.path.isfile(os.path.join(path, name, 'meta.json'))]
+
+    def read(self, sensor, valuetype, start, end):
+        """Liefert TIMESTAMP und VALUE einer Serie im Zeitraum start bis end (inklusive). Es werden
+        nur die Monate gelesen, die den Zeitraum berühren, bei .npy Dateien nur der Bereich selbst.
+
+        Returns:
+            tuple: (TIMESTAMP als int64 Array, VALUE als float64 Array). Leer, wenn nichts archiviert ist.
+        """
+        parts = [(np.array([], dtype = np.int64), np.array([], dtype = np.float64))]
+        for meta in self.get_months(sensor):
+            if meta['last'] < start or meta['first'] > end:
+                continue
+            data = _load_month(os.path.join(self.__directory, sensor.lower(), meta['month']), meta)
+            timestamps = data['TIMESTAMP']
+            lower = np.searchsorted(timestamps, start, side = 'left')
+            upper = np.searchsorted(timestamps, end, side = 'right')
+            column = next((name for name in meta['columns'] if name.upper() == valuetype.upper()), None)
+            values = data[column][lower:upper] if column is not None else np.full(upper - lower, np.nan)
+            parts.append((np.array(timestamps[lower:upper], dtype = np.int64), np.array(values, dtype = np.float64)))
+        return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+
+def _set_archived_until(conn, tablename, timestamp):
+    """Setzt das Ende der archivierten Monate, ein späteres Ende bleibt erhalten."""
+    conn.execute('CREATE TABLE IF NOT EXISTS {} (TABLENAME TEXT PRIMARY KEY, ARCHIVED_UNTIL INTEGER) WITHOUT ROWID'
+                 .format(STATE_TABLE))
+    conn.execute('INSERT INTO {} (TABLENAME, ARCHIVED_UNTIL) VALUES (?, ?) ON CONFLICT (TABLENAME) '
+                 'DO UPDATE SET ARCHIVED_UNTIL = max(ARCHIVED_UNTIL, excluded.ARCHIVED_UNTIL)'.format(STATE_TABLE),
+                 (tablename.lower(), int(timestamp)))
+    conn.commit()
+
+def _month_name(month):
+    return time.strftime('%Y-%m', time.gmtime(month))
+
+def _read_meta(path):
+    with open(os.path.join(path, 'meta.json'), encoding = 'utf-8') as file:
+        return json.load(file)
+
+def _load_month(path, meta):
+    """Liefert die Spalten eines Monats als dict. .npy Dateien werden eingeblendet (mmap)."""
+    if meta['format'] == 'npz':
+        return np.load(os.path.join(path, 'data.npz'))
+    return {name: np.load(os.path.join(path, name + '.npy'), mmap_mode = 'r') for name in ['TIMESTAMP'] + meta['columns']}
+
+def _write_month(directory, sensor, month, columns, rows, compress):
+    """Schreibt einen Monat (mit einem bereits archivierten zusammengeführt) und prüft das Ergebnis.
+
+    Returns:
+        numpy.ndarray: Die TIMESTAMPs der Zeilen aus rows.
+    """
+    data = np.array(rows, dtype = np.float64).reshape(-1, len(columns) + 1)
+    result = {'TIMESTAMP': data[:, 0].astype(np.int64)}
+    result.update((column, data[:, i + 1]) for i, column in enumerate(columns))
+    timestamps = result['TIMESTAMP']
+
+    path = os.path.join(directory, sensor.lower(), _month_name(month))
+    if os.path.isfile(os.path.join(path, 'meta.json')):
+        meta = _read_meta(path)
+        existing = _load_month(path, meta)
+        columns = columns + [name for name in meta['columns'] if name not in columns]
+        # Zeilen aus der Datenbank zuerst, np.unique behält bei gleichem TIMESTAMP die erste.
+        merged = np.concatenate([timestamps, existing['TIMESTAMP']])
+        merged, index = np.unique(merged, return_index = True)
+        result = {name: np.concatenate([
+            result[name] if name in result else np.full(len(timestamps), np.nan),
+            np.asarray(existing[name]) if name in meta['columns'] else np.full(len(existing['TIMESTAMP']), np.nan)
+        ])[index] for name in columns}
+        result['TIMESTAMP'] = merged
+
+    meta = {'sensor': sensor, 'month': _month_name(month), 'format': 'npz' if compress else 'npy',
+            'columns': columns, 'rows': len(result['TIMESTAMP']),
+            'first': int(result['TIMESTAMP'][0]), 'last': int(result['TIMESTAMP'][-1])}
+    temp = path + '.tmp'
+    shutil.rmtree(temp, ignore_errors = True)
+    os.makedirs(temp)
+    if compress:
+        np.savez_compressed(os.path.join(temp, 'data.npz'), **result)
+    else:
+        for name, values in result.items():
+            np.save(os.path.join(temp, name + '.npy'), values)
+    with open(os.path.join(temp, 'meta.json'), 'w', encoding = 'utf-8') as file:
+        json.dump(meta, file, indent = 2)
+
+    # Das alte Verzeichnis wird erst nach dem Umbenennen gelöscht, ein Abbruch verliert keine Daten.
+    if os.path.isdir(path):
+        os.replace(path, path + '.old')
+    os.replace(temp, path)
+    shutil.rmtree(path + '.old', ignore_errors = True)
+
+    written = _load_month(path, _read_meta(path))['TIMESTAMP']
+    if not np.isin(timestamps, written).all():
+        raise RuntimeError('{} enthält nicht alle exportierten Zeilen.'.format(path))
+    return timestamps
+
+def _delete(conn, tablename, timestamps, batch_size, pause):
+    """Löscht die Zeilen mit den angegebenen TIMESTAMPs in Transaktionen zu batch_size Zeilen."""
+    count = 0
+    for i in range(0, len(timestamps), batch_size):
+        batch = [(int(timestamp),) for timestamp in timestamps[i:i + batch_size]]
+        try:
+            before = conn.total_changes
+            conn.executemany('DELETE FROM {} WHERE TIMESTAMP = ?'.format(tablename), batch)
+            conn.commit()
+            count += conn.total_changes - before
+        except Exception:
+            conn.rollback()
+            raise
+        time.sleep(pause)
+    return count
+
+if __name__ == '__main__':
+    logging.basicConfig(format = '%(asctime)s %(message)s', level = logging.INFO)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    days = next((int(arg[7:]) for arg in sys.argv[1:] if arg.startswith('--days=')), MAX_AGE_DAYS)
+    conn = sqlite3.connect(args[0] if len(args) > 0 else '../data/sensordata.db', timeout = 60)
+    try:
+        logging.info('%d Zeilen archiviert.', archive(conn, args[1] if len(args) > 1 else '../data/archive',
+                                                      days * 86400, compress = '--compress' in sys.argv))
+    finally:
+        conn.close()
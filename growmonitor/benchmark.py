@@ -0,0 +1,200 @@
+"""Benchmark für Cronjob, db.Database und die Textdateien mit simulierten Treibern (siehe sim.py).
+Läuft ohne Raspberry Pi auf jedem Linux Rechner:
+
+    python3 benchmark.py --sensors 10 100 1000 10000 --duration 10
+
+Jede Anzahl an Sensoren läuft in einem eigenen Prozess in einem temporären Verzeichnis, damit der
+Speicherverbrauch (maximale RSS) nicht von den vorigen Läufen beeinflusst wird. Die Jobs werden wie
+mit disable_cron jede Sekunde ausgeführt. Ausgegeben werden:
+    records/s      Datensätze pro Sekunde (und der Anteil der erwarteten Datensätze)
+    offset         50 %, 95 % und Maximum von OFFSET (Verzögerung bis zum Ende des Jobs) in s
+    missed         Ausgelassene Termine
+    flush          Dauer des letzten Schreibvorganges beim Beenden in s
+    rss            Maximaler Speicherverbrauch des Prozesses in MB
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import cronjob
+import db
+import sim
+from cronjob import Cronjob
+from textlog import TextLog
+
+# Jobs eines Sensors pro Profil. sensors enthält nur Sensoren, growbox die ganze Box wie in
+# cronjobs.growbox.json (mit Lüfter, Relais und Webcam).
+PROFILES = {
+    'sensors': [
+        ('BME280', 'Bme280', {'i2c_address': '0x76'}),
+        ('TSL2561', 'Tsl2561', {'i2c_address': '0x39'}),
+        ('ADC', 'Adc', {'i2c_address': '0x48'}),
+        ('RELAYMONITOR', 'Relaymonitor', {})
+    ],
+    'growbox': [
+        ('BME280_RAUM', 'Bme280', {'i2c_address': '0x77'}),
+        ('BME280_BOX', 'Bme280', {'i2c_address': '0x76'}),
+        ('TSL2561_BOX', 'Tsl2561', {'i2c_address': '0x39'}),
+        ('LIGHT', 'Relais', {'pin': [25], 'onFrom': '3:00', 'onTo': '19:00'}),
+        ('FAN', 'Fan', {'pin': 24, 'lightstate': 'LIGHT', 'boxsensor': 'BME280_BOX', 'roomsensor': 'BME280_RAUM'}),
+        ('WEBCAM', 'Cam', {}),
+        ('RELAYMONITOR', 'Relaymonitor', {})
+    ]
+}
+
+def generate_config(sensors, profile = 'sensors', latency_scale = 1.0, failure_rate = 0, buses = 0):
+    """Erzeugt die Konfiguration mit der angegebenen Anzahl an Jobs. Die Jobs des Profils werden
+    wiederholt, Verweise auf andere Jobs (z. B. beim Lüfter) zeigen auf dieselbe Gruppe.
+
+    Args:
+        sensors (int): Anzahl der Jobs.
+        profile (str, optional): Schlüssel in PROFILES. Defaults to 'sensors'.
+        latency_scale (float, optional): Faktor für sim.DEFAULT_LATENCY. Defaults to 1.0.
+        failure_rate (float, optional): Fehlerwahrscheinlichkeit jedes Aufrufes. Defaults to 0.
+        buses (int, optional): Anzahl der I²C Busse, auf die die Sensoren verteilt werden. Jobs auf
+            demselben Bus laufen nacheinander. 0 für keinen Bus (alle Jobs unabhängig). Defaults to 0.
+
+    Returns:
+        dict: Die Konfiguration im Format von cronjobs.json.
+    """
+    template = PROFILES[profile]
+    names = [name for name, cls, params in template]
+    config = {}
+    for index in range(sensors):
+        group, position = divmod(index, len(template))
+        name, cls, params = template[position]
+        params = {key: '{}_{}'.format(value, group) if isinstance(value, str) and value in names else value
+                  for key, value in params.items()}
+        params['latency'] = sim.DEFAULT_LATENCY[cls] * latency_scale
+        params['failure_rate'] = failure_rate
+        params['seed'] = index
+        if buses > 0 and 'i2c_address' in params:
+            params['bus'] = group % buses
+        config['{}_{}'.format(name, group)] = {'run_at': '* * * * *', 'class': cls, 'params': params}
+    return config
+
+def run(sensors, duration, workers = 4, log = 'buffered', rollups = True, trace_memory = False, **config_args):
+    """Führt einen Durchlauf im aktuellen Verzeichnis aus und liefert die Ergebnisse als dict."""
+    with open('cronjobs.json', 'w') as config_file:
+        json.dump(generate_config(sensors, **config_args), config_file)
+    if trace_memory:
+        tracemalloc.start()
+    sim.reset_statistics()
+    offsets = []
+    first_record = []
+    started = time.monotonic()
+
+    with db.Database.sqlite('benchmark.db', persistent = True, rollups = rollups) as database, \
+         TextLog() as textlog:
+        def on_job_ready(data):
+            if len(first_record) == 0:
+                first_record.append(time.monotonic() - started)
+            offsets.append(data['OFFSET'])
+            database.enqueue(data)
+            if log == 'buffered':
+                textlog.write(data)
+            elif log == 'line':
+                db.write_line(data)
+
+        jobs = Cronjob('cronjobs.json', workers = workers, drivers = sim)
+        timer = threading.Timer(duration, jobs.stop)
+        timer.start()
+        jobs.start_working(disable_cron = True, on_job_ready = on_job_ready,
+                           on_all_jobs_ready = database.write_queue)
+        elapsed = time.monotonic() - started
+        flush_started = time.monotonic()
+        database.flush()
+        textlog.flush()
+        flush = time.monotonic() - flush_started
+
+    offsets.sort()
+    percentile = lambda p: offsets[min(len(offsets) - 1, int(p * len(offsets)))] if len(offsets) > 0 else None
+    result = {
+        'sensors': sensors,
+        'seconds': round(elapsed, 2),
+        'calls': sim.statistics['calls'],
+        'failures': sim.statistics['failures'],
+        'records': len(offsets),
+        'records_per_second': round(len(offsets) / elapsed, 1),
+        'expected': sensors * duration,
+        'first_record': round(first_record[0], 2) if len(first_record) > 0 else None,
+        'offset_p50': percentile(0.5),
+        'offset_p95': percentile(0.95),
+        'offset_max': offsets[-1] if len(offsets) > 0 else None,
+        'missed': cronjob.job_missed.total(),
+        'rows_written': db.rows_written.total(),
+        'dropped': db.dropped.total(),
+        'flush': round(flush, 3),
+        # ru_maxrss ist unter Linux in KB angegeben.
+        'rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+    if trace_memory:
+        result['heap_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+def print_header():
+    print('{:>8} {:>10} {:>7} {:>7} {:>7} {:>7} {:>7} {:>7} {:>8} {:>8}'.format(
+        'sensors', 'records/s', 'ratio', 'off50', 'off95', 'offmax', 'missed', 'flush', 'startup', 'rss MB'))
+
+def print_result(result):
+    print('{:>8} {:>10} {:>6.0f}% {:>7} {:>7} {:>7} {:>7} {:>7} {:>8} {:>8}'.format(
+        result['sensors'], result['records_per_second'], 100 * result['records'] / max(1, result['expected']),
+        str(result['offset_p50']), str(result['offset_p95']), str(result['offset_max']),
+        result['missed'], result['flush'], str(result['first_record']), result['rss_mb']), flush = True)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark für Cronjob und Datenbank mit simulierten Sensoren.')
+    parser.add_argument('--sensors', type = int, nargs = '+', default = [10, 100, 1000, 10000], help = 'Anzahl der Sensoren pro Durchlauf.')
+    parser.add_argument('--duration', type = int, default = 10, help = 'Dauer eines Durchlaufes in Sekunden.')
+    parser.add_argument('--workers', type = int, default = 4, help = 'Threads des Cronjobs.')
+    parser.add_argument('--profile', choices = sorted(PROFILES), default = 'sensors')
+    parser.add_argument('--latency-scale', type = float, default = 1.0, help = 'Faktor für die simulierte Dauer der Treiber.')
+    parser.add_argument('--failure-rate', type = float, default = 0.0, help = 'Fehlerwahrscheinlichkeit pro Aufruf.')
+    parser.add_argument('--buses', type = int, default = 0, help = 'Anzahl der I²C Busse (0: keine gemeinsamen Busse).')
+    parser.add_argument('--log', choices = ['buffered', 'line', 'none'], default = 'buffered',
+                        help = 'Textdateien mit TextLog (buffered), db.write_line (line) oder keine.')
+    parser.add_argument('--no-rollups', action = 'store_true', help = 'Rollup Tabellen nicht aktualisieren.')
+    parser.add_argument('--trace-memory', action = 'store_true', help = 'Spitze des Python Heaps mit tracemalloc messen (langsamer).')
+    parser.add_argument('--json', action = 'store_true', help = 'Ergebnisse als JSON ausgeben.')
+    parser.add_argument('--single', action = 'store_true', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Fehler der simulierten Treiber nicht protokollieren, sie werden in failures gezählt.
+    logging.disable(logging.ERROR)
+    if args.single:
+        with tempfile.TemporaryDirectory(prefix = 'growmonitor-benchmark-') as directory:
+            os.chdir(directory)
+            result = run(args.sensors[0], args.duration, workers = args.workers, log = args.log,
+                         rollups = not args.no_rollups, trace_memory = args.trace_memory,
+                         profile = args.profile, latency_scale = args.latency_scale,
+                         failure_rate = args.failure_rate, buses = args.buses)
+        print(json.dumps(result))
+        return
+
+    options = ['--duration', str(args.duration), '--workers', str(args.workers), '--profile', args.profile,
+               '--latency-scale', str(args.latency_scale), '--failure-rate', str(args.failure_rate),
+               '--buses', str(args.buses), '--log', args.log] + \
+              (['--no-rollups'] if args.no_rollups else []) + (['--trace-memory'] if args.trace_memory else [])
+    results = []
+    if not args.json:
+        print_header()
+    for sensors in args.sensors:
+        command = [sys.executable, os.path.abspath(__file__), '--single', '--sensors', str(sensors)] + options
+        output = subprocess.run(command, stdout = subprocess.PIPE, check = True).stdout
+        results.append(json.loads(output.decode().splitlines()[-1]))
+        if not args.json:
+            print_result(results[-1])
+    if args.json:
+        print(json.dumps(results, indent = 2))
+
+if __name__ == '__main__':
+    main()
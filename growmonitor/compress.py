@@ -0,0 +1,268 @@
+"""Verdichtung der gespeicherten Messwerte pro Sensor (Deadband und Swinging Door).
+
+main.on_job_ready übergibt jeden Datensatz an Compressor.filter und schreibt nur die gelieferten
+Datensätze mit Database.enqueue und TextLog.write. Verlauf, Regelung und PushServer erhalten
+weiterhin jeden Datensatz. Eingestellt wird die Verdichtung pro Job in cronjobs.json:
+
+    "RELAYMONITOR": {
+        "run_at": "* * * * *",
+        "class": "Relaymonitor",
+        "compress": {"method": "deadband"}
+    },
+    "BME280_BOX": {
+        ...
+        "compress": {"method": "swinging_door", "deviation": {"TEMP": 0.1, "HUM": 0.5}, "heartbeat": 10}
+    }
+
+    method     deadband: Ein Datensatz wird gespeichert, wenn ein Wert um mehr als die erlaubte
+               Abweichung vom zuletzt gespeicherten Wert abweicht. Rekonstruktion: step.
+               swinging_door: Ein Datensatz wird gespeichert, wenn die Werte seit dem zuletzt
+               gespeicherten Datensatz nicht mehr durch eine Gerade mit der erlaubten Abweichung
+               beschrieben werden können. Gespeichert wird dann der vorige Datensatz (die Ecke).
+               Rekonstruktion: linear, die Abweichung zwischen zwei gespeicherten Datensätzen
+               ist höchstens 2 * deviation.
+    deviation  Erlaubte absolute Abweichung, eine Zahl für alle Werte oder ein dict pro Werttyp.
+               Standardwert ist 0 (jede Änderung wird gespeichert).
+    relative   Erlaubte Abweichung relativ zum zuletzt gespeicherten Wert (0.01 = 1 %), Zahl oder
+               dict. Es gilt die größere der beiden Abweichungen. Standardwert ist 0.
+    heartbeat  Minuten, nach denen spätestens wieder gespeichert wird. Standardwert siehe
+               DEFAULT_HEARTBEAT, damit jeder 10 Minuten Block (Rollups, getStats) einen Wert hat.
+
+Werte, die keine Zahlen sind, und eine Änderung der Werttypen führen immer zum Speichern. Ohne
+compress wird jeder Datensatz gespeichert. Die Einträge werden bei einer Änderung von
+cronjobs.json (spätestens nach poll_interval Sekunden) neu gelesen.
+
+reconstruct berechnet aus den gespeicherten Werten wieder eine Serie mit festem Raster, siehe
+query.Query.get_series mit fill. Die R API (webserver/sensordata_api.r) rekonstruiert die Werte
+für die Diagramme ebenso. Die Rollup Tabellen enthalten dagegen nur die gespeicherten Werte: CNT
+zählt sie, SUM / CNT ist ihr Mittelwert und nicht über die Zeit gewichtet. Lange konstante
+Abschnitte zählen darin nur mit ihren Eckpunkten. Zeitgewichtete Mittelwerte liefert get_series
+mit fill und bucket.
+"""
+
+import json
+import logging
+import os
+import time
+import metrics
+from drivers import LazyModule
+
+np = LazyModule('numpy')         # pip install numpy
+
+METHODS = ('deadband', 'swinging_door')
+# Standardwert für heartbeat in Minuten
+DEFAULT_HEARTBEAT = 10
+
+records_received = metrics.registry.counter('growmonitor_compress_received_total', 'Anzahl der Datensätze vor der Verdichtung.', 'sensor')
+records_stored = metrics.registry.counter('growmonitor_compress_stored_total', 'Anzahl der gespeicherten Datensätze.', 'sensor')
+
+class Compressor:
+    """Entscheidet pro Sensor, welche Datensätze gespeichert werden. filter und flush werden nur aus
+    einem Thread (dem Thread von on_job_ready) aufgerufen."""
+
+    def __init__(self, configfile = None, settings = None, poll_interval = 5):
+        """Konstruktor
+
+        Args:
+            configfile (str, optional): cronjobs.json, aus der die Einträge compress gelesen werden.
+            settings (dict, optional): Sensorname -> Eintrag compress, wenn keine configfile angegeben ist.
+            poll_interval (int, optional): Sekunden zwischen zwei Prüfungen der configfile. Defaults to 5.
+        """
+        self.__configfile = configfile
+        self.__poll_interval = poll_interval
+        self.__mtime = None
+        self.__checked = 0
+        self.__settings = {}
+        self.__states = {}
+        if settings is not None:
+            self.configure(settings)
+
+    def configure(self, settings):
+        """Übernimmt die Einstellungen (Sensorname -> Eintrag compress). Sensoren, deren Eintrag sich
+        ändert, beginnen mit dem nächsten Datensatz neu."""
+        parsed = {}
+        for sensor, options in settings.items():
+            method = options.get('method', 'deadband')
+            if method not in METHODS:
+                raise Exception('Ungültige Methode {} für {}.'.format(method, sensor))
+            parsed[sensor] = {
+                'method': method,
+                'deviation': options.get('deviation', 0),
+                'relative': options.get('relative', 0),
+                'heartbeat': options.get('heartbeat', DEFAULT_HEARTBEAT) * 60
+            }
+        for sensor in set(self.__settings) | set(parsed):
+            if self.__settings.get(sensor) != parsed.get(sensor):
+                self.__states.pop(sensor, None)
+        self.__settings = parsed
+
+    def filter(self, data):
+        """Liefert die Datensätze, die gespeichert werden (keinen, data oder bei swinging_door
+        zusätzlich den zurückgehaltenen vorigen Datensatz)."""
+        self.__check_config()
+        sensor = data['SENSOR']
+        records_received.inc(1, sensor)
+        options = self.__settings.get(sensor)
+        if options is None:
+            records_stored.inc(1, sensor)
+            return [data]
+        state = self.__states.get(sensor)
+        if state is None:
+            state = self.__states[sensor] = {'stored': None, 'pending': None, 'low': {}, 'high': {}}
+        if options['method'] == 'deadband':
+            result = self.__deadband(state, options, data)
+        else:
+            result = self.__swinging_door(state, options, data)
+        records_stored.inc(len(result), sensor)
+        return result
+
+    def flush(self):
+        """Liefert die zurückgehaltenen Datensätze aller Sensoren (beim Beenden)."""
+        result = []
+        for sensor, state in self.__states.items():
+            if state['pending'] is not None:
+                result.append(state['pending'])
+                records_stored.inc(1, sensor)
+                self.__store(state, state['pending'])
+        return result
+
+    def __deadband(self, state, options, data):
+        stored = state['stored']
+        if stored is None or _is_due(stored, options, data) or _has_changed(stored, data):
+            self.__store(state, data)
+            return [data]
+        for key, value in _get_values(data).items():
+            reference = _get_values(stored)[key]
+            if abs(value - reference) > _get_deviation(options, key, reference):
+                self.__store(state, data)
+                return [data]
+        return []
+
+    def __swinging_door(self, state, options, data):
+        """Die Tür ist für jeden Werttyp der Bereich der Steigungen low bis high, mit denen eine
+        Gerade vom gespeicherten Datensatz alle seither erhaltenen Werte mit der erlaubten
+        Abweichung trifft. Wird er leer, wird der vorige Datensatz gespeichert."""
+        stored = state['stored']
+        if stored is None:
+            self.__store(state, data)
+            return [data]
+        pending = state['pending']
+        last = pending if pending is not None else stored
+        if _has_changed(stored, data) or data['TIMESTAMP'] <= last['TIMESTAMP']:
+            self.__store(state, data)
+            return [pending, data] if pending is not None else [data]
+        if pending is None and _is_due(stored, options, data):
+            self.__store(state, data)
+            return [data]
+        # Beim heartbeat wird wie beim Schließen der Tür der vorige Datensatz gespeichert.
+        if _is_due(stored, options, data) or not self.__fits(state, options, stored, data):
+            self.__store(state, pending)
+            # Der neue Datensatz beginnt die Tür ab dem gerade gespeicherten.
+            self.__fits(state, options, pending, data)
+            state['pending'] = data
+            return [pending]
+        state['pending'] = data
+        return []
+
+    def __fits(self, state, options, stored, data):
+        """Verkleinert die Tür um den neuen Datensatz. Liefert False, wenn sie sich schließt."""
+        duration = data['TIMESTAMP'] - stored['TIMESTAMP']
+        fits = True
+        for key, value in _get_values(data).items():
+            reference = _get_values(stored)[key]
+            deviation = _get_deviation(options, key, reference)
+            low = max(state['low'].get(key, -float('inf')), (value - reference - deviation) / duration)
+            high = min(state['high'].get(key, float('inf')), (value - reference + deviation) / duration)
+            state['low'][key], state['high'][key] = low, high
+            fits = fits and low <= high
+        return fits
+
+    def __store(self, state, data):
+        state['stored'] = data
+        state['pending'] = None
+        state['low'] = {}
+        state['high'] = {}
+
+    def __check_config(self):
+        """Liest die Einträge compress neu, wenn sich configfile geändert hat."""
+        if self.__configfile is None or time.time() - self.__checked < self.__poll_interval:
+            return
+        self.__checked = time.time()
+        try:
+            mtime = os.stat(self.__configfile).st_mtime
+            if mtime == self.__mtime:
+                return
+            self.__mtime = mtime
+            with open(self.__configfile, 'r') as json_file:
+                jobs = json.load(json_file)
+            self.configure({job_id: elem['compress'] for job_id, elem in jobs.items() if 'compress' in elem})
+        except Exception:
+            logging.exception('Fehler beim Lesen der Verdichtung aus %s.', self.__configfile)
+
+def reconstruct(timestamps, values, grid, method = 'step', max_gap = None):
+    """Berechnet die Werte einer verdichteten Serie zu den Zeitpunkten grid.
+
+    Args:
+        timestamps (numpy.ndarray): Gespeicherte TIMESTAMPs (aufsteigend).
+        values (numpy.ndarray): Gespeicherte Werte.
+        grid (numpy.ndarray): Zeitpunkte, für die Werte berechnet werden.
+        method (str, optional): step (letzter gespeicherter Wert gilt bis zum nächsten, für
+            deadband) oder linear (Gerade zwischen den gespeicherten Werten, für swinging_door).
+            Defaults to 'step'.
+        max_gap (int, optional): Größter Abstand zwischen zwei gespeicherten Werten in Sekunden,
+            über den noch rekonstruiert wird (z. B. heartbeat). Defaults to None (unbegrenzt).
+
+    Returns:
+        numpy.ndarray: Die Werte zu grid, NaN vor dem ersten gespeicherten Wert und in Lücken.
+    """
+    timestamps = np.asarray(timestamps, dtype = np.float64)
+    values = np.asarray(values, dtype = np.float64)
+    grid = np.asarray(grid, dtype = np.float64)
+    if len(timestamps) == 0:
+        return np.full(len(grid), np.nan)
+    index = np.searchsorted(timestamps, grid, side = 'right') - 1
+    before = index < 0
+    index = np.maximum(index, 0)
+    if method == 'step':
+        result = values[index]
+        gap = grid - timestamps[index]
+    elif method == 'linear':
+        result = np.interp(grid, timestamps, values)
+        following = np.minimum(index + 1, len(timestamps) - 1)
+        # Ein gespeicherter Wert selbst gilt auch vor einer Lücke.
+        gap = np.where(grid == timestamps[index], 0, timestamps[following] - timestamps[index])
+        # Nach dem letzten gespeicherten Wert ist der Verlauf unbekannt.
+        result[grid > timestamps[-1]] = np.nan
+    else:
+        raise ValueError('Ungültige Methode {}.'.format(method))
+    result[before] = np.nan
+    if max_gap is not None:
+        result[gap > max_gap] = np.nan
+    return result
+
+def _is_due(stored, options, data):
+    """Liefert True, wenn seit dem gespeicherten Datensatz heartbeat vergangen ist."""
+    return data['TIMESTAMP'] - stored['TIMESTAMP'] >= options['heartbeat']
+
+def _has_changed(stored, data):
+    """Liefert True bei geänderten Werttypen oder geänderten Werten, die keine Zahlen sind."""
+    values, references = _get_values(data, False), _get_values(stored, False)
+    if values.keys() != references.keys():
+        return True
+    return any(not _is_number(value) or not _is_number(references[key])
+               for key, value in values.items() if value != references[key])
+
+def _get_values(data, numbers = True):
+    """Liefert VALUE als dict (VALUE für Sensoren, die nur eine Zahl liefern), ohne numbers alle Werte."""
+    values = data['VALUE'] if isinstance(data['VALUE'], dict) else {'VALUE': data['VALUE']}
+    return {key: value for key, value in values.items() if _is_number(value)} if numbers else values
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value == value
+
+def _get_deviation(options, key, reference):
+    deviation = options['deviation']
+    relative = options['relative']
+    deviation = deviation.get(key, 0) if isinstance(deviation, dict) else deviation
+    relative = relative.get(key, 0) if isinstance(relative, dict) else relative
+    return max(deviation, abs(reference) * relative)
@@ -0,0 +1,97 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+
+# Konstanten aus <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_EVENT_HEADER = struct.Struct('iIII')
+
+class ConfigWatcher:
+    """Überwacht eine Datei in einem eigenen Thread und ruft on_change auf, wenn sie geschrieben oder
+    (z. B. von einem Editor) durch eine andere Datei ersetzt wurde. Unter Linux wird inotify auf das
+    Verzeichnis verwendet, ist es nicht verfügbar, wird alle poll_interval Sekunden mit os.stat
+    geprüft. on_change läuft im Thread des Watchers und sollte nur ein Signal setzen.
+    """
+
+    def __init__(self, filename, on_change, poll_interval = 5):
+        """Konstruktor
+
+        Args:
+            filename (str): Zu überwachende Datei.
+            on_change (callable): Funktion ohne Parameter, die bei einer Änderung aufgerufen wird.
+            poll_interval (int, optional): Intervall in Sekunden für die Prüfung ohne inotify. Defaults to 5.
+        """
+        self.__filename = os.path.abspath(filename)
+        self.__on_change = on_change
+        self.__poll_interval = poll_interval
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        """Startet den Überwachungsthread."""
+        fd = _inotify_watch(os.path.dirname(self.__filename), IN_CLOSE_WRITE | IN_MOVED_TO)
+        target = self.__poll_loop if fd is None else lambda: self.__inotify_loop(fd)
+        self.__thread = threading.Thread(target = target, name = 'configwatch', daemon = True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """Beendet den Überwachungsthread (spätestens nach einer Sekunde bzw. poll_interval)."""
+        self.__stop.set()
+
+    def __inotify_loop(self, fd):
+        basename = os.fsencode(os.path.basename(self.__filename))
+        try:
+            while not self.__stop.is_set():
+                if len(select.select([fd], [], [], 1)[0]) == 0:
+                    continue
+                data = os.read(fd, 4096)
+                changed = False
+                pos = 0
+                while pos < len(data):
+                    wd, mask, cookie, length = IN_EVENT_HEADER.unpack_from(data, pos)
+                    name = data[pos + IN_EVENT_HEADER.size:pos + IN_EVENT_HEADER.size + length].rstrip(b'\0')
+                    changed = changed or name == basename
+                    pos += IN_EVENT_HEADER.size + length
+                if changed:
+                    self.__on_change()
+        except Exception:
+            logging.exception('Fehler beim Überwachen von %s, es wird auf Polling umgestellt.', self.__filename)
+            self.__poll_loop()
+        finally:
+            os.close(fd)
+
+    def __poll_loop(self):
+        last = self.__stat()
+        while not self.__stop.wait(self.__poll_interval):
+            current = self.__stat()
+            if current != last:
+                last = current
+                self.__on_change()
+
+    def __stat(self):
+        try:
+            stat = os.stat(self.__filename)
+            return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except OSError:
+            return None
+
+def _inotify_watch(directory, mask):
+    """Liefert einen inotify Filedescriptor, der das Verzeichnis überwacht, oder None, wenn inotify
+    nicht verfügbar ist."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
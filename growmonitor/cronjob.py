@@ -1,68 +1,568 @@
-import rasp as rasp
+import asyncio
+import collections
+import inspect
 import time
 import os
 import json
+import heapq
+import itertools
+import queue
+import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from croniter import croniter
+from configwatch import ConfigWatcher
+from drivers import Registry
+from history import History
+import derived
+import metrics
+
+# Höchstens so viele ausgelassene Termine werden für growmonitor_job_missed_total gezählt.
+MAX_COUNTED_MISSES = 10000
+# Sekunden, die ein abhängiger Job nach dem letzten neuen Wert seiner Eingänge wartet (siehe debounce).
+DEFAULT_DEBOUNCE = 0.5
+# Vom Cronjob ergänzte Keys eines Jobs, die nicht aus der Konfiguration stammen.
+INTERNAL_KEYS = ('instance', 'cron', 'fresh', 'last_run', 'triggered', 'running')
+
+job_duration = metrics.registry.histogram('growmonitor_job_duration_seconds', 'Laufzeit von do_work.', 'job')
+job_lag = metrics.registry.histogram('growmonitor_job_lag_seconds', 'Verzögerung zwischen Termin und Start des Jobs.', 'job')
+job_errors = metrics.registry.counter('growmonitor_job_errors_total', 'Anzahl der Jobs, die mit einem Fehler beendet wurden.', 'job')
+job_missed = metrics.registry.counter('growmonitor_job_missed_total', 'Anzahl der ausgelassenen Termine.', 'job')
 
 class Cronjob:
-    __cron_infos = []
-    __last_values = {}
+    __cron_infos = {}
+    __schedule = []
     __configfile = 'cronjobs.json'
-    __config_timestamp = 0
+    __config_changed = True
 
-    def __init__(self, configfile):
+    def __init__(self, configfile, max_catch_up = 3600, workers = 4, poll_interval = 5, drivers = None,
+                 history_size = 360, transforms = None, clock = None):
+        """Konstruktor
+
+        configfile    -- JSON Datei mit den Jobs.
+        max_catch_up  -- Wie viele Sekunden nach einem Stillstand im catch_up Modus maximal
+                         nachgeholt werden. Ältere Termine werden ausgelassen.
+        workers       -- Anzahl der Threads, in denen die Jobs parallel ausgeführt werden.
+        poll_interval -- Intervall in Sekunden für die Prüfung der Konfiguration, wenn inotify
+                         nicht verfügbar ist.
+        drivers       -- Modul oder drivers.Registry mit den Klassen, die in class angegeben werden.
+                         Ohne Angabe werden die Treiber aus rasp erst bei Bedarf geladen (siehe
+                         drivers.py), sim liefert simulierte Treiber ohne Hardware.
+        history_size  -- Anzahl der Werte pro Sensor und Werttyp im Verlauf (siehe history.py), der
+                         den Jobs über current_values.history zur Verfügung steht.
+        transforms    -- Funktionen, die jeden Datensatz im Workerthread ergänzen, bevor er in den
+                         Verlauf und an on_job_ready geht. Ohne Angabe derived.add_derived (DEWP,
+                         VPD und AHUM aus TEMP und HUM).
+        clock         -- Zeitquelle mit time() für die Termine und TIMESTAMPs. Ohne Angabe das Modul
+                         time, replay.py übergibt eine virtuelle Uhr (siehe run_until).
+        """
         self.__configfile = configfile
+        self.__max_catch_up = max_catch_up
+        self.__workers = workers
+        self.__poll_interval = poll_interval
+        self.__cron_infos = {}
+        self.__inputs = {}
+        self.__dependents = {}
+        self.__ranks = {}
+        self.__clock = clock if clock is not None else time
+        self.__history = History(history_size, self.__clock)
+        self.__schedule = []
+        self.__results = queue.Queue()
+        self.__sequence = itertools.count()
+        self.__resource_locks = {}
+        self.__resource_locks_lock = threading.Lock()
+        self.__drivers = drivers if drivers is not None else Registry()
+        self.__transforms = transforms if transforms is not None else [derived.add_derived]
+        self.__stopped = threading.Event()
+        # Weckt die Schleife auf (bei einer Änderung der Konfiguration oder durch stop).
+        self.__notify = lambda: self.__results.put(None)
+
+    def start_working(self, disable_cron = False, on_job_ready = lambda val: None, on_all_jobs_ready = lambda: None,
+                      catch_up = False):
+        """Führt die Jobs zu den in run_at angegebenen Zeiten aus. Die nächsten Ausführungszeiten
+        liegen in einem Heap, sodass nur bis zum frühesten Termin geschlafen wird. Der nächste Termin
+        eines Jobs wird erst nach seiner Ausführung berechnet.
 
-    def start_working(self, disable_cron = False, on_job_ready = lambda val: None, on_all_jobs_ready = lambda: None):
-        while True:
-            self.__read_config()
-            current_time = int(time.time())
-            for id, job in self.__cron_infos.items():
-                iter = croniter(job['run_at'], current_time)
-                next_run = int(iter.get_next()) if disable_cron == False else current_time + 1
-                if 'next_run' not in job:
-                    job['next_run'] = next_run
-                if job['next_run'] <= current_time:
+        Die Jobs laufen parallel in einem Threadpool. Jobs, die denselben I²C Bus (Parameter bus)
+        oder dieselben GPIO Pins (Parameter pin) verwenden, werden nacheinander ausgeführt. Ohne
+        Angabe in params gelten die Standardwerte aus dem Klassenattribut resources des Treibers.
+        on_job_ready und on_all_jobs_ready werden immer im aufrufenden Thread ausgeführt.
+
+        Jobs können die Werte anderer Jobs lesen (Eingänge). Die Eingänge stehen in inputs (Liste der
+        IDs) in der Konfiguration oder werden über das Klassenattribut inputs aus params gelesen
+        (z. B. boxsensor, roomsensor und lightstate bei Fan). Haben alle Eingänge seit dem letzten Lauf
+        einen neuen Wert geliefert, wird der Job sofort ausgeführt, nicht erst zum nächsten Termin
+        in run_at:
+            debounce      -- Sekunden, die nach dem letzten neuen Wert gewartet wird. Standardwert
+                             siehe DEFAULT_DEBOUNCE.
+            min_interval  -- Minimaler Abstand zweier Läufe in Sekunden (mindestens 1). Standardwert
+                             ist 0.
+        Sind mehrere Jobs gleichzeitig fällig, werden sie in topologischer Reihenfolge gestartet.
+        Zyklische Abhängigkeiten oder unbekannte Eingänge werden beim Lesen der Konfiguration
+        abgelehnt. Solange ein Eingang noch keinen Wert hat, wird der Job auch zu den Terminen in
+        run_at nicht ausgeführt.
+
+        disable_cron      -- Führt jeden Job jede Sekunde aus (zum Testen).
+        on_job_ready      -- Wird mit dem Datensatz eines Jobs aufgerufen, der einen Wert geliefert hat.
+        on_all_jobs_ready -- Wird aufgerufen, nachdem mindestens ein Job ausgeführt wurde.
+        catch_up          -- Werden Termine verpasst (z. B. weil das System hängt), werden sie mit
+                             ihrem ursprünglichen TIMESTAMP nachgeholt statt ausgelassen.
+        """
+        # Änderungen der Konfiguration werden über die Ergebnisqueue gemeldet, damit die
+        # Schleife sofort aufwacht.
+        watcher = ConfigWatcher(self.__configfile, lambda: self.__notify(), self.__poll_interval).start()
+        try:
+            with ThreadPoolExecutor(max_workers = self.__workers, thread_name_prefix = 'cronjob') as executor:
+                self.__work(executor, disable_cron, on_job_ready, on_all_jobs_ready, catch_up)
+        finally:
+            watcher.stop()
+
+    async def start_working_async(self, disable_cron = False, on_job_ready = lambda val: None,
+                                  on_all_jobs_ready = lambda: None, catch_up = False):
+        """Wie start_working, läuft aber als Coroutine in der Eventloop des Aufrufers. Besitzt ein
+        Treiber eine Methode async def do_work, wird sie direkt in der Eventloop ausgeführt, alle
+        anderen Treiber laufen im Threadpool. Jobs auf demselben I²C Bus oder denselben GPIO Pins
+        werden auch hier nacheinander ausgeführt. on_job_ready und on_all_jobs_ready dürfen
+        Coroutinen sein, sie werden dann abgewartet (z. B. für eine begrenzte asyncio.Queue).
+        """
+        loop = asyncio.get_running_loop()
+        results = asyncio.Queue()
+        self.__notify = lambda: loop.call_soon_threadsafe(results.put_nowait, None)
+        watcher = ConfigWatcher(self.__configfile, lambda: self.__notify(), self.__poll_interval).start()
+        resource_locks = {}
+        tasks = set()
+        try:
+            with ThreadPoolExecutor(max_workers = self.__workers, thread_name_prefix = 'cronjob') as executor:
+                while not self.__stopped.is_set():
+                    if self.__config_changed:
+                        self.__config_changed = False
+                        self.__read_config(disable_cron)
+                    for next_run, id, job, reactive in self.__get_due_jobs(disable_cron, catch_up):
+                        task = asyncio.create_task(self.__run_job_async(
+                            executor, resource_locks, results, id, job, next_run, reactive,
+                            self.__history.current_values()))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+
+                    wait = self.__schedule[0][0] - self.__clock.time() if len(self.__schedule) > 0 else None
+                    received = []
                     try:
-                        with job['instance'] as instance:
-                            value = instance.do_work(self.__last_values)
-                        if (value is not None):
-                            data = {
-                                'TIMESTAMP': job['next_run'],
-                                'OFFSET': round(time.time()-job['next_run'], 1),
-                                'SENSOR': id,
-                                'VALUE': value
-                            }
-                            self.__last_values[id] = data
-                            on_job_ready(data)
-                    except Exception:
-                        logging.exception('Fehler beim Durchführen des Jobs %s', id)
-                    job['next_run'] = next_run
-            on_all_jobs_ready()                        
-            time.sleep(1)          
-
-    def __read_config(self):
-        def prepare_element(elem):
+                        if wait is None or wait > 0:
+                            received.append(await asyncio.wait_for(results.get(), timeout = wait))
+                        while True:
+                            received.append(results.get_nowait())
+                    except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                        pass
+
+                    jobs_done = False
+                    for result in received:
+                        if self.__handle_result(result, disable_cron, catch_up):
+                            jobs_done = True
+                            if result[2] is not None:
+                                await _maybe_await(on_job_ready(result[2]))
+                    if jobs_done:
+                        await _maybe_await(on_all_jobs_ready())
+                if len(tasks) > 0:
+                    await asyncio.gather(*tasks, return_exceptions = True)
+        finally:
+            watcher.stop()
+            self.__notify = lambda: self.__results.put(None)
+
+    def run_until(self, end, on_job_ready = lambda val: None, catch_up = False):
+        """Führt die Jobs ohne Threads und ohne zu warten bis zum Zeitpunkt end aus (für replay.py).
+        Die Uhr (Parameter clock) muss dazu set(timestamp) besitzen: Sie wird vor jedem Termin auf
+        diesen gestellt. Termine, Eingänge, debounce und catch_up werden wie in start_working
+        behandelt, die Jobs laufen nacheinander im aufrufenden Thread. Die Konfiguration wird beim
+        ersten Aufruf gelesen, die Termine beginnen nach der aktuellen Zeit der Uhr.
+
+        Returns:
+            int: Anzahl der ausgeführten Jobs.
+        """
+        if self.__config_changed:
+            self.__config_changed = False
+            self.__read_config(False)
+        count = 0
+        while len(self.__schedule) > 0 and self.__schedule[0][0] <= end and not self.__stopped.is_set():
+            self.__clock.set(max(self.__clock.time(), self.__schedule[0][0]))
+            for next_run, id, job, reactive in self.__get_due_jobs(False, catch_up):
+                self.__run_job(id, job, next_run, reactive, self.__history.current_values())
+                count += 1
+            try:
+                while True:
+                    result = self.__results.get_nowait()
+                    if self.__handle_result(result, False, catch_up) and result[2] is not None:
+                        on_job_ready(result[2])
+            except queue.Empty:
+                pass
+        self.__clock.set(max(self.__clock.time(), end))
+        return count
+
+    def stop(self):
+        """Beendet start_working bzw. start_working_async, nachdem die laufenden Jobs fertig sind.
+        Kann aus einem anderen Thread aufgerufen werden."""
+        self.__stopped.set()
+        self.__notify()
+
+    def __work(self, executor, disable_cron, on_job_ready, on_all_jobs_ready, catch_up):
+        while not self.__stopped.is_set():
+            if self.__config_changed:
+                self.__config_changed = False
+                self.__read_config(disable_cron)
+            for next_run, id, job, reactive in self.__get_due_jobs(disable_cron, catch_up):
+                executor.submit(self.__run_job, id, job, next_run, reactive, self.__history.current_values())
+
+            # Bis zum nächsten Termin auf fertige Jobs oder eine Änderung der Konfiguration warten.
+            wait = self.__schedule[0][0] - self.__clock.time() if len(self.__schedule) > 0 else None
+            results = []
+            try:
+                if wait is None or wait > 0:
+                    results.append(self.__results.get(timeout = wait))
+                while True:
+                    results.append(self.__results.get_nowait())
+            except queue.Empty:
+                pass
+
+            jobs_done = False
+            for result in results:
+                if self.__handle_result(result, disable_cron, catch_up):
+                    jobs_done = True
+                    if result[2] is not None:
+                        on_job_ready(result[2])
+            if jobs_done:
+                on_all_jobs_ready()
+
+    def __get_due_jobs(self, disable_cron, catch_up):
+        """Entnimmt die fälligen Termine aus dem Heap. Ein Termin aus run_at wird ausgelassen (und
+        der nächste eingeplant), wenn der Job noch läuft, in derselben Sekunde schon gelaufen ist oder
+        ein Eingang noch keinen Wert hat.
+
+        Returns:
+            list: Tupel (next_run, id, job, reactive) in topologischer Reihenfolge. Jeder Job bekommt
+                  später den Stand der aktuellen Werte beim Start (History.current_values), der sich
+                  während der Ausführung nicht ändert.
+        """
+        due = []
+        current_time = self.__clock.time()
+        current_values = self.__history.current_values()
+        while len(self.__schedule) > 0 and self.__schedule[0][0] <= current_time:
+            next_run, _, id, job, reactive = heapq.heappop(self.__schedule)
+            # Einträge von geänderten oder gelöschten Jobs werden verworfen.
+            if self.__cron_infos.get(id) is not job:
+                continue
+            inputs = self.__inputs.get(id, ())
+            if reactive:
+                job['triggered'] = False
+                # Läuft der Job noch, plant __handle_result nach dem Lauf neu ein.
+                if job.get('running') or not set(inputs) <= job.get('fresh', set()):
+                    continue
+            elif job.get('running') or int(next_run) <= job.get('last_run', -1) or \
+                 any(name not in current_values for name in inputs):
+                self.__push(self.__get_next_run(id, job, disable_cron, catch_up), id, job)
+                continue
+            job['running'] = True
+            job['fresh'] = set()
+            job['last_run'] = int(next_run)
+            due.append((next_run, id, job, reactive))
+        due.sort(key = lambda val: (val[0], self.__ranks.get(val[1], 0)))
+        return due
+
+    def __handle_result(self, result, disable_cron, catch_up):
+        """Übernimmt das Ergebnis eines Jobs in die aktuellen Werte und plant den nächsten Termin ein.
+        None bedeutet, dass sich die Konfiguration geändert hat.
+
+        Returns:
+            bool: True, wenn das Ergebnis von einem Job stammt.
+        """
+        if result is None:
+            self.__config_changed = True
+            return False
+        id, job, data, reactive = result
+        job['running'] = False
+        if data is not None:
+            self.__history.add(data)
+        # Wurde der Job durch das Neueinlesen der Konfiguration ersetzt, wird er nicht
+        # mehr eingeplant.
+        if self.__cron_infos.get(id) is job:
+            if not reactive:
+                self.__push(self.__get_next_run(id, job, disable_cron, catch_up), id, job)
+            # Eingänge, die während des Laufes neue Werte geliefert haben.
+            self.__trigger(id, job)
+        if data is not None:
+            for dependent in self.__dependents.get(id, ()):
+                dependent_job = self.__cron_infos.get(dependent)
+                if dependent_job is not None:
+                    dependent_job.setdefault('fresh', set()).add(id)
+                    self.__trigger(dependent, dependent_job)
+        return True
+
+    def __trigger(self, id, job):
+        """Plant einen Lauf außerhalb von run_at ein, wenn alle Eingänge des Jobs seit seinem letzten
+        Lauf einen neuen Wert geliefert haben. Weitere Werte bis zum Start lösen keinen zusätzlichen
+        Lauf aus, der Job liest beim Start die dann aktuellen Werte."""
+        inputs = self.__inputs.get(id, ())
+        if len(inputs) == 0 or job.get('triggered') or job.get('running') or not set(inputs) <= job.get('fresh', set()):
+            return
+        job['triggered'] = True
+        # Der TIMESTAMP des Datensatzes ist die ganze Sekunde, daher mindestens eine Sekunde Abstand.
+        next_run = max(self.__clock.time() + job.get('debounce', DEFAULT_DEBOUNCE),
+                       job.get('last_run', 0) + max(job.get('min_interval', 0), 1))
+        self.__push(next_run, id, job, True)
+
+    def __run_job(self, id, job, next_run, reactive, current_values):
+        """Führt den Job in einem Workerthread aus und stellt das Ergebnis in die Ergebnisqueue. Der
+        gelieferte Wert wird mit dem geplanten Zeitpunkt als TIMESTAMP gemeldet."""
+        data = None
+        try:
+            with self.__resource_locks_lock:
+                locks = [self.__resource_locks.setdefault(resource, threading.Lock())
+                         for resource in _get_resources(job)]
+            for lock in locks:
+                lock.acquire()
+            try:
+                started = time.time()
+                job_lag.observe(max(0, self.__clock.time() - next_run), id)
+                value = _call_do_work(job['instance'], current_values)
+            finally:
+                job_duration.observe(time.time() - started, id)
+                for lock in reversed(locks):
+                    lock.release()
+            data = self.__transform(_get_record(id, next_run, value, self.__clock.time()))
+        except Exception:
+            job_errors.inc(label = id)
+            logging.exception('Fehler beim Durchführen des Jobs %s', id)
+        self.__results.put((id, job, data, reactive))
+
+    async def __run_job_async(self, executor, resource_locks, results, id, job, next_run, reactive, current_values):
+        """Führt den Job in der Eventloop (async do_work) oder im Threadpool aus und stellt das
+        Ergebnis in die Ergebnisqueue von start_working_async."""
+        data = None
+        try:
+            locks = [resource_locks.setdefault(resource, asyncio.Lock()) for resource in _get_resources(job)]
+            for lock in locks:
+                await lock.acquire()
+            try:
+                started = time.time()
+                job_lag.observe(max(0, self.__clock.time() - next_run), id)
+                instance = job['instance']
+                if inspect.iscoroutinefunction(getattr(instance, 'do_work', None)):
+                    with instance as entered:
+                        value = await entered.do_work(current_values)
+                else:
+                    value = await asyncio.get_running_loop().run_in_executor(
+                        executor, _call_do_work, instance, current_values)
+            finally:
+                job_duration.observe(time.time() - started, id)
+                for lock in reversed(locks):
+                    lock.release()
+            data = self.__transform(_get_record(id, next_run, value, self.__clock.time()))
+        except Exception:
+            job_errors.inc(label = id)
+            logging.exception('Fehler beim Durchführen des Jobs %s', id)
+        results.put_nowait((id, job, data, reactive))
+
+    def __transform(self, data):
+        """Wendet die transforms auf den Datensatz an. Ein Fehler wird protokolliert, der
+        Datensatz bleibt dann unverändert."""
+        if data is None:
+            return None
+        for transform in self.__transforms:
+            try:
+                data = transform(data)
+            except Exception:
+                logging.exception('Fehler beim Ergänzen des Datensatzes %s', data)
+        return data
+
+    def __plan(self, id, job, disable_cron):
+        """Plant einen neuen oder geänderten Job ein. Es werden nur Termine in der Zukunft eingeplant."""
+        current_time = int(self.__clock.time())
+        job['cron'] = croniter(job['run_at'], current_time)
+        next_run = current_time + 1 if disable_cron else int(job['cron'].get_next())
+        self.__push(next_run, id, job)
+
+    def __push(self, next_run, id, job, reactive = False):
+        # Die laufende Nummer sorgt dafür, dass bei gleichem Termin nie die Jobs verglichen werden.
+        # reactive kennzeichnet Läufe, die von den Eingängen ausgelöst wurden (siehe __trigger).
+        heapq.heappush(self.__schedule, (next_run, next(self.__sequence), id, job, reactive))
+
+    def __get_next_run(self, id, job, disable_cron, catch_up):
+        """Berechnet den nächsten Termin nach dem gerade ausgeführten. Liegt er in der Vergangenheit,
+        wird er im catch_up Modus (bis max_catch_up Sekunden) beibehalten, sonst werden die verpassten
+        Termine übersprungen."""
+        current_time = int(self.__clock.time())
+        if disable_cron:
+            return current_time + 1
+        next_run = int(job['cron'].get_next())
+        if next_run > current_time or catch_up and current_time - next_run <= self.__max_catch_up:
+            return next_run
+        restart_at = current_time - self.__max_catch_up if catch_up else current_time
+        job['cron'] = croniter(job['run_at'], restart_at)
+        skipped_until = int(job['cron'].get_next())
+        job_missed.inc(_count_runs(job['run_at'], next_run, skipped_until), id)
+        logging.warning('Job %s: Termine von %d bis %d ausgelassen.', id, next_run, skipped_until)
+        return skipped_until
+
+    def __read_config(self, disable_cron):
+        """Liest die Konfiguration und übernimmt nur die Änderungen: Unveränderte Jobs behalten ihre
+        Instanz (und damit den Zustand der Hardware) sowie ihren Termin. Ändert sich nur run_at
+        (oder ein anderer Eintrag außer class und params), bleibt die Instanz erhalten und der Job
+        wird neu eingeplant. Neue oder geänderte Jobs werden erzeugt, gelöschte Jobs entfernt. Die
+        neue Konfiguration wird zuerst vollständig geprüft und erzeugt; schlägt dabei etwas fehl,
+        bleibt die bisherige Konfiguration aktiv.
+
+        Returns:
+            bool: True, wenn die Konfiguration übernommen wurde.
+        """
+        def validate_element(id, elem):
             for required in ['run_at', 'class']:
                 if required not in elem.keys():
-                    raise Exception('Key {} nicht gefunden.'.format(required))
+                    raise Exception('Key {} in {} nicht gefunden.'.format(required, id))
             if not croniter.is_valid(elem['run_at']):
                 raise Exception('Ungültiger Cron eintrag: {}'.format(elem['run_at']))
-            elem['instance'] = getattr(rasp, elem['class'])(elem.get('params', {}))
-            return elem
+            if not hasattr(self.__drivers, elem['class']):
+                raise Exception('Klasse {} nicht gefunden.'.format(elem['class']))
 
+        created = []
         try:
-            config_timestamp = os.path.getmtime(self.__configfile)
-            if self.__config_timestamp < config_timestamp:
-                with open(self.__configfile, "r") as json_file:
-                    actors = json.load(json_file)
-                cron_infos = dict(zip(actors, map(prepare_element, actors.values())))
-                self.__cron_infos = cron_infos
-                self.__config_timestamp = config_timestamp
-                logging.info("Konfiguration neu gelesen.")
+            with open(self.__configfile, "r") as json_file:
+                actors = json.load(json_file)
+            for job_id, elem in actors.items():
+                validate_element(job_id, elem)
+
+            cron_infos = {}
+            replanned = []
+            for job_id, elem in actors.items():
+                old = self.__cron_infos.get(job_id)
+                if old is not None and old['class'] == elem['class'] and old.get('params', {}) == elem.get('params', {}):
+                    if _get_config(old) == elem:
+                        cron_infos[job_id] = old
+                        continue
+                    job = dict(elem)
+                    job['instance'] = old['instance']
+                else:
+                    job = dict(elem)
+                    job['instance'] = getattr(self.__drivers, elem['class'])(elem.get('params', {}))
+                    created.append(job['instance'])
+                cron_infos[job_id] = job
+                replanned.append(job_id)
+            inputs = {job_id: _get_inputs(job) for job_id, job in cron_infos.items()}
+            ranks = _sort_jobs(inputs)
         except Exception:
             logging.exception('Fehler beim Lesen der Konfiguration aus %s.', self.__configfile)
+            for instance in created:
+                _close_instance(instance)
+            return False
+
+        old_cron_infos, self.__cron_infos = self.__cron_infos, cron_infos
+        self.__inputs, self.__dependents, self.__ranks = inputs, _get_dependents(inputs), ranks
+        # Nicht mehr verwendete Instanzen mit Hintergrundthreads (z. B. Adc im Dauerbetrieb) beenden.
+        used = set(id(job['instance']) for job in cron_infos.values())
+        for job in old_cron_infos.values():
+            if id(job['instance']) not in used:
+                _close_instance(job['instance'])
+        for job_id in replanned:
+            self.__plan(job_id, cron_infos[job_id], disable_cron)
+        logging.info("Konfiguration neu gelesen, %d Jobs geändert, %d Jobs entfernt.", len(replanned),
+                     len(set(old_cron_infos) - set(cron_infos)))
+        return True
 
     def __str__(self):
-        return json.dumps(self.__cron_infos, indent = 2, default = lambda val: '<internal>')            
\ No newline at end of file
+        return json.dumps(self.__cron_infos, indent = 2, default = lambda val: '<internal>')
+
+def _get_resources(job):
+    """Liefert die Namen der Ressourcen (I²C Bus und GPIO Pins), die der Job verwendet: die Angaben
+    in params und, wenn dort nicht angegeben, die Standardwerte aus dem Klassenattribut resources
+    des Treibers (z. B. bus 1 bei Bme280). Die Namen werden sortiert geliefert, damit die Locks
+    immer in derselben Reihenfolge gesperrt werden."""
+    params = dict(getattr(type(job.get('instance')), 'resources', {}), **job.get('params', {}))
+    resources = set()
+    if 'bus' in params:
+        resources.add('i2c-{}'.format(params['bus']))
+    if 'pin' in params:
+        pins = params['pin'] if isinstance(params['pin'], list) else [params['pin']]
+        resources.update('gpio-{}'.format(pin) for pin in pins)
+    return sorted(resources)
+
+def _call_do_work(instance, current_values):
+    with instance as entered:
+        return entered.do_work(current_values)
+
+def _get_record(id, next_run, value, now):
+    """Liefert den Datensatz für den Wert eines Jobs oder None, wenn der Job keinen Wert geliefert hat."""
+    if value is None:
+        return None
+    # Von den Eingängen ausgelöste Läufe beginnen nicht zur vollen Sekunde.
+    timestamp = int(next_run)
+    return {
+        'TIMESTAMP': timestamp,
+        'OFFSET': round(now-timestamp, 1),
+        'SENSOR': id,
+        'VALUE': value
+    }
+
+async def _maybe_await(result):
+    if inspect.isawaitable(result):
+        await result
+
+def _get_config(job):
+    """Liefert den Eintrag aus der Konfiguration ohne die intern ergänzten Keys."""
+    return {key: value for key, value in job.items() if key not in INTERNAL_KEYS}
+
+def _get_inputs(job):
+    """Liefert die IDs der Jobs, deren Werte der Job liest: inputs aus der Konfiguration oder die
+    params, die im Klassenattribut inputs des Treibers genannt sind."""
+    if 'inputs' in job:
+        return tuple(job['inputs'])
+    params = job.get('params', {})
+    return tuple(params[name] for name in getattr(type(job['instance']), 'inputs', ()) if name in params)
+
+def _get_dependents(inputs):
+    """Liefert zu jedem Job die IDs der Jobs, die ihn als Eingang lesen."""
+    dependents = {}
+    for job_id in sorted(inputs):
+        for name in set(inputs[job_id]):
+            dependents.setdefault(name, []).append(job_id)
+    return dependents
+
+def _sort_jobs(inputs):
+    """Sortiert die Jobs topologisch (Jobs vor den Jobs, die sie als Eingang lesen).
+
+    Returns:
+        dict: Job ID -> Position in der Reihenfolge.
+
+    Raises:
+        Exception: Bei einem unbekannten Eingang oder einer zyklischen Abhängigkeit.
+    """
+    for job_id, names in inputs.items():
+        for name in names:
+            if name not in inputs:
+                raise Exception('Job {} liest den unbekannten Job {}.'.format(job_id, name))
+    dependents = _get_dependents(inputs)
+    missing = {job_id: len(set(names)) for job_id, names in inputs.items()}
+    ready = collections.deque(sorted(job_id for job_id, count in missing.items() if count == 0))
+    ranks = {}
+    while len(ready) > 0:
+        job_id = ready.popleft()
+        ranks[job_id] = len(ranks)
+        for dependent in dependents.get(job_id, ()):
+            missing[dependent] -= 1
+            if missing[dependent] == 0:
+                ready.append(dependent)
+    if len(ranks) < len(inputs):
+        raise Exception('Zyklische Abhängigkeit zwischen den Jobs {}.'.format(', '.join(sorted(set(inputs) - set(ranks)))))
+    return ranks
+
+def _close_instance(instance):
+    """Ruft close() der Instanz auf, wenn sie diese Methode besitzt."""
+    if hasattr(instance, 'close'):
+        try:
+            instance.close()
+        except Exception:
+            logging.exception('Fehler beim Schließen von %s.', type(instance).__name__)
+
+def _count_runs(run_at, start, end):
+    """Zählt die Termine von start (inklusive) bis end (exklusive), höchstens MAX_COUNTED_MISSES."""
+    cron = croniter(run_at, start - 1)
+    for count in range(MAX_COUNTED_MISSES):
+        if cron.get_next() >= end:
+            return count
+    return MAX_COUNTED_MISSES
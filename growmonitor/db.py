@@ -1,24 +1,65 @@
 import logging
 import threading
 import sqlite3
-import pymssql                     # pacman -S freetds && pip install cython &&  pip install pymssql 
 import os
+import time
+import metrics
+import narrow
+import partition
+import rollup
+
+# Maximale Länge der Warteschlange, ältere Datensätze werden verworfen.
+MAX_QUEUE_LENGTH = 10000
+# Maximale Länge einer Kopfzeile der Textdateien in Bytes (siehe _read_last_header)
+MAX_HEADER_LENGTH = 4096
+
+queue_length = metrics.registry.gauge('growmonitor_db_queue_length', 'Anzahl der Datensätze in der Warteschlange.')
+dropped = metrics.registry.counter('growmonitor_db_dropped_total', 'Anzahl der verworfenen Datensätze bei vollem Puffer.')
+rows_written = metrics.registry.counter('growmonitor_db_rows_written_total', 'Anzahl der geschriebenen Datensätze.')
+flush_duration = metrics.registry.histogram('growmonitor_db_flush_duration_seconds', 'Dauer eines Schreibvorgangs der Warteschlange.')
+flush_rows = metrics.registry.histogram('growmonitor_db_flush_rows', 'Anzahl der Datensätze pro Schreibvorgang.',
+                                        buckets = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000))
 
 # "h2815404.stratoserver.net", "SensorDb", "h5dv4e3RzLDQ", "SensorDb"
 class Database:
-    __db_queue = []
-    __db_queue_lock = threading.Lock()
-    __write_thread = threading.Thread()
     __table_prefix = 'data'
+    __persistent = False
+    __rollups = False
+    __narrow = False
+    __ids = None
+    __setup_stmts = []
+    __conn = None
+    __tables = None
+    __columns = {}
+    __insert_stmts = {}
+    __partition_dir = None
+    __partitions = None
+    __close_after = partition.CLOSE_AFTER
+
+    def __init__(self):
+        # Die Warteschlange gehört zum Objekt, damit sich mehrere Datenbanken (z. B. in den
+        # Werkzeugen zum Nachladen) nicht gegenseitig Datensätze unterschieben.
+        self.__db_queue = []
+        self.__db_queue_lock = threading.Lock()
+        self.__write_thread = threading.Thread()
 
     @staticmethod
-    def sqlite(filename, table_prefix = "data"):
+    def sqlite(filename, table_prefix = "data", persistent = False, rollups = False, layout = 'wide'):
         """Erstellt ein Database Objekt für den Zugriff auf eine SQLite Datenbank.
         
-        filename -- Dateiname der zu verwendenden Datenbank. Wird erstellt, wenn nicht vorhanden.
+        filename   -- Dateiname der zu verwendenden Datenbank. Wird erstellt, wenn nicht vorhanden.
+        persistent -- Verwendet eine dauerhaft offene Verbindung im WAL Modus und schreibt die
+                      Warteschlange pro Tabelle mit executemany in einer einzigen Transaktion.
+        rollups    -- Aktualisiert beim Schreiben die verdichteten Tabellen rollup_60, rollup_600
+                      und rollup_3600 (siehe rollup.py).
+        layout     -- wide: Eine Tabelle pro Sensor (table_prefix_sensorname) mit einer Spalte pro
+                      Wert. narrow: Eine Zeile pro Wert in der Tabelle measurement (siehe narrow.py),
+                      table_prefix wird dann nicht verwendet.
         """
+        if layout not in ('wide', 'narrow'):
+            raise Exception('Ungültiger Wert für layout: {}'.format(layout))
         db = Database()
-        db.__connect_func = lambda: sqlite3.connect(filename)
+        db.__connect_func = lambda: sqlite3.connect(filename, check_same_thread = False)
         db.__get_tables_stmt = "SELECT name FROM sqlite_master WHERE type = 'table';"
         db.__generate_create_func = lambda tablename, record: \
             'CREATE TABLE {} (TIMESTAMP INTEGER, OFFSET REAL, SENSOR TEXT, {}, PRIMARY KEY (TIMESTAMP))' \
@@ -26,18 +67,54 @@ class Database:
         db.__generate_insert_func = lambda tablename, record: \
             'INSERT INTO {} (TIMESTAMP, OFFSET, SENSOR, {}) VALUES (?, ?, ?, {})' \
                 .format(tablename, ', '.join(record['VALUE'].keys()), ', '.join(['?'] * len(record['VALUE'])))
+        db.__get_columns_stmt = lambda tablename: ('PRAGMA table_info({})'.format(tablename), 1)
+        db.__generate_add_column_func = lambda tablename, column: 'ALTER TABLE {} ADD COLUMN {} REAL'.format(tablename, column)
+        # Auf der SD Karte soll nicht nach jeder Zeile ein fsync erfolgen. Im WAL Modus mit
+        # synchronous = NORMAL wird nur beim Checkpoint synchronisiert.
+        db.__setup_stmts = [
+            'PRAGMA journal_mode = WAL',
+            'PRAGMA synchronous = NORMAL',
+            'PRAGMA cache_size = -4096',
+            'PRAGMA temp_store = MEMORY'
+        ]
+        db.__table_prefix = table_prefix
+        db.__persistent = persistent
+        db.__rollups = rollups
+        db.__narrow = layout == 'narrow'
+        return db
+
+    @staticmethod
+    def partitioned(directory, table_prefix = "data", rollups = False, close_after = partition.CLOSE_AFTER):
+        """Erstellt ein Database Objekt, das jeden Datensatz nach seinem TIMESTAMP in eine SQLite
+        Datenbank pro Monat schreibt (siehe partition.py). Jede Partition wird wie mit sqlite und
+        persistent = True geschrieben, nur das Layout wide wird unterstützt.
+
+        directory   -- Verzeichnis der Partitionen. Wird erstellt, wenn nicht vorhanden.
+        rollups     -- Aktualisiert die Rollup Tabellen in der jeweiligen Partition.
+        close_after -- Sekunden nach dem Monatsende, nach denen die Partition geschlossen,
+                       optimiert und schreibgeschützt wird.
+        """
+        os.makedirs(directory, exist_ok = True)
+        db = Database()
+        db.__partition_dir = directory
+        db.__partitions = {}
         db.__table_prefix = table_prefix
+        db.__rollups = rollups
+        db.__close_after = close_after
         return db
 
     @staticmethod
-    def mssql(host, user, passwd, dbname, table_prefix = "data"):
+    def mssql(host, user, passwd, dbname, table_prefix = "data", persistent = False):
         """Erstellt ein Database Objekt für den Zugriff auf eine SQL Server Datenbank.
         
-        host    --  Hostname oder IP Adresse des Datenbankservers
-        user    --  Benutzername am SQL Server
-        passwd  --  Passwort
-        db      --  Name der zu verwendenden Datenbank
+        host       --  Hostname oder IP Adresse des Datenbankservers
+        user       --  Benutzername am SQL Server
+        passwd     --  Passwort
+        db         --  Name der zu verwendenden Datenbank
+        persistent --  Verwendet eine dauerhaft offene Verbindung und schreibt die Warteschlange
+                       pro Tabelle mit executemany in einer einzigen Transaktion.
         """        
+        import pymssql                     # pacman -S freetds && pip install cython &&  pip install pymssql 
         db = Database()
         db.__connect_func =  lambda: pymssql.connect(host, user, passwd, dbname)
         db.__get_tables_stmt = "SELECT name FROM sys.objects WHERE TYPE = 'U'"
@@ -45,66 +122,289 @@ class Database:
             'CREATE TABLE {} (TIMESTAMP BIGINT, OFFSET REAL, SENSOR CHAR(16), {}, PRIMARY KEY (TIMESTAMP))' \
                 .format(tablename, ', '.join([str(k) + ' FLOAT' for k in record['VALUE'].keys()]))
         db.__generate_insert_func = lambda tablename, record: \
-            'INSERT INTO {} (TIMESTAMP, OFFSET, SENSOR, {}) VALUES (%d, %d, %s, {})' \
-                .format(tablename, ', '.join(record['VALUE'].keys()), ', '.join(['%d'] * len(record['VALUE'])))
+            'INSERT INTO {} (TIMESTAMP, OFFSET, SENSOR, {}) VALUES (%s, %s, %s, {})' \
+                .format(tablename, ', '.join(record['VALUE'].keys()), ', '.join(['%s'] * len(record['VALUE'])))
+        db.__get_columns_stmt = lambda tablename: \
+            ("SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = '{}'".format(tablename), 0)
+        db.__generate_add_column_func = lambda tablename, column: 'ALTER TABLE {} ADD {} FLOAT'.format(tablename, column)
         db.__table_prefix = table_prefix
+        db.__persistent = persistent
         return db
 
     def enqueue(self, record):
         """Stellt einen Datensatz zum Schreiben in die Datenbank in die Warteschlange."""
         with self.__db_queue_lock:
             self.__db_queue.append(_prepare_record(record, self.__table_prefix))
+            queue_length.set(len(self.__db_queue))
+
+    def flush(self):
+        """Wartet auf einen laufenden Schreibthread und schreibt die Warteschlange dann im
+        aufrufenden Thread (z. B. vor dem Beenden)."""
+        if self.__write_thread.is_alive():
+            self.__write_thread.join()
+        self.__get_writer()()
 
     def write_queue(self):
-        def write_thread_func():
-            """Schreibt die Warteschlange in die Datenbank und leert die Warteschlange."""
-            with self.__db_queue_lock:
-                to_write = self.__db_queue
-                self.__db_queue = []
-            if len(to_write) == 0:
-                return
-            failed = []                
+        """Schreibt die Warteschlange in einem eigenen Thread in die Datenbank. Läuft der Thread
+        noch vom letzten Aufruf, wird nichts gemacht."""
+        if not self.__write_thread.is_alive():
+            self.__write_thread = threading.Thread(target = self.__get_writer())
+            self.__write_thread.start()
+
+    def __get_writer(self):
+        if self.__partitions is not None:
+            return self.__write_partitions
+        return self.__write_batch if self.__persistent else self.__write_single
+
+    def __take_queue(self):
+        """Liefert die Warteschlange und leert sie."""
+        with self.__db_queue_lock:
+            to_write = self.__db_queue
+            self.__db_queue = []
+            queue_length.set(0)
+        return to_write
+
+    def __requeue(self, failed):
+        """Stellt nicht geschriebene Datensätze wieder an den Anfang der Warteschlange."""
+        # Maximal die neuesten 10 000 in der Queue lassen, damit sie bei länger 
+        # ausgefallener DB nicht überläuft.
+        with self.__db_queue_lock:
+            queue = failed + self.__db_queue
+            if len(queue) > MAX_QUEUE_LENGTH:
+                dropped.inc(len(queue) - MAX_QUEUE_LENGTH)
+            self.__db_queue = queue[-MAX_QUEUE_LENGTH:]
+            queue_length.set(len(self.__db_queue))
+
+    def __write_single(self):
+        """Schreibt die Warteschlange mit einer neuen Verbindung in die Datenbank und leert die Warteschlange."""
+        to_write = self.__take_queue()
+        if len(to_write) == 0:
+            return
+        started = time.time()
+        try:
+            with self.__connect_func() as conn:            
+                cursor = conn.cursor()
+                cursor.execute(self.__get_tables_stmt)
+                tables = set(val[0].lower() for val in cursor.fetchall())
+                self.__create_tables(cursor, tables)
+                failed = self.__write_records(conn, cursor, tables, to_write)
+        # Im Fehlerfall die Daten noch einmal versuchen zu schreiben. Läuft der Puffer über, ist die
+        # DB länger ausgefallen und wird mit importlog.py aus den Textdateien befüllt.
+        except Exception:
+            failed = to_write
+            logging.exception("Fehler beim Verbinden zur Datenbank.")
+        self.__requeue(failed)
+        _observe_flush(started, len(to_write), len(failed))
+
+    def __write_batch(self):
+        """Schreibt die Warteschlange über die dauerhaft offene Verbindung in die Datenbank. Die
+        Datensätze werden pro Tabelle (und Spaltenliste) gruppiert und mit executemany in einer
+        einzigen Transaktion geschrieben. Schlägt die Transaktion fehl, werden die Datensätze
+        einzeln geschrieben, damit ein fehlerhafter Datensatz nicht alle anderen blockiert."""
+        to_write = self.__take_queue()
+        if len(to_write) == 0:
+            return
+        started = time.time()
+        try:
+            conn, cursor = self.__get_connection()
             try:
-                with self.__connect_func() as conn:            
-                    cursor = conn.cursor()
-                    cursor.execute(self.__get_tables_stmt)
-                    tables = [val[0].lower() for val in cursor.fetchall()]
-                    # Der einzelne Datensatz wird in die entsprechende Sensortabelle geschrieben.
-                    for record in to_write:
-                        try:
-                            tablename, tabledata = record
-                            # Tupel mit den einzelnen Werten pro Zeile erzeugen
-                            values = (tabledata['TIMESTAMP'], tabledata['OFFSET'], tabledata['SENSOR']) + tuple(v for v in tabledata['VALUE'].values())
-                            # Existiert die Tabelle noch nicht, wird sie erzeugt. Dabei wird für jedes Attribut
-                            # in value eine eigene Spalte vom Typ double angelegt.
-                            if tablename not in tables:
-                                cursor.execute(self.__generate_create_func(tablename, tabledata))
-                            cursor.execute(self.__generate_insert_func(tablename, tabledata), values)
-                            conn.commit()
-                        except Exception:
-                            failed.append(record)
-                            logging.exception("Fehler beim Einfügen eines Datensatzes: %s", to_write)
-            # Im Fehlerfall die Daten noch einmal versuchen zu schreiben. Bei einem Puffer von 1000
-            # wird dieser geleert, offensichtlich ist die DB länger ausgefallen und muss über das log
-            # befüllt werden.        
+                if self.__narrow:
+                    narrow.insert(cursor, self.__ids, [tabledata for tablename, tabledata in to_write])
+                else:
+                    self.__insert_groups(cursor, to_write)
+                if self.__rollups:
+                    rollup.update(cursor, [tabledata for tablename, tabledata in to_write])
+                conn.commit()
+                failed = []
             except Exception:
-                failed = to_write
-                logging.exception("Fehler beim Verbinden zur Datenbank.")
-            # Maximal die neuesten 10 000 in der Queue lassen, damit sie bei länger 
-            # ausgefallener DB nicht überläuft.
-            with self.__db_queue_lock:
-                self.__db_queue = (failed + self.__db_queue)[-10000:]
+                conn.rollback()
+                logging.exception("Fehler beim Schreiben von %d Datensätzen, sie werden einzeln geschrieben.", len(to_write))
+                cursor.execute(self.__get_tables_stmt)
+                self.__tables = set(val[0].lower() for val in cursor.fetchall())
+                self.__create_tables(cursor, self.__tables)
+                failed = self.__write_records(conn, cursor, self.__tables, to_write)
+        except Exception:
+            failed = to_write
+            logging.exception("Fehler beim Verbinden zur Datenbank.")
+            self.__close_connection()
+        self.__requeue(failed)
+        _observe_flush(started, len(to_write), len(failed))
 
-        if not self.__write_thread.is_alive():
-            self.__write_thread = threading.Thread(target = write_thread_func) 
-            self.__write_thread.start()
+    def __write_partitions(self):
+        """Verteilt die Warteschlange auf die Partitionen und schreibt jede Partition mit ihrer
+        dauerhaft offenen Verbindung. Danach werden vergangene Monate abgeschlossen."""
+        to_write = self.__take_queue()
+        failed = []
+        written = set()
+        for tablename, tabledata in to_write:
+            try:
+                self.__get_partition(tabledata['TIMESTAMP']).enqueue(tabledata)
+                written.add(partition.month_start(tabledata['TIMESTAMP']))
+            except Exception:
+                failed.append((tablename, tabledata))
+        if len(failed) > 0:
+            logging.error("%d Datensätze konnten keiner Partition zugeordnet werden.", len(failed))
+            self.__requeue(failed)
+        # Auch Partitionen ohne neue Datensätze, damit fehlgeschlagene erneut geschrieben werden.
+        for target in list(self.__partitions.values()):
+            target.flush()
+        self.__close_partitions(written)
+
+    def __get_partition(self, timestamp):
+        """Liefert das Database Objekt der Partition, in die timestamp gehört."""
+        start = partition.month_start(timestamp)
+        target = self.__partitions.get(start)
+        if target is None:
+            filename = partition.filename(self.__partition_dir, start)
+            if partition.is_closed(filename):
+                partition.reopen(filename)
+            target = Database.sqlite(filename, self.__table_prefix, persistent = True, rollups = self.__rollups)
+            self.__partitions[start] = target
+        return target
+
+    def __close_partitions(self, written = ()):
+        """Schließt die Verbindungen vergangener Monate und schließt deren Dateien ab. Partitionen,
+        in die gerade geschrieben wurde (z. B. beim Nachladen alter Daten), bleiben bis zum
+        nächsten Schreiben ohne ihren Monat offen."""
+        now = time.time()
+        for start, target in list(self.__partitions.items()):
+            # Partitionen mit nicht geschriebenen Datensätzen bleiben offen.
+            if partition.next_month(start) + self.__close_after <= now and start not in written \
+               and len(target.__db_queue) == 0:
+                target.__close_connection()
+                del self.__partitions[start]
+        try:
+            partition.close_expired(self.__partition_dir, self.__close_after, now,
+                                    set(partition.filename(self.__partition_dir, start) for start in self.__partitions))
+        except Exception:
+            logging.exception('Fehler beim Abschließen der Partitionen in %s.', self.__partition_dir)
+
+    def __insert_groups(self, cursor, to_write):
+        """Gruppiert die Datensätze pro Tabelle und Spaltenliste und schreibt jede Gruppe mit
+        executemany. Fehlende Tabellen werden angelegt."""
+        groups = {}
+        for tablename, tabledata in to_write:
+            group = groups.setdefault((tablename, tuple(tabledata['VALUE'].keys())), [])
+            group.append(tabledata)
+        for (tablename, columns), records in groups.items():
+            if tablename not in self.__tables:
+                cursor.execute(self.__generate_create_func(tablename, records[0]))
+                self.__tables.add(tablename)
+            self.__add_columns(cursor, tablename, columns)
+            cursor.executemany(self.__get_insert_stmt(tablename, columns, records[0]),
+                               [_get_values(record) for record in records])
+
+    def __write_records(self, conn, cursor, tables, to_write):
+        """Schreibt jeden Datensatz mit einem eigenen commit in die entsprechende Sensortabelle.
+
+        Returns:
+            list: Die Datensätze, die nicht geschrieben werden konnten.
+        """
+        failed = []
+        for record in to_write:
+            try:
+                tablename, tabledata = record
+                if self.__narrow:
+                    narrow.insert(cursor, self.__ids, [tabledata])
+                else:
+                    # Existiert die Tabelle noch nicht, wird sie erzeugt. Dabei wird für jedes Attribut
+                    # in value eine eigene Spalte vom Typ double angelegt.
+                    if tablename not in tables:
+                        cursor.execute(self.__generate_create_func(tablename, tabledata))
+                        tables.add(tablename)
+                    self.__add_columns(cursor, tablename, tabledata['VALUE'].keys())
+                    cursor.execute(self.__generate_insert_func(tablename, tabledata), _get_values(tabledata))
+                if self.__rollups:
+                    rollup.update(cursor, [tabledata])
+                conn.commit()
+            except Exception:
+                failed.append(record)
+                logging.exception("Fehler beim Einfügen eines Datensatzes: %s", record)
+                if self.__narrow:
+                    # Mit dem rollback sind auch neu angelegte IDs verworfen.
+                    conn.rollback()
+                    self.__ids = narrow.load_ids(cursor)
+        return failed
+
+    def __get_connection(self):
+        """Liefert die dauerhaft offene Verbindung samt Cursor. Beim ersten Aufruf werden die
+        Einstellungen gesetzt und die vorhandenen Tabellen gelesen."""
+        if self.__conn is None:
+            conn = self.__connect_func()
+            cursor = conn.cursor()
+            for stmt in self.__setup_stmts:
+                cursor.execute(stmt)
+            cursor.execute(self.__get_tables_stmt)
+            self.__tables = set(val[0].lower() for val in cursor.fetchall())
+            self.__create_tables(cursor, self.__tables)
+            conn.commit()
+            self.__insert_stmts = {}
+            self.__conn, self.__cursor = conn, cursor
+        return self.__conn, self.__cursor
+
+    def __add_columns(self, cursor, tablename, columns):
+        """Legt Spalten an, die ein Datensatz neu liefert (z. B. die Werte aus derived.py). Die
+        Spalten jeder Tabelle werden nur einmal pro Verbindung gelesen."""
+        existing = self.__columns.get(tablename)
+        if existing is None:
+            # Liefert das Statement und den Index des Spaltennamens in den Zeilen.
+            stmt, index = self.__get_columns_stmt(tablename)
+            cursor.execute(stmt)
+            existing = self.__columns[tablename] = set(val[index].upper() for val in cursor.fetchall())
+        for column in columns:
+            if column.upper() not in existing:
+                cursor.execute(self.__generate_add_column_func(tablename, column))
+                existing.add(column.upper())
+
+    def __create_tables(self, cursor, tables):
+        """Legt die Rollup Tabellen und die Tabellen des schmalen Layouts an und liest die IDs der
+        Sensoren und Werttypen."""
+        self.__columns = {}
+        if self.__rollups:
+            rollup.create_tables(cursor, tables)
+        if self.__narrow:
+            narrow.create_tables(cursor, tables)
+            self.__ids = narrow.load_ids(cursor)
+
+    def __get_insert_stmt(self, tablename, columns, record):
+        """Liefert das INSERT Statement für die Tabelle und Spaltenliste aus dem Cache."""
+        key = (tablename, columns)
+        if key not in self.__insert_stmts:
+            self.__insert_stmts[key] = self.__generate_insert_func(tablename, record)
+        return self.__insert_stmts[key]
+
+    def __close_connection(self):
+        if self.__conn is not None:
+            # Solange der Cursor offene Statements hält, bleibt die Datei sonst geöffnet.
+            try:
+                self.__cursor.close()
+                self.__conn.close()
+            except Exception:
+                pass
+            self.__conn = None
+            self.__cursor = None
 
     def __enter__(self):
         return self
     
     def __exit__(self, type, value, traceback):
-        if self.__write_thread.is_alive():
-            self.__write_thread.join()        
+        # Auch die zuletzt eingestellten Datensätze (z. B. aus Compressor.flush beim Beenden)
+        # werden noch geschrieben.
+        try:
+            self.flush()
+        except Exception:
+            logging.exception('Fehler beim Schreiben der Warteschlange beim Beenden.')
+        self.__close_connection()
+        if self.__partitions is not None:
+            self.__close_partitions()
+            for target in self.__partitions.values():
+                target.__close_connection()
+
+def _observe_flush(started, count, failed):
+    """Erfasst Dauer und Umfang eines Schreibvorgangs in den Metriken."""
+    flush_duration.observe(time.time() - started)
+    flush_rows.observe(count)
+    rows_written.inc(count - failed)
 
 def _prepare_record(record, prefix = "data"):
     """Erstellt einen neuen Record, der die verwendeten Felder für das INSERT sicher beinhaltet.
@@ -121,16 +421,54 @@ def _prepare_record(record, prefix = "data"):
 
     return (tablename, new_record)
 
+def _get_values(record):
+    """Liefert das Tupel mit den einzelnen Werten der Zeile in der Reihenfolge der Spalten."""
+    return (record['TIMESTAMP'], record['OFFSET'], record['SENSOR']) + tuple(v for v in record['VALUE'].values())
+
+# Letzte Kopfzeile jeder Textdatei von write_line
+_line_headers = {}
+
+def _read_last_header(filename, block_size = 65536):
+    """Liefert die letzte Kopfzeile (TIMESTAMP, OFFSET, SENSOR, ...) einer Textdatei ohne Zeilenende
+    oder None, wenn die Datei keine enthält. Die Datei wird blockweise vom Ende her gelesen."""
+    marker = b'TIMESTAMP\t'
+    with open(filename, 'rb') as file:
+        end = file.seek(0, os.SEEK_END)
+        data = b''
+        while end > 0:
+            start = max(0, end - block_size)
+            file.seek(start)
+            # Vom vorigen Block bleibt der Anfang, in dem eine gefundene Kopfzeile weitergeht.
+            data = file.read(end - start) + data[:MAX_HEADER_LENGTH]
+            end = start
+            index = data.rfind(b'\n' + marker)
+            if index >= 0:
+                line = data[index + 1:]
+            elif start == 0 and data.startswith(marker):
+                line = data
+            else:
+                continue
+            return line.split(b'\n', 1)[0].rstrip(b'\r').decode('utf-8', 'replace')
+    return None
+
 def write_line(data):
     """Schreibt den Datensatz in 2 Textdateien:
         1. In die Datei data_sensorname.txt (wird angehängt)
         2. In die Datei data_sensorname_latest.txt (wird überschrieben)
+    Die Kopfzeile wird geschrieben, wenn die Datei neu ist oder sich die Spalten geändert haben
+    (z. B. durch die Werte aus derived.py).
     """
     try:
         filename, record = _prepare_record(data)
-        write_header = not os.path.isfile(filename + '.txt')
         header = ['TIMESTAMP', 'OFFSET', 'SENSOR'] + \
                  [v for v in record['VALUE'].keys()]
+        path = os.path.abspath(filename + '.txt')
+        if not os.path.isfile(path):
+            _line_headers[path] = None
+        elif path not in _line_headers:
+            _line_headers[path] = _read_last_header(path)
+        write_header = _line_headers[path] != '\t'.join(header)
+        _line_headers[path] = '\t'.join(header)
         values = [str(record['TIMESTAMP']), str(record['OFFSET']), str(record['SENSOR'])] + \
                  [str(v) for v in record['VALUE'].values()]
 
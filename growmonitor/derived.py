@@ -0,0 +1,153 @@
+"""Abgeleitete Werte aus Temperatur (TEMP in °C) und relativer Feuchte (HUM in %):
+
+    DEWP   Taupunkt in °C (Magnus Formel wie bisher in Bme280.calc_dewp und sensordata_api.r)
+    VPD    Dampfdruckdefizit in kPa
+    AHUM   Absolute Feuchte in g/m³
+
+Der Cronjob ergänzt jeden Datensatz mit TEMP und HUM um diese Werte (add_derived), bevor er in den
+Verlauf, die Datenbank und die Textdateien geht. Regelung und Diagramme verwenden damit dieselben
+gespeicherten Werte. calculate rechnet mit NumPy und akzeptiert Zahlen und Arrays, calculate_values
+rechnet einzelne Zahlen ohne NumPy (der Cronjob lädt NumPy daher nicht). Für bestehende Tabellen
+werden die Werte mit
+
+    python3 derived.py ../data/sensordata.db
+
+in einem Durchlauf pro Tabelle nachgetragen.
+"""
+
+import logging
+import math
+import sqlite3
+import sys
+import rollup
+from drivers import LazyModule
+
+np = LazyModule('numpy')         # pip install numpy
+
+# Konstanten der Magnus Formel, http://old.wetterzentrale.de/cgi-bin/webbbs/wzarchive2004_2.pl?noframes;read=506422
+A = 17.08085
+B = 234.175
+E0 = 6.1078
+# Spezifische Gaskonstante von Wasserdampf in J/(kg K), für die absolute Feuchte in g/m³
+RW = 461.5
+
+VALUETYPES = ('DEWP', 'VPD', 'AHUM')
+DIGITS = {'DEWP': 1, 'VPD': 2, 'AHUM': 1}
+
+def calculate(temp, hum):
+    """Berechnet DEWP, VPD und AHUM. temp und hum können Zahlen oder NumPy Arrays sein, für eine
+    Feuchte <= 0 oder fehlende Werte ist das Ergebnis NaN.
+
+    Returns:
+        dict: DEWP, VPD und AHUM (gerundet) mit der Form von temp und hum.
+    """
+    temp = np.asarray(temp, dtype = np.float64)
+    hum = np.asarray(hum, dtype = np.float64)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        values = _formula(temp, np.where(hum > 0, hum, np.nan), np.exp, np.log)
+    return {key: np.round(value, DIGITS[key]) for key, value in values.items()}
+
+def calculate_values(temp, hum):
+    """Wie calculate für einzelne Zahlen, ohne NumPy. Kann ein Wert nicht berechnet werden (Feuchte
+    <= 0 oder fehlende Werte), ist er None."""
+    if temp is None or hum is None or hum <= 0:
+        return dict.fromkeys(VALUETYPES)
+    values = _formula(float(temp), float(hum), math.exp, math.log)
+    return {key: round(value, DIGITS[key]) for key, value in values.items()}
+
+def dewpoint(temp, hum):
+    """Liefert den Taupunkt in °C als Zahl (oder None, wenn er nicht berechnet werden kann)."""
+    return calculate_values(temp, hum)['DEWP']
+
+def get_dewpoint(values):
+    """Liefert DEWP aus den Werten eines Sensors (dict mit TEMP und HUM). Fehlt er (z. B. bei
+    einem Treiber ohne den Cronjob), wird er berechnet."""
+    if values.get('DEWP') is not None:
+        return values['DEWP']
+    return dewpoint(values['TEMP'], values['HUM'])
+
+def add_derived(record):
+    """Liefert den Datensatz um DEWP, VPD und AHUM ergänzt, wenn VALUE ein dict mit TEMP und HUM ist.
+    Vom Treiber gelieferte Werte werden nicht überschrieben."""
+    values = record['VALUE']
+    if not isinstance(values, dict) or values.get('TEMP') is None or values.get('HUM') is None:
+        return record
+    derived = calculate_values(values['TEMP'], values['HUM'])
+    new_values = dict(values)
+    for key in VALUETYPES:
+        if key not in new_values:
+            new_values[key] = derived[key]
+    return dict(record, VALUE = new_values)
+
+def backfill(conn, table_prefix = 'data', chunk_size = 100000):
+    """Trägt DEWP, VPD und AHUM in allen Sensortabellen mit TEMP und HUM nach, in denen DEWP fehlt.
+    Fehlende Spalten werden angelegt. Existieren die Rollup Tabellen, werden die neuen Werte dort
+    addiert.
+
+    Returns:
+        int: Anzahl der geänderten Zeilen.
+    """
+    tables = [val[0] for val in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'", (table_prefix + '\\_%',))]
+    rollups = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                           (rollup.table_name(rollup.LEVELS[0]),)).fetchone() is not None
+    total = 0
+    for tablename in tables:
+        columns = set(val[1].upper() for val in conn.execute('PRAGMA table_info({})'.format(tablename)))
+        if 'TEMP' not in columns or 'HUM' not in columns:
+            continue
+        for key in VALUETYPES:
+            if key not in columns:
+                conn.execute('ALTER TABLE {} ADD COLUMN {} REAL'.format(tablename, key))
+        conn.commit()
+        count = 0
+        last = -2**62
+        while True:
+            # Blockweise über den Primärschlüssel, damit kein SELECT über die UPDATEs offen bleibt.
+            rows = conn.execute('SELECT TIMESTAMP, TRIM(SENSOR), TEMP, HUM FROM {} WHERE TIMESTAMP > ? AND DEWP IS NULL '
+                                'AND TEMP IS NOT NULL AND HUM IS NOT NULL ORDER BY TIMESTAMP LIMIT ?'.format(tablename),
+                                (last, chunk_size)).fetchall()
+            if len(rows) == 0:
+                break
+            last = rows[-1][0]
+            data = np.array([(row[0], row[2], row[3]) for row in rows], dtype = np.float64)
+            derived = calculate(data[:, 1], data[:, 2])
+            timestamps = data[:, 0].astype(np.int64).tolist()
+            # NaN (z. B. bei HUM = 0) wird als NULL gespeichert.
+            values = list(zip(*[np.where(np.isnan(derived[key]), None, derived[key]).tolist() for key in VALUETYPES]))
+            try:
+                conn.executemany('UPDATE {} SET {} WHERE TIMESTAMP = ?'.format(
+                    tablename, ', '.join('{} = ?'.format(key) for key in VALUETYPES)),
+                    [row + (timestamp,) for row, timestamp in zip(values, timestamps)])
+                if rollups:
+                    rollup.update(conn.cursor(), [{'TIMESTAMP': timestamp, 'OFFSET': None, 'SENSOR': row[1],
+                                                   'VALUE': dict(zip(VALUETYPES, value))}
+                                                  for row, timestamp, value in zip(rows, timestamps, values)])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            count += len(rows)
+        logging.info('%s: %d Zeilen ergänzt.', tablename, count)
+        total += count
+    return total
+
+def _formula(temp, hum, exp, log):
+    """Berechnet die ungerundeten Werte mit den Funktionen exp und log aus math oder NumPy."""
+    # Sättigungsdampfdruck E(t) und Dampfdruck in hPa
+    e_saett = E0 * exp(A * temp / (B + temp))
+    e = hum / 100 * e_saett
+    log_e = log(e / E0)
+    return {
+        'DEWP': B * log_e / (A - log_e),
+        'VPD': (e_saett - e) / 10,
+        'AHUM': e * 100 / (RW * (temp + 273.15)) * 1000
+    }
+
+if __name__ == '__main__':
+    logging.basicConfig(format = '%(asctime)s %(message)s', level = logging.INFO)
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else '../data/sensordata.db', timeout = 60)
+    try:
+        logging.info('%d Zeilen ergänzt.', backfill(conn))
+    finally:
+        conn.close()
@@ -0,0 +1,98 @@
+"""Lädt Treiberklassen und die Bibliotheken der Hardware erst, wenn sie verwendet werden.
+
+Registry ordnet die Namen in class (cronjobs.json) den Modulen zu, in denen die Klassen liegen. Das
+Modul wird erst importiert, wenn ein Job die Klasse verwendet. Neben den Namen aus BUILTIN kann
+class den vollständigen Pfad einer Klasse enthalten (z. B. "meinetreiber.Pumpe"). Registry kann dem
+Cronjob wie ein Modul als drivers übergeben werden.
+
+LazyModule ist ein Platzhalter für ein Modul, das erst beim ersten Zugriff auf ein Attribut
+importiert wird. rasp.py importiert die Hardware Bibliotheken (RPi.GPIO, smbus2, bme280, ...) so,
+dass nur die Bibliotheken der konfigurierten Treiber geladen werden und eine fehlende, nicht
+benötigte Bibliothek den Start nicht verhindert.
+"""
+
+import importlib
+
+# Treiberklassen und ihre Module
+BUILTIN = {
+    'Bme280': 'rasp',
+    'Tsl2561': 'rasp',
+    'Relais': 'rasp',
+    'Fan': 'rasp',
+    'Cam': 'rasp',
+    'Relaymonitor': 'rasp',
+    'Adc': 'rasp'
+}
+
+class Registry:
+    """Auflösung der Namen aus class in Treiberklassen."""
+
+    def __init__(self, modules = None):
+        """Konstruktor
+
+        Args:
+            modules (dict, optional): Name der Klasse -> Name des Moduls. Defaults to BUILTIN.
+        """
+        self.__modules = dict(BUILTIN if modules is None else modules)
+        self.__classes = {}
+
+    def register(self, name, module):
+        """Ordnet die Klasse name dem Modul module (Name des Moduls) zu."""
+        self.__modules[name] = module
+        self.__classes.pop(name, None)
+
+    def get(self, name):
+        """Liefert die Klasse. Das Modul wird beim ersten Aufruf importiert.
+
+        Raises:
+            AttributeError: Wenn die Klasse nicht bekannt ist oder im Modul fehlt.
+            ImportError: Wenn das Modul (oder eine Bibliothek, die es beim Import lädt) fehlt.
+        """
+        cls = self.__classes.get(name)
+        if cls is None:
+            if name in self.__modules:
+                module, attribute = self.__modules[name], name
+            elif '.' in name:
+                module, attribute = name.rsplit('.', 1)
+            else:
+                raise AttributeError('Treiber {} ist nicht registriert.'.format(name))
+            cls = self.__classes[name] = getattr(importlib.import_module(module), attribute)
+        return cls
+
+    def __getattr__(self, name):
+        # Für Cronjob verhält sich die Registry wie ein Modul (hasattr und getattr).
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self.get(name)
+
+class LazyModule:
+    """Platzhalter, der das Modul beim ersten Zugriff auf ein Attribut importiert."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._available = None
+
+    def _load(self):
+        """Importiert das Modul (falls noch nicht geschehen) und liefert es."""
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def _is_available(self):
+        """Liefert True, wenn das Modul importiert werden kann (für optionale Bibliotheken)."""
+        if self._available is None:
+            try:
+                self._load()
+                self._available = True
+            except ImportError:
+                self._available = False
+        return self._available
+
+    def __getattr__(self, key):
+        if key.startswith('__'):
+            raise AttributeError(key)
+        return getattr(self._load(), key)
+
+    def __repr__(self):
+        return '<LazyModule {}{}>'.format(self._name, '' if self._module is None else ' (geladen)')
@@ -0,0 +1,210 @@
+"""Verlauf der letzten Messwerte aller Sensoren im Speicher.
+
+Pro Sensor und Werttyp (z. B. BME280_BOX und TEMP) gibt es einen Ringpuffer aus zwei typisierten
+Arrays (array.array) mit einer festen Maximalgröße. Das Anhängen eines Wertes ist O(1) und legt
+keine neuen Objekte an. Die Jobs bekommen als current_values ein dict mit dem letzten Datensatz
+jedes Sensors (wie bisher über current_values[sensor]['VALUE'] lesbar) und über
+current_values.history Zugriff auf den Verlauf:
+
+    stats = current_values.history.stats('BME280_BOX', 'TEMP', 600)
+    if stats is not None and stats.slope > 0: ...
+"""
+
+import threading
+import time
+from array import array
+
+class Reading:
+    """Der letzte Datensatz eines Sensors. Für bestehende Treiber sind die Felder auch wie bei einem
+    dict lesbar (reading['VALUE'])."""
+    __slots__ = ('TIMESTAMP', 'OFFSET', 'SENSOR', 'VALUE')
+
+    def __init__(self, data):
+        self.TIMESTAMP = data['TIMESTAMP']
+        self.OFFSET = data['OFFSET']
+        self.SENSOR = data['SENSOR']
+        self.VALUE = data['VALUE']
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default = None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        return self.__slots__
+
+    def __repr__(self):
+        return 'Reading({})'.format(', '.join('{}={!r}'.format(key, getattr(self, key)) for key in self.__slots__))
+
+class WindowStats:
+    """Kennzahlen eines Zeitfensters. slope ist die Steigung der Regressionsgeraden pro Sekunde."""
+    __slots__ = ('count', 'min', 'max', 'mean', 'slope', 'first', 'last')
+
+    def __init__(self, count, minimum, maximum, mean, slope, first, last):
+        self.count = count
+        self.min = minimum
+        self.max = maximum
+        self.mean = mean
+        self.slope = slope
+        self.first = first
+        self.last = last
+
+    def __repr__(self):
+        return 'WindowStats({})'.format(', '.join('{}={!r}'.format(key, getattr(self, key)) for key in self.__slots__))
+
+class Series:
+    """Ringpuffer mit TIMESTAMP (int64) und Wert (double) einer Serie. Der Puffer wächst bis capacity
+    und überschreibt dann die ältesten Werte."""
+    __slots__ = ('capacity', 'timestamps', 'values', 'pos')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('q')
+        self.values = array('d')
+        self.pos = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, timestamp, value):
+        if len(self.values) < self.capacity:
+            self.timestamps.append(timestamp)
+            self.values.append(value)
+        else:
+            self.timestamps[self.pos] = timestamp
+            self.values[self.pos] = value
+            self.pos = (self.pos + 1) % self.capacity
+
+    def stats(self, seconds, now):
+        """Berechnet die Kennzahlen der Werte mit TIMESTAMP > now - seconds (vom neuesten Wert
+        rückwärts, es werden nur die Werte im Fenster gelesen).
+
+        Returns:
+            WindowStats: Die Kennzahlen oder None, wenn im Fenster kein Wert liegt.
+        """
+        size = len(self.values)
+        newest = (self.pos - 1) % size if size > 0 else 0
+        start = now - seconds
+        count = 0
+        sum_t = sum_v = sum_tt = sum_tv = 0.0
+        minimum = maximum = first = last = None
+        for i in range(size):
+            index = (newest - i) % size
+            timestamp = self.timestamps[index]
+            if timestamp <= start:
+                break
+            value = self.values[index]
+            if count == 0:
+                minimum = maximum = last = value
+            else:
+                minimum = min(minimum, value)
+                maximum = max(maximum, value)
+            first = value
+            # Die Zeit relativ zu now hält die Summen klein und genau.
+            t = timestamp - now
+            count += 1
+            sum_t += t
+            sum_v += value
+            sum_tt += t * t
+            sum_tv += t * value
+        if count == 0:
+            return None
+        denominator = count * sum_tt - sum_t * sum_t
+        slope = (count * sum_tv - sum_t * sum_v) / denominator if count > 1 and denominator != 0 else 0.0
+        return WindowStats(count, minimum, maximum, sum_v / count, slope, first, last)
+
+class CurrentValues(dict):
+    """Die an do_work übergebenen aktuellen Werte: dict Sensorname -> Reading, zusätzlich mit dem
+    Verlauf in history."""
+    __slots__ = ('history',)
+
+    def __init__(self, latest, history):
+        super().__init__(latest)
+        self.history = history
+
+class History:
+    """Verlauf aller Sensoren. add wird vom Cronjob aufgerufen, die Abfragen können aus den
+    Workerthreads erfolgen."""
+
+    def __init__(self, capacity = 360, clock = None):
+        """Konstruktor
+
+        Args:
+            capacity (int, optional): Maximale Anzahl der Werte pro Serie (bei einer Messung pro
+                Minute 6 Stunden). Defaults to 360.
+            clock (optional): Zeitquelle mit time() für das Ende der Fenster ohne now (siehe
+                replay.py). Defaults to None (Modul time).
+        """
+        self.__capacity = capacity
+        self.__clock = clock if clock is not None else time
+        self.__series = {}
+        self.__latest = {}
+        self.__snapshot = None
+        self.__lock = threading.Lock()
+
+    def add(self, data):
+        """Übernimmt einen Datensatz (TIMESTAMP, OFFSET, SENSOR, VALUE). VALUE darf eine Zahl oder
+        ein dict sein, nur Zahlen werden im Verlauf gespeichert."""
+        values = data['VALUE'] if isinstance(data['VALUE'], dict) else {'VALUE': data['VALUE']}
+        with self.__lock:
+            self.__latest[data['SENSOR']] = Reading(data)
+            self.__snapshot = None
+            for valuetype, value in values.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                key = (data['SENSOR'], valuetype)
+                series = self.__series.get(key)
+                if series is None:
+                    series = self.__series[key] = Series(self.__capacity)
+                series.append(data['TIMESTAMP'], value)
+
+    def current_values(self):
+        """Liefert den letzten Datensatz jedes Sensors als CurrentValues. Solange kein neuer
+        Datensatz hinzukommt, wird dasselbe Objekt geliefert; es darf nicht verändert werden."""
+        with self.__lock:
+            if self.__snapshot is None:
+                self.__snapshot = CurrentValues(self.__latest, self)
+            return self.__snapshot
+
+    def stats(self, sensor, valuetype, seconds, now = None):
+        """Liefert MIN, MAX, Mittelwert und Steigung der letzten seconds Sekunden einer Serie.
+
+        Args:
+            sensor (str): Name des Sensors aus cronjobs.json.
+            valuetype (str): Name des Wertes, VALUE bei Sensoren, die nur eine Zahl liefern.
+            seconds (int): Länge des Fensters in Sekunden.
+            now (int, optional): Ende des Fensters als UNIX Timestamp. Defaults to clock.time().
+
+        Returns:
+            WindowStats: Die Kennzahlen oder None, wenn die Serie im Fenster keine Werte hat.
+        """
+        now = self.__clock.time() if now is None else now
+        with self.__lock:
+            series = self.__series.get((sensor, valuetype))
+            return series.stats(seconds, now) if series is not None else None
+
+    def mean(self, sensor, valuetype, seconds, now = None):
+        stats = self.stats(sensor, valuetype, seconds, now)
+        return stats.mean if stats is not None else None
+
+    def slope(self, sensor, valuetype, seconds, now = None):
+        stats = self.stats(sensor, valuetype, seconds, now)
+        return stats.slope if stats is not None else None
+
+def get_values(current_values, sensor, seconds = None):
+    """Liefert VALUE des Sensors aus current_values. Ist seconds angegeben und der Verlauf
+    verfügbar, werden die Zahlen durch den Mittelwert der letzten seconds Sekunden ersetzt."""
+    values = current_values[sensor]['VALUE']
+    history = getattr(current_values, 'history', None)
+    if seconds is None or history is None or not isinstance(values, dict):
+        return values
+    smoothed = dict(values)
+    for valuetype in values:
+        mean = history.mean(sensor, valuetype, seconds)
+        if mean is not None:
+            smoothed[valuetype] = mean
+    return smoothed
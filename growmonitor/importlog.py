@@ -0,0 +1,210 @@
+"""Lädt die Textdateien von db.write_line bzw. TextLog (data_sensorname.txt und rotierte
+data_sensorname_JJJJ-MM.txt.gz) in die SQLite Datenbank, z. B. nach einem Ausfall der Datenbank:
+
+    python3 importlog.py ../data/sensordata.db [verzeichnis oder dateien ...]
+
+Die Dateien werden blockweise (etwa chunk_size Zeilen) gelesen, jeder Block wird pro Tabelle mit
+executemany und INSERT OR IGNORE in einer Transaktion geschrieben. Vorhandene TIMESTAMPs
+(Primärschlüssel) bleiben daher unverändert. In derselben Transaktion wird in der Tabelle
+import_state die Byteposition nach der letzten vollständigen Zeile gespeichert, ein erneuter Lauf
+liest nur die neuen Zeilen. Eine unvollständige letzte Zeile wird beim nächsten Lauf gelesen.
+Zerlegt werden die Zeilen mit List Comprehensions, die Umwandlung der Werte übernimmt SQLite.
+Unveränderte .gz Dateien, die vollständig übernommen sind, werden übersprungen. Existieren die
+Rollup Tabellen, werden sie für die Zeiträume mit neuen Zeilen neu berechnet.
+
+Mit der Position werden die ersten Bytes der Datei gespeichert (mit dem TIMESTAMP der ersten
+Zeile). Beginnt die Datei nicht mehr damit (sie wurde rotiert und neu begonnen), wird sie von
+vorne gelesen, auch wenn sie schon über die alte Position hinaus gewachsen ist. Zeilen aus Monaten,
+die archive.py bereits archiviert hat, werden nicht eingefügt, sie liegen im Archiv.
+
+Unterstützt wird das Layout mit einer Tabelle pro Sensor (db.Database.sqlite mit layout = 'wide').
+"""
+
+import glob
+import gzip
+import logging
+import os
+import sqlite3
+import sys
+import time
+import archive
+import rollup
+
+# Zeilen pro Transaktion
+CHUNK_SIZE = 50000
+# Anzahl der Bytes am Anfang der Datei, an denen sie wiedererkannt wird
+PREFIX_SIZE = 256
+STATE_TABLE = 'import_state'
+
+def import_files(conn, filenames, table_prefix = 'data', chunk_size = CHUNK_SIZE):
+    """Übernimmt die Textdateien in die Datenbank.
+
+    Args:
+        conn (sqlite3.Connection): Zieldatenbank.
+        filenames (list): Textdateien (.txt oder .txt.gz).
+        table_prefix (str, optional): Prefix der Sensortabellen. Defaults to 'data'.
+        chunk_size (int, optional): Zeilen pro Transaktion. Defaults to CHUNK_SIZE.
+
+    Returns:
+        int: Anzahl der neu eingefügten Zeilen.
+    """
+    conn.execute('CREATE TABLE IF NOT EXISTS {} (FILENAME TEXT PRIMARY KEY, POSITION INTEGER, HEADER TEXT, '
+                 'SIZE INTEGER, MTIME REAL, COMPLETE INTEGER, PREFIX BLOB) WITHOUT ROWID'.format(STATE_TABLE))
+    # Tabellen älterer Versionen ohne PREFIX, deren Dateien werden einmal von vorne gelesen.
+    if 'PREFIX' not in set(val[1].upper() for val in conn.execute('PRAGMA table_info({})'.format(STATE_TABLE))):
+        conn.execute('ALTER TABLE {} ADD COLUMN PREFIX BLOB'.format(STATE_TABLE))
+    conn.commit()
+    tables = set(val[0].lower() for val in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+    ranges = {}
+    archived = {}
+    total = 0
+    for filename in filenames:
+        started = time.time()
+        count = _import_file(conn, filename, table_prefix, chunk_size, tables, ranges, archived)
+        logging.info('%s: %d Zeilen eingefügt (%.1f s).', filename, count, time.time() - started)
+        total += count
+    if rollup.table_name(rollup.LEVELS[0]) in tables:
+        for tablename, (start, end) in ranges.items():
+            rollup.backfill(conn, table_prefix, [tablename], start, end)
+    return total
+
+def find_files(directory, table_prefix = 'data'):
+    """Liefert die Textdateien im Verzeichnis, rotierte (ältere) vor den aktuellen."""
+    rotated = glob.glob(os.path.join(glob.escape(directory), table_prefix + '_*.txt.gz'))
+    current = [filename for filename in glob.glob(os.path.join(glob.escape(directory), table_prefix + '_*.txt'))
+               if not filename.endswith('_latest.txt')]
+    return sorted(rotated) + sorted(current)
+
+def _import_file(conn, filename, table_prefix, chunk_size, tables, ranges, archived):
+    """Übernimmt eine Datei ab der gespeicherten Position. ranges erhält pro Tabelle den Zeitraum
+    der Blöcke, in denen neue Zeilen eingefügt wurden. archived speichert pro Tabelle das Ende der
+    archivierten Monate (siehe archive.get_archived_until)."""
+    key = os.path.basename(filename)
+    stat = os.stat(filename)
+    compressed = filename.endswith('.gz')
+    row = conn.execute('SELECT POSITION, HEADER, SIZE, MTIME, COMPLETE, PREFIX FROM {} WHERE FILENAME = ?'
+                       .format(STATE_TABLE), (key,)).fetchone()
+    position, header = (row[0], row[1]) if row is not None else (0, None)
+    if row is not None and compressed and row[4] and row[2] == stat.st_size and row[3] == stat.st_mtime:
+        return 0
+
+    cursor = conn.cursor()
+    count = 0
+    rest = b''
+    with (gzip.open(filename, 'rb') if compressed else open(filename, 'rb')) as file:
+        prefix = file.read(PREFIX_SIZE)
+        if row is not None and (row[5] is None or prefix[:len(row[5])] != row[5] or len(prefix) < min(position, PREFIX_SIZE)
+                                or (not compressed and stat.st_size < position)):
+            # Die Datei wurde rotiert und neu begonnen (oder der Stand stammt von einer älteren Version).
+            logging.info('%s wurde seit dem letzten Lauf neu begonnen und wird von vorne gelesen.', filename)
+            position, header = 0, None
+        file.seek(position)
+        while True:
+            data = file.read(chunk_size * 64)
+            if len(data) == 0:
+                break
+            # Nur vollständige Zeilen verarbeiten, der Rest wird dem nächsten Block vorangestellt.
+            data = rest + data
+            size = data.rfind(b'\n') + 1
+            rest = data[size:]
+            if size == 0:
+                continue
+            groups, header = _parse(data[:size].decode('utf-8', 'replace').splitlines(), header, table_prefix, filename)
+            try:
+                for (tablename, columns), rows in groups.items():
+                    if tablename not in archived:
+                        archived[tablename] = archive.get_archived_until(conn, tablename)
+                    if archived[tablename] is not None:
+                        rows = [row for row in rows if int(row[0]) >= archived[tablename]]
+                        if len(rows) == 0:
+                            continue
+                    inserted = _insert(cursor, tablename, columns, rows, tables)
+                    if inserted > 0:
+                        timestamps = [int(row[0]) for row in rows]
+                        start, end = min(timestamps), max(timestamps)
+                        previous = ranges.get(tablename, (start, end))
+                        ranges[tablename] = (min(previous[0], start), max(previous[1], end))
+                    count += inserted
+                position += size
+                _save_state(cursor, key, position, header, stat, False, prefix)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    # Eine unvollständige letzte Zeile (die Datei wird gerade geschrieben) wird beim nächsten Lauf gelesen.
+    complete = len(rest) == 0
+    _save_state(cursor, key, position, header, stat, complete, prefix)
+    conn.commit()
+    return count
+
+def _parse(lines, header, table_prefix, filename):
+    """Zerlegt die Zeilen in Listen [TIMESTAMP, OFFSET, SENSOR, Werte...] gruppiert nach Tabelle und
+    Spaltenliste. Kopfzeilen ändern die Spaltenliste der folgenden Zeilen. Die Werte bleiben Text,
+    SQLite wandelt sie beim Einfügen in die Spaltentypen um.
+
+    Returns:
+        tuple: (dict (Tabelle, Spalten) -> list, Kopfzeile am Ende der Zeilen)
+    """
+    groups = {}
+    skipped = 0
+    # Die Kopfzeilen teilen die Zeilen in Abschnitte mit gleicher Spaltenliste. Innerhalb eines
+    # Abschnitts wird nur mit List Comprehensions gearbeitet.
+    headers = [i for i, line in enumerate(lines) if line.startswith('TIMESTAMP\t')]
+    for begin, end in zip([-1] + headers, headers + [len(lines)]):
+        if begin >= 0:
+            header = lines[begin]
+        if begin + 1 == end:
+            continue
+        if header is None:
+            skipped += end - begin - 1
+            continue
+        columns = tuple(header.split('\t')[3:])
+        width = len(columns) + 3
+        rows = [line.split('\t') for line in lines[begin + 1:end]]
+        valid = [row for row in rows if len(row) == width and row[0].isdigit()]
+        skipped += len(rows) - len(valid)
+        sensors = set(row[2] for row in valid)
+        for sensor in sensors:
+            group = groups.setdefault(('{}_{}'.format(table_prefix, sensor).lower(), columns), [])
+            group.extend(valid if len(sensors) == 1 else [row for row in valid if row[2] == sensor])
+    if skipped > 0:
+        logging.warning('%s: %d ungültige Zeilen übersprungen.', filename, skipped)
+    return groups, header
+
+def _insert(cursor, tablename, columns, rows, tables):
+    """Schreibt die Zeilen mit INSERT OR IGNORE. Fehlende Tabellen und Spalten werden angelegt.
+
+    Returns:
+        int: Anzahl der neu eingefügten Zeilen.
+    """
+    if tablename not in tables:
+        cursor.execute('CREATE TABLE {} (TIMESTAMP INTEGER, OFFSET REAL, SENSOR TEXT, {}PRIMARY KEY (TIMESTAMP))'
+                       .format(tablename, ''.join(column + ' REAL, ' for column in columns)))
+        tables.add(tablename)
+    else:
+        existing = set(val[1].upper() for val in cursor.execute('PRAGMA table_info({})'.format(tablename)))
+        for column in columns:
+            if column.upper() not in existing:
+                cursor.execute('ALTER TABLE {} ADD COLUMN {} REAL'.format(tablename, column))
+    # write_line schreibt None als Text, NULLIF macht daraus NULL, ohne jeden Wert in Python umzuwandeln.
+    cursor.executemany('INSERT OR IGNORE INTO {} (TIMESTAMP, OFFSET, SENSOR, {}) VALUES (?, NULLIF(?, \'None\'), ?, {})'
+                       .format(tablename, ', '.join(columns), ', '.join(["NULLIF(?, 'None')"] * len(columns))), rows)
+    return cursor.rowcount
+
+def _save_state(cursor, key, position, header, stat, complete, prefix):
+    cursor.execute('INSERT OR REPLACE INTO {} (FILENAME, POSITION, HEADER, SIZE, MTIME, COMPLETE, PREFIX) '
+                   'VALUES (?, ?, ?, ?, ?, ?, ?)'.format(STATE_TABLE),
+                   (key, position, header, stat.st_size, stat.st_mtime, int(complete), prefix))
+
+if __name__ == '__main__':
+    logging.basicConfig(format = '%(asctime)s %(message)s', level = logging.INFO)
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else '../data/sensordata.db', timeout = 60)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    filenames = []
+    for arg in sys.argv[2:] or ['.']:
+        filenames += find_files(arg) if os.path.isdir(arg) else [arg]
+    try:
+        logging.info('%d Zeilen eingefügt.', import_files(conn, filenames))
+    finally:
+        conn.close()
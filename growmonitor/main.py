@@ -2,12 +2,18 @@
 # pacman -S freetds && pip install cython &&  pip install pymssql 
 # pip install Adafruit_GPIO tsl2561 RPi.bme280
 
+import asyncio
 import datetime
 import logging
+import os
 import sys
 from logging.handlers import RotatingFileHandler
+from compress import Compressor
 from cronjob import Cronjob
+from textlog import TextLog
 import db
+import metrics
+from push import PushServer
 
 print('+------------------------------------------------------------------------------+')
 print('| GROWCONTROL                                                                  |')
@@ -18,8 +24,10 @@ print('  Lokale Zeit: ', datetime.datetime.now())
 print('  UTC:         ', datetime.datetime.utcnow())
 
 def on_job_ready(data):
-    database.enqueue(data)
-    db.write_line(data)
+    push.publish(data)
+    for record in compressor.filter(data):
+        database.enqueue(record)
+        textlog.write(record)
 
 def on_all_jobs_ready():
     database.write_queue()
@@ -32,11 +40,49 @@ logger.addHandler(handler)
 
 #logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
 try:
-    config_file = sys.argv[1] if len(sys.argv) > 1 else 'cronjobs.json'
-    #with db.Database.mssql("h2815404.stratoserver.net", "SensorDb", "h5dv4e3RzLDQ", "SensorDb") as database:
-    with db.Database.sqlite("../data/sensordata.db") as database:
+    # python3 main.py [cronjobs.json] [--async] [--replicate]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    config_file = args[0] if len(args) > 0 else 'cronjobs.json'
+    # Die Telemetrie ist optional, ohne sie (z. B. Port belegt) läuft die Regelung trotzdem.
+    try:
+        metrics.start_server(9101)
+    except Exception:
+        logging.exception('Metrics Server auf Port 9101 konnte nicht gestartet werden.')
+    # Ohne GROWMONITOR_PUSH_TOKEN ist der Stream nur lokal erreichbar. Für das Dashboard wird der
+    # geheime Pfad der R API (aus sensordata_api.r) als Token gesetzt, siehe push.py.
+    push_token = os.environ.get('GROWMONITOR_PUSH_TOKEN')
+    push = PushServer(9102, host = '0.0.0.0' if push_token else '127.0.0.1', token = push_token)
+    try:
+        push.start()
+    except Exception:
+        logging.exception('Push Server auf Port 9102 konnte nicht gestartet werden.')
+    # Die Sensoren schreiben nur lokal, --replicate überträgt die Tabellen im Hintergrund auf den SQL Server.
+    # Die Zugangsdaten kommen aus den Umgebungsvariablen GROWMONITOR_MSSQL_* (siehe replicate.py).
+    # Module, die nur mit den Optionen benötigt werden, erst dann laden (siehe startup.py).
+    if '--replicate' in sys.argv:
+        try:
+            from replicate import Replicator
+            replicator = Replicator.mssql_from_environment("../data/sensordata.db").start()
+        except Exception:
+            logging.exception('Die Replikation konnte nicht gestartet werden.')
+    # Einträge compress in cronjobs.json, siehe compress.py
+    compressor = Compressor(config_file)
+    database = db.Database.sqlite("../data/sensordata.db", persistent = True, rollups = True)
+    with database, \
+         TextLog() as textlog:
         jobs = Cronjob(config_file)
-        jobs.start_working(disable_cron = False, on_job_ready = on_job_ready, on_all_jobs_ready = on_all_jobs_ready)
+        if '--async' in sys.argv:
+            import runtime
+            asyncio.run(runtime.run(jobs, database, textlog, listeners = [push.publish], compressor = compressor))
+        else:
+            try:
+                jobs.start_working(disable_cron = False, on_job_ready = on_job_ready, on_all_jobs_ready = on_all_jobs_ready)
+            finally:
+                # Zurückgehaltene Datensätze (swinging_door) beim Beenden speichern.
+                for record in compressor.flush():
+                    database.enqueue(record)
+                    textlog.write(record)
+                database.flush()
 except KeyboardInterrupt:
     print("Cancelled")
 except Exception:
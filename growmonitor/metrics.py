@@ -0,0 +1,168 @@
+"""Einfache Metriken (Counter, Gauge, Histogram) für growmonitor, die über einen lokalen HTTP
+Endpunkt im Textformat von Prometheus abgefragt werden können:
+
+    curl http://127.0.0.1:9101/metrics
+
+Das Aufzeichnen kostet nur einen Lock und eine Binärsuche, damit es in der Hauptschleife und beim
+Schreiben in die Datenbank verwendet werden kann.
+"""
+
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Standardgrenzen in Sekunden für Laufzeiten
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class _Metric:
+    """Basisklasse. Die Werte werden pro Label (z. B. dem Namen des Jobs) gespeichert."""
+    type = None
+
+    def __init__(self, name, help, labelname = None):
+        self.name = name
+        self.help = help
+        self.labelname = labelname
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _label(self, label):
+        if self.labelname is None or label is None:
+            return ''
+        return '{}="{}"'.format(self.labelname, str(label).replace('\\', '\\\\').replace('"', '\\"'))
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} {}'.format(self.name, self.type)]
+        for label, value in self._snapshot():
+            lines.extend(self._render_value(self._label(label), value))
+        return lines
+
+    def _snapshot(self):
+        with self._lock:
+            return list(self._values.items())
+
+    def _render_value(self, label, value):
+        return ['{}{} {}'.format(self.name, '{' + label + '}' if label else '', _format(value))]
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount = 1, label = None):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def total(self):
+        """Liefert die Summe über alle Labels."""
+        with self._lock:
+            return sum(self._values.values())
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value, label = None):
+        with self._lock:
+            self._values[label] = value
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelname = None, buckets = TIME_BUCKETS):
+        super().__init__(name, help, labelname)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, label = None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label)
+            if entry is None:
+                entry = self._values[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def _snapshot(self):
+        with self._lock:
+            return [(label, (list(entry[0]), entry[1], entry[2])) for label, entry in self._values.items()]
+
+    def _render_value(self, label, value):
+        counts, total, count = value
+        prefix = label + ',' if label else ''
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            lines.append('{}_bucket{{{}le="{}"}} {}'.format(self.name, prefix, _format(bound), cumulative))
+        suffix = '{' + label + '}' if label else ''
+        lines.append('{}_sum{} {}'.format(self.name, suffix, _format(total)))
+        lines.append('{}_count{} {}'.format(self.name, suffix, count))
+        return lines
+
+class Registry:
+    """Sammlung aller Metriken. Eine Metrik wird beim ersten Abruf mit ihrem Namen angelegt."""
+
+    def __init__(self):
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def counter(self, name, help, labelname = None):
+        return self.__get(Counter, name, help, labelname)
+
+    def gauge(self, name, help, labelname = None):
+        return self.__get(Gauge, name, help, labelname)
+
+    def histogram(self, name, help, labelname = None, buckets = TIME_BUCKETS):
+        return self.__get(Histogram, name, help, labelname, buckets = buckets)
+
+    def render(self):
+        """Liefert alle Metriken im Textformat von Prometheus."""
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def __get(self, cls, name, help, labelname, **kwargs):
+        with self.__lock:
+            if name not in self.__metrics:
+                self.__metrics[name] = cls(name, help, labelname, **kwargs)
+            return self.__metrics[name]
+
+# Gemeinsame Registry aller Module
+registry = Registry()
+
+def start_server(port = 9101, host = '127.0.0.1'):
+    """Startet den HTTP Server für /metrics in einem eigenen Thread.
+
+    Args:
+        port (int, optional): TCP Port. Defaults to 9101.
+        host (str, optional): Adresse, an die gebunden wird. Defaults to '127.0.0.1' (nur lokal).
+
+    Returns:
+        ThreadingHTTPServer: Der gestartete Server (shutdown() beendet ihn).
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target = server.serve_forever, name = 'metrics', daemon = True).start()
+    logging.info('Metriken unter http://%s:%d/metrics verfügbar.', host, port)
+    return server
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,116 @@
+"""Übernimmt die Sensortabellen (data_*) in das schmale Layout (siehe narrow.py):
+
+    python3 migrate.py ../data/sensordata.db [zieldatei.db] [--drop]
+
+Ohne Zieldatei werden die Tabellen in derselben Datenbank angelegt. Die Zeilen werden in Blöcken
+gelesen und geschrieben (pro Block eine Transaktion), der Speicherbedarf hängt daher nicht von der
+Größe der Tabellen ab. Ein abgebrochener Lauf kann neu gestartet werden, er setzt beim letzten
+übernommenen TIMESTAMP jeder Tabelle fort. Mit --drop werden die Sensortabellen gelöscht, wenn die
+Anzahl der Werte übereinstimmt. In derselben Datenbank bleiben die Rollup Tabellen gültig, in einer
+neuen Zieldatei werden sie mit rollup.py aufgebaut.
+"""
+
+import logging
+import sqlite3
+import sys
+import narrow
+
+# Anzahl der Zeilen einer Sensortabelle pro Transaktion
+CHUNK_SIZE = 10000
+
+def migrate(source, target = None, table_prefix = 'data', drop = False, chunk_size = CHUNK_SIZE):
+    """Kopiert alle Sensortabellen aus source in die Tabelle measurement von target.
+
+    Args:
+        source (sqlite3.Connection): Datenbank mit den Sensortabellen.
+        target (sqlite3.Connection, optional): Zieldatenbank. Defaults to source.
+        table_prefix (str, optional): Prefix der Sensortabellen. Defaults to 'data'.
+        drop (bool, optional): Übernommene Tabellen löschen. Defaults to False.
+        chunk_size (int, optional): Zeilen pro Transaktion. Defaults to CHUNK_SIZE.
+
+    Returns:
+        int: Anzahl der übernommenen Werte.
+    """
+    target = source if target is None else target
+    read_cursor = source.cursor()
+    cursor = target.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    narrow.create_tables(cursor, set(val[0].lower() for val in cursor.fetchall()))
+    target.commit()
+    ids = narrow.load_ids(cursor)
+
+    read_cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'",
+                        (table_prefix + '\\_%',))
+    total = 0
+    for tablename in [val[0] for val in read_cursor.fetchall()]:
+        read_cursor.execute('PRAGMA table_info({})'.format(tablename))
+        columns = [val[1] for val in read_cursor.fetchall() if val[1].upper() not in ('TIMESTAMP', 'SENSOR', 'OFFSET')]
+        sensor = _get_sensor(read_cursor, tablename)
+        resume = _get_resume(cursor, ids, sensor)
+        read_cursor.execute(
+            'SELECT TIMESTAMP, OFFSET, TRIM(SENSOR), {} FROM {} WHERE TIMESTAMP >= ? ORDER BY TIMESTAMP'
+            .format(', '.join(columns), tablename), (resume,))
+        count = 0
+        while True:
+            rows = read_cursor.fetchmany(chunk_size)
+            if len(rows) == 0:
+                break
+            records = [{'TIMESTAMP': row[0], 'OFFSET': row[1], 'SENSOR': row[2], 'VALUE': dict(zip(columns, row[3:]))}
+                       for row in rows]
+            try:
+                cursor.executemany(
+                    'INSERT OR IGNORE INTO {} (SENSOR_ID, VALUETYPE_ID, TIMESTAMP, VALUE) VALUES (?, ?, ?, ?)'
+                    .format(narrow.MEASUREMENT_TABLE), narrow.get_rows(cursor, ids, records))
+                target.commit()
+            except Exception:
+                target.rollback()
+                raise
+            count += cursor.rowcount
+        logging.info('%s: %d Werte übernommen.', tablename, count)
+        total += count
+        if drop:
+            _drop_if_complete(source, cursor, ids, tablename, sensor, columns)
+    return total
+
+def _get_sensor(read_cursor, tablename):
+    """Liefert den Namen des Sensors einer Sensortabelle oder None, wenn sie leer ist."""
+    row = read_cursor.execute('SELECT TRIM(SENSOR) FROM {} LIMIT 1'.format(tablename)).fetchone()
+    return row[0] if row is not None else None
+
+def _get_resume(cursor, ids, sensor):
+    """Liefert den letzten übernommenen TIMESTAMP des Sensors (über die Serie OFFSET, ein Bereich
+    des Primärschlüssels). Ab diesem Zeitpunkt wird neu übernommen, doppelte Zeilen werden ignoriert."""
+    sensor_id = ids[narrow.SENSOR_TABLE].get(sensor)
+    offset_id = ids[narrow.VALUETYPE_TABLE].get('OFFSET')
+    if sensor_id is None or offset_id is None:
+        return -2**62
+    cursor.execute('SELECT MAX(TIMESTAMP) FROM {} WHERE SENSOR_ID = ? AND VALUETYPE_ID = ?'
+                   .format(narrow.MEASUREMENT_TABLE), (sensor_id, offset_id))
+    resume = cursor.fetchone()[0]
+    return resume if resume is not None else -2**62
+
+def _drop_if_complete(source, cursor, ids, tablename, sensor, columns):
+    """Löscht die Sensortabelle, wenn measurement mindestens so viele Werte des Sensors enthält."""
+    expected = source.execute('SELECT {} FROM {}'.format(
+        ' + '.join('COUNT({})'.format(column) for column in columns + ['OFFSET']), tablename)).fetchone()[0]
+    cursor.execute('SELECT COUNT(*) FROM {} WHERE SENSOR_ID = ?'.format(narrow.MEASUREMENT_TABLE),
+                   (ids[narrow.SENSOR_TABLE].get(sensor),))
+    migrated = cursor.fetchone()[0]
+    if migrated < expected:
+        logging.warning('%s nicht gelöscht: %d von %d Werten übernommen.', tablename, migrated, expected)
+        return
+    source.execute('DROP TABLE {}'.format(tablename))
+    source.commit()
+    logging.info('%s gelöscht.', tablename)
+
+if __name__ == '__main__':
+    logging.basicConfig(format = '%(asctime)s %(message)s', level = logging.INFO)
+    args = [arg for arg in sys.argv[1:] if arg != '--drop']
+    source = sqlite3.connect(args[0] if len(args) > 0 else '../data/sensordata.db', timeout = 60)
+    target = sqlite3.connect(args[1], timeout = 60) if len(args) > 1 else None
+    try:
+        logging.info('%d Werte übernommen.', migrate(source, target, drop = '--drop' in sys.argv))
+    finally:
+        source.close()
+        if target is not None:
+            target.close()
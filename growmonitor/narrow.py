@@ -0,0 +1,86 @@
+"""Schmales (langes) Tabellenlayout für db.Database.sqlite(layout = 'narrow').
+
+Statt einer Tabelle pro Sensor mit einer Spalte pro Wert gibt es eine einzige Tabelle measurement
+mit einer Zeile pro Sensor, Werttyp und Zeitpunkt. OFFSET wird als eigener Werttyp gespeichert.
+Die Namen der Sensoren und Werttypen stehen in meta_sensor und meta_valuetype:
+
+    meta_sensor    (ID, NAME)
+    meta_valuetype (ID, NAME)
+    measurement    (SENSOR_ID, VALUETYPE_ID, TIMESTAMP, VALUE)  PRIMARY KEY in dieser Reihenfolge
+
+Der Primärschlüssel ist der (einzige) Index der WITHOUT ROWID Tabelle, ein Zeitraum einer Serie
+ist daher ein zusammenhängender Bereich. Neue Werte eines Treibers brauchen keine neue Spalte.
+Bestehende data_* Tabellen werden mit migrate.py übernommen.
+"""
+
+SENSOR_TABLE = 'meta_sensor'
+VALUETYPE_TABLE = 'meta_valuetype'
+MEASUREMENT_TABLE = 'measurement'
+
+def create_tables(cursor, tables):
+    """Legt die Tabellen an, wenn sie in tables (Namen in Kleinbuchstaben) fehlen."""
+    for tablename in (SENSOR_TABLE, VALUETYPE_TABLE):
+        if tablename not in tables:
+            cursor.execute('CREATE TABLE IF NOT EXISTS {} (ID INTEGER PRIMARY KEY, NAME TEXT NOT NULL UNIQUE)'
+                           .format(tablename))
+            tables.add(tablename)
+    if MEASUREMENT_TABLE not in tables:
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS {} (SENSOR_ID INTEGER NOT NULL, VALUETYPE_ID INTEGER NOT NULL, '
+            'TIMESTAMP INTEGER NOT NULL, VALUE REAL, '
+            'PRIMARY KEY (SENSOR_ID, VALUETYPE_ID, TIMESTAMP)) WITHOUT ROWID'.format(MEASUREMENT_TABLE))
+        tables.add(MEASUREMENT_TABLE)
+
+def load_ids(cursor):
+    """Liest die IDs aller Sensoren und Werttypen.
+
+    Returns:
+        dict: {SENSOR_TABLE: {NAME: ID}, VALUETYPE_TABLE: {NAME: ID}}
+    """
+    ids = {}
+    for tablename in (SENSOR_TABLE, VALUETYPE_TABLE):
+        cursor.execute('SELECT NAME, ID FROM {}'.format(tablename))
+        ids[tablename] = dict(cursor.fetchall())
+    return ids
+
+def get_id(cursor, ids, tablename, name):
+    """Liefert die ID des Namens aus dem Cache und legt einen neuen Namen in der Tabelle an."""
+    cache = ids[tablename]
+    if name not in cache:
+        cursor.execute('INSERT OR IGNORE INTO {} (NAME) VALUES (?)'.format(tablename), (name,))
+        cursor.execute('SELECT ID FROM {} WHERE NAME = ?'.format(tablename), (name,))
+        cache[name] = cursor.fetchone()[0]
+    return cache[name]
+
+def get_rows(cursor, ids, records):
+    """Zerlegt die Datensätze (Format von db._prepare_record) in Zeilen für measurement. Leere
+    Werte werden nicht gespeichert.
+
+    Returns:
+        list: Tupel (SENSOR_ID, VALUETYPE_ID, TIMESTAMP, VALUE)
+    """
+    rows = []
+    for record in records:
+        sensor_id = get_id(cursor, ids, SENSOR_TABLE, str(record['SENSOR']).strip())
+        values = dict(record['VALUE'])
+        values['OFFSET'] = record['OFFSET']
+        for valuetype, value in values.items():
+            if value is None:
+                continue
+            rows.append((sensor_id, get_id(cursor, ids, VALUETYPE_TABLE, valuetype),
+                         record['TIMESTAMP'], float(value)))
+    return rows
+
+def insert(cursor, ids, records):
+    """Schreibt die Datensätze in measurement. Liefert ein Sensor zweimal in derselben Sekunde
+    einen Wert, gilt der letzte.
+
+    Returns:
+        int: Anzahl der geschriebenen Zeilen.
+    """
+    rows = get_rows(cursor, ids, records)
+    cursor.executemany(
+        'INSERT INTO {} (SENSOR_ID, VALUETYPE_ID, TIMESTAMP, VALUE) VALUES (?, ?, ?, ?) '
+        'ON CONFLICT (SENSOR_ID, VALUETYPE_ID, TIMESTAMP) DO UPDATE SET VALUE = excluded.VALUE'
+        .format(MEASUREMENT_TABLE), rows)
+    return len(rows)
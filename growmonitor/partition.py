@@ -0,0 +1,212 @@
+"""Eine SQLite Datenbank pro Kalendermonat (UTC) statt einer einzigen sensordata.db.
+
+db.Database.partitioned schreibt jeden Datensatz nach seinem TIMESTAMP in die Datei
+sensordata_JJJJ-MM.db im Verzeichnis der Partitionen. Jede Datei enthält die Sensortabellen und
+(mit rollups) die Rollup Tabellen des Monats, die Blöcke der Rollups enden immer an der
+Monatsgrenze. query.Query liest ein Verzeichnis mit Partitionen und hängt nur die Dateien an
+(ATTACH), die der abgefragte Zeitraum berührt.
+
+Ist ein Monat seit close_after Sekunden vorbei, wird seine Datei abgeschlossen: Sie wird mit
+PRAGMA optimize und VACUUM optimiert, vom WAL Modus auf ein Rollback Journal umgestellt (es bleibt
+nur die .db Datei) und schreibgeschützt. Kommt später noch ein Datensatz für diesen Monat (z. B.
+aus der Warteschlange nach einem Ausfall), wird sie wieder beschreibbar gemacht und erneut
+abgeschlossen.
+
+Alte Daten werden durch das Löschen der Dateien entfernt, ein VACUUM der ganzen Datenbank ist
+nicht nötig. Ein defekter Sektor betrifft nur einen Monat.
+
+main.py schreibt noch in die einzelne sensordata.db: Die R API, replicate.py, importlog.py und
+archive.py lesen nur diese Datei und würden mit Partitionen keine neuen Daten mehr sehen.
+
+    python3 partition.py ../data/partitions --keep=24                     Monate älter als 24 Monate löschen
+    python3 partition.py ../data/partitions --split=../data/sensordata.db eine bestehende Datenbank aufteilen
+"""
+
+import calendar
+import glob
+import logging
+import os
+import re
+import sqlite3
+import stat
+import sys
+import time
+import rollup
+
+FILENAME = 'sensordata_{}.db'
+# Sekunden nach dem Monatsende, nach denen eine Partition abgeschlossen wird (nachgeholte Termine)
+CLOSE_AFTER = 86400
+
+def month_start(timestamp):
+    """Liefert den Beginn (UTC) des Monats, in dem timestamp liegt."""
+    date = time.gmtime(timestamp)
+    return calendar.timegm((date.tm_year, date.tm_mon, 1, 0, 0, 0))
+
+def next_month(timestamp):
+    """Liefert den Beginn (UTC) des folgenden Monats."""
+    date = time.gmtime(timestamp)
+    return calendar.timegm((date.tm_year + date.tm_mon // 12, date.tm_mon % 12 + 1, 1, 0, 0, 0))
+
+def filename(directory, timestamp):
+    """Liefert den Dateinamen der Partition, in die timestamp gehört."""
+    return os.path.join(directory, FILENAME.format(time.strftime('%Y-%m', time.gmtime(timestamp))))
+
+def find(directory, start = None, end = None):
+    """Liefert die vorhandenen Partitionen, die den Zeitraum start bis end (inklusive) berühren.
+
+    Returns:
+        list: Tupel (Beginn, Ende exklusiv, Dateiname) sortiert nach Beginn.
+    """
+    pattern = re.compile(re.escape(FILENAME).replace(r'\{\}', r'(\d{4})-(\d{2})') + '$')
+    partitions = []
+    for path in glob.glob(os.path.join(glob.escape(directory), FILENAME.format('*'))):
+        match = pattern.match(os.path.basename(path))
+        if match is None:
+            continue
+        begin = calendar.timegm((int(match.group(1)), int(match.group(2)), 1, 0, 0, 0))
+        if (start is None or next_month(begin) > start) and (end is None or begin <= end):
+            partitions.append((begin, next_month(begin), path))
+    return sorted(partitions)
+
+def is_closed(path):
+    """Liefert True, wenn die Partition abgeschlossen (schreibgeschützt) ist."""
+    return os.path.isfile(path) and not os.stat(path).st_mode & stat.S_IWUSR
+
+def close(path):
+    """Optimiert die Partition und macht sie schreibgeschützt."""
+    conn = sqlite3.connect(path, timeout = 60)
+    try:
+        conn.execute('PRAGMA journal_mode = DELETE')
+        conn.execute('PRAGMA optimize')
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+    mode = os.stat(path).st_mode
+    os.chmod(path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+    logging.info('Partition %s abgeschlossen.', path)
+
+def reopen(path):
+    """Macht eine abgeschlossene Partition wieder beschreibbar."""
+    os.chmod(path, os.stat(path).st_mode | stat.S_IWUSR)
+    logging.warning('Abgeschlossene Partition %s wird wieder beschrieben.', path)
+
+def close_expired(directory, close_after = CLOSE_AFTER, now = None, skip = ()):
+    """Schließt alle Partitionen ab, deren Monat seit close_after Sekunden vorbei ist.
+
+    Args:
+        skip (set, optional): Dateinamen, die noch geöffnet sind und übersprungen werden.
+    """
+    now = time.time() if now is None else now
+    for begin, end, path in find(directory):
+        if end + close_after <= now and path not in skip and not is_closed(path):
+            close(path)
+
+def remove(directory, before):
+    """Löscht die Partitionen, deren Monat vor before endet.
+
+    Returns:
+        list: Die gelöschten Dateinamen.
+    """
+    removed = []
+    for begin, end, path in find(directory):
+        if end <= before:
+            for suffix in ('', '-wal', '-shm', '-journal'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            removed.append(path)
+            logging.info('Partition %s gelöscht.', path)
+    return removed
+
+def split(source, directory, table_prefix = 'data'):
+    """Kopiert die Sensortabellen einer einzelnen Datenbank in die Partitionen. Vorhandene
+    TIMESTAMPs bleiben unverändert. Die Rollups werden mit kopiert und für die Monate, deren
+    Rohdaten nicht archiviert sind (siehe archive.py), aus den Rohdaten neu berechnet.
+
+    Returns:
+        int: Anzahl der kopierten Zeilen.
+    """
+    # Erst hier importiert, archive importiert dieses Modul.
+    import archive
+    os.makedirs(directory, exist_ok = True)
+    conn = sqlite3.connect(source, timeout = 60)
+    total = 0
+    try:
+        tables = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'",
+                              (table_prefix + '\\_%',)).fetchall()
+        rollups = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                               (rollup.table_name(rollup.LEVELS[0]),)).fetchone() is not None
+        archived = {name: archive.get_archived_until(conn, name) for name, sql in tables}
+        bounds = [conn.execute('SELECT MIN(TIMESTAMP), MAX(TIMESTAMP) FROM {}'.format(name)).fetchone() for name, sql in tables]
+        # Archivierte Monate gibt es nur noch in den Rollups.
+        if rollups:
+            bounds.append(conn.execute('SELECT MIN(BUCKET), MAX(BUCKET) FROM {}'.format(rollup.table_name(rollup.LEVELS[-1]))).fetchone())
+        bounds = [row for row in bounds if row[0] is not None]
+        if len(bounds) == 0:
+            return 0
+        month = month_start(min(row[0] for row in bounds))
+        while month <= max(row[1] for row in bounds):
+            end = next_month(month)
+            path = filename(directory, month)
+            if is_closed(path):
+                reopen(path)
+            if rollups:
+                target = sqlite3.connect(path, timeout = 60)
+                try:
+                    rollup.create_tables(target.cursor(), set())
+                    target.commit()
+                finally:
+                    target.close()
+            conn.execute('ATTACH DATABASE ? AS part', (path,))
+            try:
+                count = 0
+                copied = []
+                if rollups:
+                    for level in rollup.LEVELS:
+                        conn.execute('INSERT OR IGNORE INTO part.{0} SELECT * FROM main.{0} WHERE BUCKET >= ? AND BUCKET < ?'
+                                     .format(rollup.table_name(level)), (month, end))
+                existing = set(val[0] for val in conn.execute("SELECT name FROM part.sqlite_master WHERE type = 'table'"))
+                for name, sql in tables:
+                    if conn.execute('SELECT 1 FROM {} WHERE TIMESTAMP >= ? AND TIMESTAMP < ? LIMIT 1'.format(name),
+                                    (month, end)).fetchone() is None:
+                        continue
+                    copied.append(name)
+                    if name not in existing:
+                        conn.execute(re.sub(r'^CREATE TABLE\s+"?' + re.escape(name) + '"?', 'CREATE TABLE part.' + name, sql))
+                    columns = [val[1] for val in conn.execute('PRAGMA main.table_info({})'.format(name))]
+                    before = conn.total_changes
+                    conn.execute('INSERT OR IGNORE INTO part.{0} ({1}) SELECT {1} FROM main.{0} WHERE TIMESTAMP >= ? AND TIMESTAMP < ?'
+                                 .format(name, ', '.join(columns)), (month, end))
+                    count += conn.total_changes - before
+                conn.commit()
+            finally:
+                conn.execute('DETACH DATABASE part')
+            if count > 0 and rollups:
+                target = sqlite3.connect(path, timeout = 60)
+                try:
+                    for name in copied:
+                        start = month if archived[name] is None else max(month, archived[name])
+                        if start < end:
+                            rollup.backfill(target, table_prefix, [name], start, end - 1)
+                finally:
+                    target.close()
+            logging.info('%s: %d Zeilen kopiert.', path, count)
+            total += count
+            month = end
+    finally:
+        conn.close()
+    return total
+
+if __name__ == '__main__':
+    logging.basicConfig(format = '%(asctime)s %(message)s', level = logging.INFO)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    directory = args[0] if len(args) > 0 else '../data/partitions'
+    for arg in sys.argv[1:]:
+        if arg.startswith('--split='):
+            logging.info('%d Zeilen kopiert.', split(arg[8:], directory))
+        elif arg.startswith('--keep='):
+            # Der aktuelle und die keep - 1 vorherigen Monate bleiben erhalten.
+            before = month_start(time.time())
+            for i in range(int(arg[7:]) - 1):
+                before = month_start(before - 1)
+            remove(directory, before)
+    close_expired(directory)
@@ -0,0 +1,162 @@
+"""Liefert neue Messwerte sofort an verbundene Clients (Server-Sent Events), ohne die Datenbank zu
+lesen. main.on_job_ready übergibt jeden Datensatz an PushServer.publish.
+
+    GET /events   Stream im Format text/event-stream. Jedes Event enthält einen Datensatz
+                  (TIMESTAMP, OFFSET, SENSOR, VALUE) als JSON. Nach einem Verbindungsabbruch sendet
+                  der Browser (EventSource) den Header Last-Event-ID, die verpassten Datensätze
+                  werden dann aus dem Replay Puffer nachgeliefert. Alternativ ?last_event_id=...
+    GET /latest   Der letzte Datensatz jedes Sensors als JSON.
+
+Die Datensätze liegen in einem Ringpuffer (collections.deque), den alle Clients gemeinsam lesen.
+publish kostet daher nur einen Lock und ein notify_all, egal wie viele Clients verbunden sind.
+
+Ohne Angabe von host ist der Server nur lokal erreichbar. Soll das Dashboard den Stream direkt
+lesen, wird an alle Adressen gebunden und token angegeben: Die Pfade lauten dann wie bei der R API
+/<token>/events und /<token>/latest, alle anderen Pfade liefern 404. Browser anderer Seiten dürfen
+den Stream nicht lesen, CORS erlaubt nur Seiten auf demselben Host (z. B. die R API auf Port 80).
+"""
+
+import collections
+import itertools
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+class PushServer:
+    """HTTP Server für Server-Sent Events mit Replay Puffer."""
+
+    def __init__(self, port = 9102, host = '127.0.0.1', replay = 1000, heartbeat = 15, token = None):
+        """Konstruktor
+
+        Args:
+            port (int, optional): TCP Port. Defaults to 9102.
+            host (str, optional): Adresse, an die gebunden wird. Defaults to '127.0.0.1' (nur lokal).
+            replay (int, optional): Anzahl der Datensätze im Replay Puffer. Defaults to 1000.
+            heartbeat (int, optional): Sekunden ohne Datensatz, nach denen ein Kommentar gesendet
+                wird, damit Proxies die Verbindung offen lassen. Defaults to 15.
+            token (str, optional): Geheimer erster Teil des Pfades. Muss angegeben werden, wenn der
+                Server nicht nur lokal erreichbar ist. Defaults to None.
+
+        Raises:
+            ValueError: Wenn host nicht lokal ist und kein token angegeben wurde.
+        """
+        if token is None and host not in ('127.0.0.1', 'localhost', '::1'):
+            raise ValueError('Ohne token darf der Push Server nur an 127.0.0.1 gebunden werden, nicht an {}.'.format(host))
+        self.__address = (host, port)
+        self.__prefix = '' if token is None else '/' + token
+        self.__heartbeat = heartbeat
+        # Die IDs beginnen nach einem Neustart wieder bei 1, der Prefix erkennt IDs eines früheren Prozesses.
+        self.__epoch = str(int(time.time()))
+        self.__events = collections.deque(maxlen = replay)
+        self.__latest = {}
+        self.__sequence = 0
+        self.__condition = threading.Condition()
+        self.__server = None
+
+    def publish(self, data):
+        """Stellt einen Datensatz in den Replay Puffer und weckt alle Clients auf."""
+        try:
+            message = json.dumps(data, default = str)
+        except Exception:
+            logging.exception('Datensatz kann nicht als JSON gesendet werden: %s', data)
+            return
+        with self.__condition:
+            self.__sequence += 1
+            self.__events.append((self.__sequence, message))
+            self.__latest[data.get('SENSOR')] = message
+            self.__condition.notify_all()
+
+    def start(self):
+        """Startet den Server in einem eigenen Thread. Jeder Client bekommt einen eigenen Thread."""
+        # Innerhalb von Handler würden die privaten Namen auf Handler umgeschrieben.
+        stream, send_latest, prefix = self.__stream, self.__send_latest, self.__prefix
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == prefix + '/events':
+                    last_id = parse_qs(url.query).get('last_event_id', [self.headers.get('Last-Event-ID')])[0]
+                    stream(self, last_id)
+                elif url.path == prefix + '/latest':
+                    send_latest(self)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer(self.__address, Handler)
+        self.__server.daemon_threads = True
+        threading.Thread(target = self.__server.serve_forever, name = 'push', daemon = True).start()
+        logging.info('Live Daten auf %s:%d verfügbar.', *self.__address)
+        return self
+
+    def stop(self):
+        """Beendet den Server und alle Streams."""
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+            with self.__condition:
+                self.__condition.notify_all()
+
+    def __get_start(self, last_id):
+        """Liefert die Sequenznummer, ab der gesendet wird. Ohne (gültige) ID des aktuellen Prozesses
+        wird der ganze Replay Puffer gesendet."""
+        if last_id is not None:
+            epoch, _, sequence = last_id.partition('-')
+            if epoch == self.__epoch and sequence.isdigit():
+                return int(sequence)
+        return 0
+
+    def __stream(self, handler, last_id):
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Cache-Control', 'no-cache')
+        _send_cors_header(handler)
+        handler.end_headers()
+        sent = self.__get_start(last_id)
+        try:
+            handler.wfile.write(b'retry: 5000\n\n')
+            handler.wfile.flush()
+            while self.__server is not None:
+                with self.__condition:
+                    if self.__sequence <= sent:
+                        self.__condition.wait(self.__heartbeat)
+                    # Die Sequenznummern im Puffer sind lückenlos, die neuen Datensätze sind die
+                    # letzten count Einträge. Ist der Client zu weit zurück, beginnt er beim ältesten.
+                    count = min(self.__sequence - sent, len(self.__events))
+                    pending = list(itertools.islice(self.__events, len(self.__events) - count, None))
+                if len(pending) == 0:
+                    handler.wfile.write(b': heartbeat\n\n')
+                else:
+                    handler.wfile.write(''.join('id: {}-{}\ndata: {}\n\n'.format(self.__epoch, sequence, message)
+                                                for sequence, message in pending).encode('utf-8'))
+                    sent = pending[-1][0]
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def __send_latest(self, handler):
+        with self.__condition:
+            body = ('[' + ','.join(self.__latest.values()) + ']').encode('utf-8')
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        _send_cors_header(handler)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+def _send_cors_header(handler):
+    """Erlaubt den Zugriff nur Seiten, die auf demselben Host (mit einem anderen Port) liegen. Die
+    Seiten anderer Hosts bekommen keinen Header, der Browser verweigert ihnen dann die Antwort."""
+    origin = handler.headers.get('Origin')
+    host = handler.headers.get('Host')
+    if origin is None or host is None:
+        return
+    if urlparse(origin).hostname == urlparse('//' + host).hostname:
+        handler.send_header('Access-Control-Allow-Origin', origin)
+        handler.send_header('Vary', 'Origin')
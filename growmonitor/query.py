@@ -0,0 +1,442 @@
+"""Abfragen der Sensordaten als NumPy Arrays für eigene Auswertungen und Webfrontends.
+
+Die Ergebnisse sind spaltenweise aufgebaut (dict mit Spaltenname -> numpy.ndarray). Das Bilden
+der Blöcke sowie MIN, MAX, AVG und der Anteil fehlender Blöcke werden vektorisiert berechnet.
+Sind die Rollup Tabellen (siehe rollup.py) vorhanden, werden sie für Blockgrößen verwendet, die
+ein Vielfaches einer Rollup Blockgröße sind. Beide Tabellenlayouts (eine Tabelle pro Sensor oder
+die Tabelle measurement aus narrow.py) werden unterstützt. Mit archive werden die Rohwerte von
+get_series zusätzlich aus dem Archiv (siehe archive.py) gelesen. Für verdichtete Sensoren (siehe
+compress.py) rekonstruiert get_series mit fill eine Serie mit festem Raster.
+
+Ist filename ein Verzeichnis mit Partitionen (siehe partition.py), werden für jede Abfrage nur die
+Partitionen angehängt (ATTACH, nur lesend), die der Zeitraum berührt. Jede Tabelle wird dann durch
+eine TEMP VIEW gleichen Namens ersetzt, die die Tabellen der Partitionen mit UNION ALL verbindet.
+Berührt ein Zeitraum mehr Partitionen, als SQLite gleichzeitig anhängen kann, liest get_series den
+Zeitraum in Teilen.
+"""
+
+import os
+import sqlite3
+import time
+import urllib.parse
+import numpy as np               # pip install numpy
+import compress
+import narrow
+import partition
+import rollup
+from archive import Archive
+
+# Sekunden vor start und nach end, in denen für fill die angrenzenden gespeicherten Werte gesucht werden
+FILL_LOOKAROUND = 3600
+
+class Query:
+    """Lesezugriff auf die von db.Database geschriebene SQLite Datenbank."""
+
+    def __init__(self, filename, table_prefix = 'data', layout = None, archive = None):
+        """Konstruktor
+
+        Args:
+            filename (str): Dateiname der SQLite Datenbank oder Verzeichnis der Partitionen.
+            table_prefix (str, optional): Prefix der Sensortabellen. Defaults to 'data'.
+            layout (str, optional): wide oder narrow (siehe db.Database.sqlite). Ohne Angabe wird
+                narrow verwendet, wenn die Tabelle measurement existiert. Partitionen sind immer wide.
+            archive (str, optional): Verzeichnis des Archivs (siehe archive.py). Defaults to None.
+        """
+        self.__filename = filename
+        self.__table_prefix = table_prefix
+        self.__layout = layout
+        self.__narrow = layout == 'narrow'
+        self.__archive = Archive(archive) if archive is not None else None
+        self.__conn = None
+        self.__partitioned = os.path.isdir(filename)
+        self.__attached = None
+
+    def __enter__(self):
+        if self.__partitioned:
+            self.__conn = sqlite3.connect(':memory:')
+            self.__narrow = False
+            # Bis zum ersten Zeitraum sind die neuesten Partitionen angehängt (für get_tables).
+            found = partition.find(self.__filename)
+            self.__attach(found[len(found) - self.__get_attach_limit():])
+            return self
+        self.__conn = sqlite3.connect(self.__filename)
+        if self.__layout is None:
+            self.__narrow = self.__conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                                (narrow.MEASUREMENT_TABLE,)).fetchone() is not None
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__conn.close()
+        self.__conn = None
+        self.__attached = None
+
+    def get_series(self, sensor, valuetype, start, end, bucket = None, fill = None, interval = 60, max_gap = None):
+        """Liefert die Werte eines Sensors im Zeitraum start bis end (inklusive).
+
+        Args:
+            sensor (str): Name des Sensors aus cronjobs.json, z. B. BME280_BOX.
+            valuetype (str): Name des Wertes, z. B. TEMP oder OFFSET.
+            start (int): Beginn als UNIX Timestamp.
+            end (int): Ende als UNIX Timestamp.
+            bucket (int, optional): Blockgröße in Sekunden. Ohne Angabe werden die Rohwerte geliefert.
+            fill (str, optional): step oder linear (siehe compress.reconstruct). Die Werte werden
+                dann im Raster interval rekonstruiert, auch die Blöcke werden aus dem Raster
+                berechnet (ohne Rollup Tabellen). Defaults to None.
+            interval (int, optional): Raster für fill in Sekunden. Defaults to 60.
+            max_gap (int, optional): Siehe compress.reconstruct. Defaults to None.
+
+        Returns:
+            dict: Ohne bucket {TIMESTAMP, VALUE}, sonst {TIMESTAMP, CNT, AVG, MIN, MAX} als Arrays.
+                  TIMESTAMP ist bei Blöcken der Beginn des Blocks.
+        """
+        if fill is not None:
+            lookaround = max_gap if max_gap is not None else FILL_LOOKAROUND
+            timestamps, values = self.__read_raw(sensor, valuetype, start - lookaround, end + lookaround)
+            valid = ~np.isnan(values)
+            grid = np.arange(-(-start // interval) * interval, end + 1, interval, dtype = np.int64)
+            values = compress.reconstruct(timestamps[valid], values[valid], grid, fill, max_gap)
+            if bucket is None:
+                return {'TIMESTAMP': grid, 'VALUE': values}
+            valid = ~np.isnan(values)
+            grid, values = grid[valid], values[valid]
+            return _reduce_buckets(grid // bucket * bucket, np.ones_like(values), values, values, values)
+
+        ranges = self.__split_range(start, end)
+        self.__use_range(*ranges[0])
+        level = self.__get_rollup_level(bucket)
+        if level is not None:
+            rows = []
+            for part_start, part_end in ranges:
+                self.__use_range(part_start, part_end)
+                rows += self.__conn.execute(
+                    'SELECT BUCKET, CNT, SUM, MIN, MAX FROM {} WHERE SENSOR = ? AND VALUETYPE = ? '
+                    'AND BUCKET >= ? AND BUCKET <= ? ORDER BY BUCKET'.format(rollup.table_name(level)),
+                    (sensor, valuetype, part_start // level * level, part_end)).fetchall()
+            data = np.array(rows, dtype = np.float64).reshape(-1, 5)
+            return _reduce_buckets(data[:, 0].astype(np.int64) // bucket * bucket,
+                                   data[:, 1], data[:, 2], data[:, 3], data[:, 4])
+
+        timestamps, values = self.__read_raw(sensor, valuetype, start, end)
+        if bucket is None:
+            return {'TIMESTAMP': timestamps, 'VALUE': values}
+        valid = ~np.isnan(values)
+        timestamps, values = timestamps[valid], values[valid]
+        return _reduce_buckets(timestamps // bucket * bucket, np.ones_like(values), values, values, values)
+
+    def get_stats(self, hours = 24, max_missing = 0.1, now = None):
+        """Liefert die Daten für den Startbildschirm wie getStats in sensordata_api.r: Die Werte
+        werden in 10 Minuten Blöcke verdichtet, darüber werden AVG, MIN und MAX gebildet. Fehlen
+        mehr als max_missing der Blöcke, sind AVG, MIN und MAX NaN. Der letzte Wert wird nur aus
+        der letzten Stunde berücksichtigt.
+
+        Args:
+            hours (int, optional): Zeitraum in Stunden. Defaults to 24.
+            max_missing (float, optional): Erlaubter Anteil fehlender Blöcke. Defaults to 0.1.
+            now (int, optional): Aktuelle Zeit als UNIX Timestamp. Defaults to time.time().
+
+        Returns:
+            dict: {SENSOR, VALUETYPE, AVG, MIN, MAX, MISSING, LAST_TIMESTAMP, LAST_VALUE, AGE_SEC}
+                  als Arrays mit einer Zeile pro Sensor und Werttyp.
+        """
+        now = int(time.time()) if now is None else int(now)
+        endtime = now // 600 * 600
+        starttime = endtime - int(hours) * 3600
+        self.__use_range(min(starttime, now - 3600), now)
+        sensors, valuetypes, buckets, cnt, sums, mins, maxs = self.__read_10min(starttime, endtime)
+
+        # Zeilen gleicher Serie folgen aufeinander (ORDER BY SENSOR, VALUETYPE, BUCKET).
+        series = np.char.add(np.char.add(sensors.astype(str), '\t'), valuetypes.astype(str))
+        starts = _group_starts(series)
+        avg = sums / cnt
+        count = np.diff(np.append(starts, len(series)))
+        missing = 1 - count / ((endtime - starttime) // 600 + 1)
+        ok = missing <= max_missing
+        result = {
+            'SENSOR': sensors[starts],
+            'VALUETYPE': valuetypes[starts],
+            'AVG': np.where(ok, np.round(np.add.reduceat(avg, starts) / np.maximum(count, 1), 1), np.nan),
+            'MIN': np.where(ok, np.minimum.reduceat(mins, starts), np.nan),
+            'MAX': np.where(ok, np.maximum.reduceat(maxs, starts), np.nan),
+            'MISSING': missing
+        } if len(series) > 0 else {
+            'SENSOR': sensors, 'VALUETYPE': valuetypes, 'AVG': avg, 'MIN': mins, 'MAX': maxs, 'MISSING': avg
+        }
+
+        last = self.__read_last(now - 3600, now)
+        keys = [(s, v) for s, v in zip(result['SENSOR'], result['VALUETYPE'])]
+        result['LAST_TIMESTAMP'] = np.array([last.get(key, (np.nan, np.nan))[0] for key in keys], dtype = np.float64)
+        result['LAST_VALUE'] = np.array([last.get(key, (np.nan, np.nan))[1] for key in keys], dtype = np.float64)
+        result['AGE_SEC'] = now - result['LAST_TIMESTAMP']
+        return result
+
+    def get_tables(self):
+        """Liefert die Namen der Sensortabellen (bei Partitionen die der angehängten Partitionen)."""
+        prefix = self.__table_prefix.lower() + '_'
+        return [name for name in self.__get_names() if name.lower().startswith(prefix)]
+
+    def get_valuetypes(self, sensor, start = None, end = None):
+        """Liefert die Werttypen eines Sensors (ohne OFFSET), bei Partitionen die der Partitionen im
+        Zeitraum start bis end."""
+        valuetypes = []
+        for part_start, part_end in self.__split_range(start, end):
+            self.__use_range(part_start, part_end)
+            if self.__narrow:
+                names = [val[0] for val in self.__conn.execute(
+                    'SELECT v.NAME FROM {} s CROSS JOIN {} v WHERE s.NAME = ? COLLATE NOCASE AND EXISTS '
+                    '(SELECT 1 FROM {} m WHERE m.SENSOR_ID = s.ID AND m.VALUETYPE_ID = v.ID)'
+                    .format(narrow.SENSOR_TABLE, narrow.VALUETYPE_TABLE, narrow.MEASUREMENT_TABLE), (sensor,))]
+            else:
+                tablename = '{}_{}'.format(self.__table_prefix, sensor).lower()
+                names = self.__get_columns(tablename) if tablename in self.get_tables() else []
+            valuetypes += [name for name in names if name.upper() != 'OFFSET' and name not in valuetypes]
+        return valuetypes
+
+    def __get_names(self):
+        """Liefert die Namen der Tabellen, bei Partitionen die Namen der TEMP VIEWs."""
+        if self.__partitioned:
+            return [val[0] for val in self.__conn.execute("SELECT name FROM sqlite_temp_master WHERE type = 'view'")]
+        return [val[0] for val in self.__conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+
+    def __get_attach_limit(self):
+        """Liefert die Anzahl der Datenbanken, die gleichzeitig angehängt werden können."""
+        return self.__conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+
+    def __split_range(self, start, end):
+        """Teilt den Zeitraum an den Monatsgrenzen so auf, dass jeder Teil höchstens so viele
+        Partitionen berührt, wie angehängt werden können. Ohne Partitionen wird der Zeitraum
+        unverändert geliefert.
+
+        Returns:
+            list: Tupel (Beginn, Ende inklusive), mindestens eines.
+        """
+        if not self.__partitioned:
+            return [(start, end)]
+        found = partition.find(self.__filename, start, end)
+        limit = self.__get_attach_limit()
+        ranges = []
+        for index in range(0, len(found), limit):
+            parts = found[index:index + limit]
+            ranges.append((start if index == 0 else parts[0][0], end if index + limit >= len(found) else parts[-1][1] - 1))
+        return ranges if len(ranges) > 0 else [(start, end)]
+
+    def __use_range(self, start, end):
+        """Hängt die Partitionen an, die der Zeitraum berührt.
+
+        Raises:
+            ValueError: Wenn der Zeitraum mehr Partitionen berührt, als angehängt werden können.
+        """
+        if not self.__partitioned:
+            return
+        found = partition.find(self.__filename, start, end)
+        if len(found) > self.__get_attach_limit():
+            raise ValueError('Der Zeitraum umfasst {} Partitionen, höchstens {} können angehängt werden.'
+                             .format(len(found), self.__get_attach_limit()))
+        self.__attach(found)
+
+    def __attach(self, parts):
+        """Hängt die Partitionen an (bereits angehängte bleiben) und erstellt die TEMP VIEWs."""
+        paths = [path for begin, end, path in parts]
+        if paths == self.__attached:
+            return
+        for name in self.__get_names():
+            self.__conn.execute('DROP VIEW temp.{}'.format(name))
+        schemas = [val[1] for val in self.__conn.execute('PRAGMA database_list') if val[1] not in ('main', 'temp')]
+        for schema in schemas:
+            self.__conn.execute('DETACH DATABASE {}'.format(schema))
+        self.__attached = None
+        # Spalten pro Tabelle in der Reihenfolge, in der sie in den Partitionen vorkommen.
+        tables = {}
+        for index, path in enumerate(paths):
+            schema = 'p{}'.format(index)
+            uri = 'file:{}?mode=ro'.format(urllib.parse.quote(os.path.abspath(path)))
+            self.__conn.execute('ATTACH DATABASE ? AS {}'.format(schema), (uri,))
+            for (name,) in self.__conn.execute(
+                    "SELECT name FROM {}.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\'"
+                    .format(schema)).fetchall():
+                columns = tables.setdefault(name.lower(), (name, {}))[1]
+                for val in self.__conn.execute('PRAGMA {}.table_info({})'.format(schema, name)):
+                    columns.setdefault(val[1].upper(), val[1])
+        for key, (name, columns) in tables.items():
+            selects = []
+            for index in range(len(paths)):
+                schema = 'p{}'.format(index)
+                existing = set(val[1].upper() for val in self.__conn.execute('PRAGMA {}.table_info({})'.format(schema, name)))
+                if len(existing) == 0:
+                    continue
+                selects.append('SELECT {} FROM {}.{}'.format(
+                    ', '.join(column if column.upper() in existing else 'NULL AS {}'.format(column)
+                              for column in columns.values()), schema, name))
+            self.__conn.execute('CREATE TEMP VIEW {} AS {}'.format(name, ' UNION ALL '.join(selects)))
+        self.__attached = paths
+
+    def __get_columns(self, tablename):
+        """Liefert die Wertespalten (inklusive OFFSET) einer Sensortabelle."""
+        return [val[1] for val in self.__conn.execute('PRAGMA table_info({})'.format(tablename))
+                if val[1].upper() not in ('TIMESTAMP', 'SENSOR')]
+
+    def __get_rollup_level(self, bucket):
+        """Liefert die größte Rollup Blockgröße, durch die bucket teilbar ist, wenn die Tabelle existiert."""
+        if bucket is None:
+            return None
+        tables = set(self.__get_names())
+        for level in sorted(rollup.LEVELS, reverse = True):
+            if bucket % level == 0 and rollup.table_name(level) in tables:
+                return level
+        return None
+
+    def __read_raw(self, sensor, valuetype, start, end):
+        """Liest TIMESTAMP und eine Wertespalte eines Sensors aus Archiv und Datenbank."""
+        if self.__archive is None:
+            return self.__read_live(sensor, valuetype, start, end)
+        archived = self.__archive.read(sensor, valuetype, start, end)
+        try:
+            live = self.__read_live(sensor, valuetype, start, end)
+        except ValueError:
+            if len(self.__archive.get_months(sensor)) == 0:
+                raise
+            return archived
+        # Archivierte Monate liegen vor den Zeilen der Datenbank, nach einem Abbruch des Archivierens
+        # kann es Überschneidungen geben.
+        timestamps, index = np.unique(np.concatenate([live[0], archived[0]]), return_index = True)
+        return timestamps, np.concatenate([live[1], archived[1]])[index]
+
+    def __read_live(self, sensor, valuetype, start, end):
+        """Liest TIMESTAMP und eine Wertespalte eines Sensors, bei Partitionen in Teilen."""
+        ranges = self.__split_range(start, end)
+        if len(ranges) == 1:
+            self.__use_range(start, end)
+            return self.__read_table(sensor, valuetype, start, end)
+        parts = []
+        for part_start, part_end in ranges:
+            self.__use_range(part_start, part_end)
+            try:
+                parts.append(self.__read_table(sensor, valuetype, part_start, part_end))
+            except ValueError:
+                # Der Sensor fehlt nur in einem Teil des Zeitraums.
+                continue
+        if len(parts) == 0:
+            raise ValueError('Sensor {} mit Wert {} nicht gefunden.'.format(sensor, valuetype))
+        return np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts])
+
+    def __read_table(self, sensor, valuetype, start, end):
+        """Liest TIMESTAMP und eine Wertespalte eines Sensors. Es werden nur die beiden Spalten gelesen."""
+        if self.__narrow:
+            return self.__read_raw_narrow(sensor, valuetype, start, end)
+        tablename = '{}_{}'.format(self.__table_prefix, sensor).lower()
+        if tablename not in self.get_tables() or valuetype.upper() not in map(str.upper, self.__get_columns(tablename)):
+            raise ValueError('Sensor {} mit Wert {} nicht gefunden.'.format(sensor, valuetype))
+        rows = self.__conn.execute(
+            'SELECT TIMESTAMP, {} FROM {} WHERE TIMESTAMP >= ? AND TIMESTAMP <= ? ORDER BY TIMESTAMP'
+            .format(valuetype, tablename), (start, end)).fetchall()
+        data = np.array(rows, dtype = np.float64).reshape(-1, 2)
+        return data[:, 0].astype(np.int64), data[:, 1]
+
+    def __read_raw_narrow(self, sensor, valuetype, start, end):
+        """Liest die Werte einer Serie aus der Tabelle measurement (ein Bereich des Primärschlüssels)."""
+        ids = self.__conn.execute(
+            'SELECT s.ID, v.ID FROM {} s CROSS JOIN {} v WHERE s.NAME = ? COLLATE NOCASE AND v.NAME = ? COLLATE NOCASE'
+            .format(narrow.SENSOR_TABLE, narrow.VALUETYPE_TABLE), (sensor, valuetype)).fetchone()
+        if ids is None:
+            raise ValueError('Sensor {} mit Wert {} nicht gefunden.'.format(sensor, valuetype))
+        rows = self.__conn.execute(
+            'SELECT TIMESTAMP, VALUE FROM {} WHERE SENSOR_ID = ? AND VALUETYPE_ID = ? '
+            'AND TIMESTAMP >= ? AND TIMESTAMP <= ? ORDER BY TIMESTAMP'.format(narrow.MEASUREMENT_TABLE),
+            ids + (start, end)).fetchall()
+        data = np.array(rows, dtype = np.float64).reshape(-1, 2)
+        return data[:, 0].astype(np.int64), data[:, 1]
+
+    def __read_10min(self, starttime, endtime):
+        """Liefert die 10 Minuten Blöcke aller Serien sortiert nach SENSOR, VALUETYPE, BUCKET. Ohne
+        Rollup Tabelle werden sie aus den Rohdaten berechnet."""
+        if self.__get_rollup_level(600) == 600:
+            return _to_columns(self.__conn.execute(
+                'SELECT SENSOR, VALUETYPE, BUCKET, CNT, SUM, MIN, MAX FROM {} WHERE BUCKET >= ? AND BUCKET <= ? '
+                'ORDER BY SENSOR, VALUETYPE, BUCKET'.format(rollup.table_name(600)), (starttime, endtime)).fetchall())
+
+        if self.__narrow:
+            # Pro Sensor und Werttyp ein Bereich des Primärschlüssels, gruppiert wird in SQLite.
+            return _to_columns(self.__conn.execute(
+                'SELECT s.NAME, v.NAME, m.TIMESTAMP / 600 * 600 AS BUCKET, COUNT(m.VALUE), SUM(m.VALUE), '
+                'MIN(m.VALUE), MAX(m.VALUE) FROM {} s CROSS JOIN {} v '
+                'JOIN {} m ON m.SENSOR_ID = s.ID AND m.VALUETYPE_ID = v.ID '
+                'WHERE m.VALUE IS NOT NULL AND m.TIMESTAMP >= ? AND m.TIMESTAMP <= ? '
+                'GROUP BY s.NAME, v.NAME, BUCKET ORDER BY s.NAME, v.NAME, BUCKET'
+                .format(narrow.SENSOR_TABLE, narrow.VALUETYPE_TABLE, narrow.MEASUREMENT_TABLE),
+                (starttime, endtime)).fetchall())
+
+        parts = []
+        for tablename in sorted(self.get_tables()):
+            columns = self.__get_columns(tablename)
+            sensor = self.__conn.execute('SELECT TRIM(SENSOR) FROM {} LIMIT 1'.format(tablename)).fetchone()
+            rows = self.__conn.execute(
+                'SELECT TIMESTAMP, {} FROM {} WHERE TIMESTAMP >= ? AND TIMESTAMP <= ? ORDER BY TIMESTAMP'
+                .format(', '.join(columns), tablename), (starttime, endtime)).fetchall()
+            if len(rows) == 0:
+                continue
+            data = np.array(rows, dtype = np.float64)
+            keys = data[:, 0].astype(np.int64) // 600 * 600
+            for column in sorted(columns):
+                values = data[:, columns.index(column) + 1]
+                valid = ~np.isnan(values)
+                if not valid.any():
+                    continue
+                reduced = _reduce_buckets(keys[valid], np.ones(valid.sum()), values[valid], values[valid], values[valid])
+                n = len(reduced['TIMESTAMP'])
+                parts.append((np.full(n, sensor[0], dtype = object), np.full(n, column, dtype = object),
+                              reduced['TIMESTAMP'], reduced['CNT'], reduced['AVG'] * reduced['CNT'],
+                              reduced['MIN'], reduced['MAX']))
+        if len(parts) == 0:
+            empty = np.array([], dtype = np.float64)
+            return (np.array([], dtype = object), np.array([], dtype = object), empty.astype(np.int64),
+                    empty, empty, empty, empty)
+        return tuple(np.concatenate(columns) for columns in zip(*parts))
+
+    def __read_last(self, starttime, endtime):
+        """Liefert den letzten Wert jeder Serie im Zeitraum als dict (SENSOR, VALUETYPE) -> (TIMESTAMP, VALUE)."""
+        if self.__narrow:
+            # SQLite liefert bei MAX() die übrigen Spalten aus der Zeile mit dem Maximum.
+            rows = self.__conn.execute(
+                'SELECT s.NAME, v.NAME, MAX(m.TIMESTAMP), m.VALUE FROM {} s CROSS JOIN {} v '
+                'JOIN {} m ON m.SENSOR_ID = s.ID AND m.VALUETYPE_ID = v.ID '
+                'WHERE m.TIMESTAMP >= ? AND m.TIMESTAMP <= ? GROUP BY s.ID, v.ID'
+                .format(narrow.SENSOR_TABLE, narrow.VALUETYPE_TABLE, narrow.MEASUREMENT_TABLE),
+                (starttime, endtime)).fetchall()
+            return {(row[0], row[1]): (row[2], row[3]) for row in rows}
+        last = {}
+        for tablename in self.get_tables():
+            columns = self.__get_columns(tablename)
+            row = self.__conn.execute(
+                'SELECT TRIM(SENSOR), TIMESTAMP, {} FROM {} WHERE TIMESTAMP >= ? AND TIMESTAMP <= ? '
+                'ORDER BY TIMESTAMP DESC LIMIT 1'.format(', '.join(columns), tablename), (starttime, endtime)).fetchone()
+            if row is not None:
+                for column, value in zip(columns, row[2:]):
+                    last[(row[0], column)] = (row[1], value)
+        return last
+
+def _to_columns(rows):
+    """Wandelt Zeilen (SENSOR, VALUETYPE, BUCKET, CNT, SUM, MIN, MAX) in Spalten um."""
+    table = np.array(rows, dtype = object).reshape(-1, 7)
+    data = table[:, 2:].astype(np.float64)
+    return (table[:, 0], table[:, 1], data[:, 0].astype(np.int64),
+            data[:, 1], data[:, 2], data[:, 3], data[:, 4])
+
+def _group_starts(keys):
+    """Liefert die Indizes, an denen in einem sortierten Array eine neue Gruppe beginnt."""
+    if len(keys) == 0:
+        return np.array([], dtype = np.int64)
+    return np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+
+def _reduce_buckets(keys, cnt, sums, mins, maxs):
+    """Fasst aufeinanderfolgende Zeilen mit gleichem (sortiertem) Blockbeginn zusammen."""
+    starts = _group_starts(keys)
+    if len(starts) == 0:
+        empty = np.array([], dtype = np.float64)
+        return {'TIMESTAMP': keys, 'CNT': empty, 'AVG': empty, 'MIN': empty, 'MAX': empty}
+    total = np.add.reduceat(cnt, starts)
+    return {
+        'TIMESTAMP': keys[starts],
+        'CNT': total,
+        'AVG': np.add.reduceat(sums, starts) / total,
+        'MIN': np.minimum.reduceat(mins, starts),
+        'MAX': np.maximum.reduceat(maxs, starts)
+    }
@@ -1,15 +1,160 @@
 import time
 import subprocess
 import os
-import math
+import shutil
+import threading
+import logging
 from datetime import datetime
+import history
+import derived
+from drivers import LazyModule
+
+# Die Bibliotheken werden erst geladen, wenn ein Treiber sie verwendet (siehe drivers.py).
+np = LazyModule('numpy')                    # pip install numpy
+GPIO = LazyModule('RPi.GPIO')
+smbus2 = LazyModule('smbus2')               # I2C Bus
+bme = LazyModule('bme280')                  # Bosch Temperatur/Feuchtesensor
+tsl2561 = LazyModule('tsl2561')             # Luxsensor
+Adafruit_ADS1x15 = LazyModule('Adafruit_ADS1x15')
+cv2 = LazyModule('cv2')                     # Optional für die Webcam: pip install opencv-python
+
+# Zeitquelle mit time() für die Schaltzeiten von Relais. replay.py setzt eine virtuelle Uhr ein.
+clock = time
+
+# Normklima für Fan, mit den gleichnamigen params veränderbar. dewp_margin ist der Abstand in K,
+# um den der Taupunkt des Raumes unter dem der Box liegen muss, damit bei zu hoher Feuchte gelüftet wird.
+FAN_LIMITS = {'temp_min': 18, 'temp_max': 25, 'hum_min': 40, 'hum_max': 70, 'dewp_margin': 0.5}
 
-import RPi.GPIO as GPIO
-import smbus2                    # I2C Bus
-import bme280 as bme             # Bosch Temperatur/Feuchtesensor
-from Adafruit_GPIO import I2C
-from tsl2561 import TSL2561      # Luxsensor
-import Adafruit_ADS1x15
+# --------------------------------------------------------------------------------------------------
+# --------------------------------------------------------------------------------------------------
+
+
+class I2cBusManager:
+    """Verwaltet ein offenes SMBus Objekt und einen Lock pro I²C Bus, die von allen Sensoren auf
+    diesem Bus gemeinsam verwendet werden. Kalibrierungsdaten und Treiberobjekte werden pro
+    (bus, address) zwischengespeichert. Tritt bei einem Zugriff ein I/O Fehler auf, wird der Bus
+    geschlossen, der Cache des Busses verworfen und der Zugriff einmal mit neuem Handle wiederholt.
+    """
+
+    def __init__(self):
+        self.__buses = {}
+        self.__locks = {}
+        self.__cache = {}
+        self.__lock = threading.Lock()
+
+    def lock(self, bus):
+        """Liefert den (reentranten) Lock des Busses."""
+        with self.__lock:
+            return self.__locks.setdefault(bus, threading.RLock())
+
+    def get_bus(self, bus):
+        """Liefert das offene SMBus Objekt des Busses. Es wird beim ersten Zugriff geöffnet."""
+        with self.__lock:
+            if bus not in self.__buses:
+                self.__buses[bus] = smbus2.SMBus(bus)
+            return self.__buses[bus]
+
+    def get_cached(self, bus, address, key, factory):
+        """Liefert ein pro (bus, address, key) gespeichertes Objekt, z. B. Kalibrierungsdaten oder
+        ein Treiberobjekt. Ist es noch nicht vorhanden, wird es mit factory() erzeugt."""
+        with self.lock(bus):
+            cache_key = (bus, address, key)
+            if cache_key not in self.__cache:
+                self.__cache[cache_key] = factory()
+            return self.__cache[cache_key]
+
+    def provider(self, bus):
+        """Liefert ein Objekt mit get_i2c_device(address, **kwargs) im Stil von Adafruit_GPIO.I2C,
+        dessen Devices das gemeinsame SMBus Objekt des Busses verwenden."""
+        manager = self
+        class Provider:
+            @staticmethod
+            def get_i2c_device(address, **kwargs):
+                return _SharedI2cDevice(manager, bus, address)
+        return Provider
+
+    def run(self, bus, func):
+        """Führt func(smbus) mit gesperrtem Bus aus. Bei einem I/O Fehler wird der Bus neu geöffnet
+        und func noch einmal aufgerufen."""
+        with self.lock(bus):
+            try:
+                return func(self.get_bus(bus))
+            except OSError:
+                self.reset(bus)
+                return func(self.get_bus(bus))
+
+    def reset(self, bus):
+        """Schließt das SMBus Objekt des Busses und verwirft alle gespeicherten Objekte des Busses."""
+        with self.__lock:
+            smbus = self.__buses.pop(bus, None)
+            for cache_key in [k for k in self.__cache if k[0] == bus]:
+                del self.__cache[cache_key]
+        if smbus is not None:
+            try:
+                smbus.close()
+            except Exception:
+                pass
+
+
+class _SharedI2cDevice:
+    """Adafruit_GPIO.I2C.Device Ersatz, der über das gemeinsame SMBus Objekt des Busses zugreift."""
+
+    def __init__(self, manager, bus, address):
+        self.__manager = manager
+        self.__bus = bus
+        self.__address = address
+
+    def __smbus(self):
+        return self.__manager.get_bus(self.__bus)
+
+    def writeRaw8(self, value):
+        self.__smbus().write_byte(self.__address, value & 0xFF)
+
+    def write8(self, register, value):
+        self.__smbus().write_byte_data(self.__address, register, value & 0xFF)
+
+    def write16(self, register, value):
+        self.__smbus().write_word_data(self.__address, register, value & 0xFFFF)
+
+    def writeList(self, register, data):
+        self.__smbus().write_i2c_block_data(self.__address, register, data)
+
+    def readList(self, register, length):
+        return bytearray(self.__smbus().read_i2c_block_data(self.__address, register, length))
+
+    def readRaw8(self):
+        return self.__smbus().read_byte(self.__address) & 0xFF
+
+    def readU8(self, register):
+        return self.__smbus().read_byte_data(self.__address, register) & 0xFF
+
+    def readS8(self, register):
+        result = self.readU8(register)
+        return result - 256 if result > 127 else result
+
+    def readU16(self, register, little_endian = True):
+        result = self.__smbus().read_word_data(self.__address, register) & 0xFFFF
+        return result if little_endian else ((result << 8) & 0xFF00) + (result >> 8)
+
+    def readS16(self, register, little_endian = True):
+        result = self.readU16(register, little_endian)
+        return result - 65536 if result > 32767 else result
+
+    def readU16LE(self, register):
+        return self.readU16(register, little_endian = True)
+
+    def readU16BE(self, register):
+        return self.readU16(register, little_endian = False)
+
+    def readS16LE(self, register):
+        return self.readS16(register, little_endian = True)
+
+    def readS16BE(self, register):
+        return self.readS16(register, little_endian = False)
+
+
+# Gemeinsame Verwaltung aller I²C Busse für alle Sensoren.
+i2c_buses = I2cBusManager()
 
 # --------------------------------------------------------------------------------------------------
 # --------------------------------------------------------------------------------------------------
@@ -19,6 +164,10 @@ class Bme280:
     """Klasse für den Zugriff auf den BME280 Temp/Feuchtigkeitssensor
     """
 
+    # Ressourcen mit den Standardwerten der params, die der Cronjob sperrt (siehe _get_resources in
+    # cronjob.py). Jobs ohne Angabe von bus werden so mit denen serialisiert, die bus: 1 angeben.
+    resources = {'bus': 1}
+
     def __init__(self, params):
         """Konstruktor
 
@@ -29,17 +178,17 @@ class Bme280:
             }
         """
         self.__address = int(params.get('i2c_address', '0x76'), 16)
-        self.__bus = params.get('bus', 1)
+        self.__bus = params.get('bus', self.resources['bus'])
 
     def __enter__(self):
-        self.__smbus = smbus2.SMBus(self.__bus)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.__smbus.close()
+        pass
 
     def do_work(self, current_values={}):
-        """Liest die Werte des BME280 Temperatursensors aus.
+        """Liest die Werte des BME280 Temperatursensors über das gemeinsame SMBus Objekt des Busses
+        aus. Die Kalibrierungsdaten werden nur beim ersten Zugriff (bzw. nach einem I/O Fehler) gelesen.
 
         Args:
             current_values (dict, optional): Die vom Cronmodul übergebenen aktuellen Werte aller Sensoren. Defaults to {}.
@@ -47,8 +196,12 @@ class Bme280:
         Returns:
             dict: Ein Dictionary mit den Keys HUM (RF in %), TEMP (in °C) und PRES (in hPa)
         """
-        cal_params = bme.load_calibration_params(self.__smbus, self.__address)
-        data = bme.sample(self.__smbus, self.__address, cal_params)
+        def sample(smbus):
+            cal_params = i2c_buses.get_cached(self.__bus, self.__address, 'calibration',
+                                              lambda: bme.load_calibration_params(smbus, self.__address))
+            return bme.sample(smbus, self.__address, cal_params)
+
+        data = i2c_buses.run(self.__bus, sample)
         return {
             'HUM': round(data.humidity, 1),
             'TEMP': round(data.temperature, 1),
@@ -57,7 +210,8 @@ class Bme280:
 
     @staticmethod
     def calc_dewp(temp, hum):
-        """Berechnet den Taupunkt nach der Formel von http://old.wetterzentrale.de/cgi-bin/webbbs/wzarchive2004_2.pl?noframes;read=506422
+        """Berechnet den Taupunkt nach der Magnus Formel (siehe derived.py). Der Cronjob speichert
+        ihn als DEWP mit jedem Datensatz.
 
         Args:
             temp (float): Die Temperatur in °C.
@@ -66,15 +220,7 @@ class Bme280:
         Returns:
             float: Der Taupunkt in °C.
         """
-        a = 17.08085
-        b = 234.175
-        E0 = 6.1078
-        # Sättigungsdampfdruck E(t)
-        e_saett = E0 * math.exp(a*temp/(b+temp))
-        # Dampfdruck
-        e = hum/100 * e_saett
-        # Taupunkt
-        return b * math.log(e/E0) / (a-math.log(e/E0))
+        return derived.dewpoint(temp, hum)
 
 # --------------------------------------------------------------------------------------------------
 # --------------------------------------------------------------------------------------------------
@@ -84,6 +230,9 @@ class Tsl2561:
     """Klasse für den Zugriff auf den TSL2581 Luxsensor. 
     """
 
+    # Gesperrte Ressourcen, siehe Bme280
+    resources = {'bus': 1}
+
     def __init__(self, params):
         """Konstruktor
 
@@ -94,7 +243,7 @@ class Tsl2561:
             }
         """
         self.__address = int(params.get('i2c_address', "0x39"), 16)
-        self.__bus = params.get('bus', 1)
+        self.__bus = params.get('bus', self.resources['bus'])
 
     def __enter__(self):
         return self
@@ -103,8 +252,21 @@ class Tsl2561:
         pass
 
     def do_work(self, current_values={}):
-        tsl = TSL2561(address=self.__address, busnum=self.__bus)
-        value = tsl.lux()
+        """Liest den Lux Wert. Das TSL2561 Treiberobjekt wird pro Adresse nur einmal erzeugt (es
+        verwendet ein eigenes Handle, der Zugriff erfolgt aber über den Lock des Busses).
+
+        Args:
+            current_values (dict, optional): Die vom Cronmodul übergebenen aktuellen Werte aller Sensoren. Defaults to {}.
+
+        Returns:
+            int: Die Beleuchtungsstärke in Lux oder None, wenn kein gültiger Wert gelesen wurde.
+        """
+        def read_lux(smbus):
+            tsl = i2c_buses.get_cached(self.__bus, self.__address, 'driver',
+                                       lambda: tsl2561.TSL2561(address=self.__address, busnum=self.__bus))
+            return tsl.lux()
+
+        value = i2c_buses.run(self.__bus, read_lux)
         return None if not isinstance(value, int) else value
 
 
@@ -130,10 +292,7 @@ class Relais:
         """
         self.__channels = params['pin']
         self.__state = params.get('state', None)
-        self.__onFrom  = datetime.strptime(params['onFrom'],  "%H:%M").time() if 'onFrom'  in params else None
-        self.__onTo    = datetime.strptime(params['onTo'],    "%H:%M").time() if 'onTo'    in params else None
-        self.__offFrom = datetime.strptime(params['offFrom'], "%H:%M").time() if 'offFrom' in params else None
-        self.__offTo   = datetime.strptime(params['offTo'],   "%H:%M").time() if 'offTo'   in params else None
+        self.__on, self.__off = get_relais_windows(params)
 
         GPIO.setwarnings(False)
         GPIO.setmode(GPIO.BCM)
@@ -158,11 +317,7 @@ class Relais:
         Returns:
             int: Der gesetzte Zustand der PINs (1, 0 oder None).
         """
-        time_now = datetime.now().time()
-        if self.__onFrom is not None and self.__onTo is not None:
-            self.__state = 1 if self.__onFrom <= time_now and self.__onTo >= time_now else 0
-        elif self.__offFrom is not None and self.__offTo is not None:
-            self.__state = 0 if self.__offFrom <= time_now and self.__offTo >= time_now else 1
+        self.__state = relais_state(seconds_of_day(clock.time()), self.__on, self.__off, self.__state)
 
         if self.__state is not None:
             GPIO.output(self.__channels, self.__state)
@@ -178,6 +333,10 @@ class Fan:
     """Klasse für die sensorgesteuerte Regelung des Lüfters
     """
 
+    # params mit den Jobs, deren Werte gelesen werden. Der Cronjob führt den Job aus, sobald alle
+    # neue Werte geliefert haben.
+    inputs = ('boxsensor', 'roomsensor', 'lightstate')
+
     def __init__(self, params):
         """Konstruktor
 
@@ -187,12 +346,17 @@ class Fan:
                 boxsensor: Name des Sensors in cronjobs.json, der den Wert der Temperatur und Feuchte der Box liefert.
                 roomsensor: Name des Sensors in cronjobs.json, der den Wert der Temperatur und Feuchte des Raumes liefert.
                 lightstate: Name der Klasse, die den Zustand der Beleuchtung angibt.
+                smooth (optional): Sekunden, über die Temperatur und Feuchte gemittelt werden (aus
+                    dem Verlauf in current_values.history). Ohne Angabe zählt nur der letzte Wert.
+                temp_min, temp_max, hum_min, hum_max, dewp_margin (optional): Normklima, siehe FAN_LIMITS.
             }
         """
         self.__pin = params['pin']
         self.__boxsensor = params['boxsensor']
         self.__roomsensor = params['roomsensor']
         self.__lightstate = params['lightstate']
+        self.__smooth = params.get('smooth', None)
+        self.__limits = get_fan_limits(params)
         self.__state = False
         GPIO.setwarnings(False)
         GPIO.setmode(GPIO.BCM)
@@ -207,7 +371,8 @@ class Fan:
 
     def do_work(self, current_values):
         """Steuert den Lüfter an. Es wird nur eingeschalten, wenn das Klima außerhalb der Normwerte
-        (18-25°C und 40-70° RH) ist und ein Ansaugen der Luft die Normwerte herstellen kann.
+        (FAN_LIMITS, 18-25°C und 40-70° RH) ist und ein Ansaugen der Luft die Normwerte herstellen
+        kann (siehe fan_state).
 
         Args:
             current_values (dict): {
@@ -221,53 +386,108 @@ class Fan:
                         TEMP: Wert der Temperatur in der Box in °C.
             }
         """
-        box_values = current_values[self.__boxsensor]['VALUE']
-        room_values = current_values[self.__roomsensor]['VALUE']
-        box_dewp = Bme280.calc_dewp(box_values['TEMP'], box_values['HUM'])
-        room_dewp = Bme280.calc_dewp(room_values['TEMP'], room_values['HUM'])
+        box_values = history.get_values(current_values, self.__boxsensor, self.__smooth)
+        room_values = history.get_values(current_values, self.__roomsensor, self.__smooth)
+        # Derselbe gespeicherte Taupunkt wie in den Diagrammen (siehe derived.py).
+        box_dewp = derived.get_dewpoint(box_values)
+        room_dewp = derived.get_dewpoint(room_values)
         light_on = current_values[self.__lightstate]['VALUE']
-        new_state = True
-
-        # Normklima erreicht? Den Ventilator ausschalten
-        if box_values['TEMP'] >= 18 and box_values['TEMP'] <= 25 and \
-           box_values['HUM'] >= 40 and box_values['HUM'] <= 70:
-           new_state = False
-
-        # Bei Abweichungen einschalten, wenn das Sinn machen würde.
-        if box_values['TEMP'] > 25:
-            new_state = new_state and room_values['TEMP'] < 25
-        if box_values['TEMP'] < 18:
-            new_state = new_state and room_values['TEMP'] > 18
-        if box_values['HUM'] > 70:
-            new_state = new_state and (room_dewp < box_dewp - 0.5)
-        if box_values['HUM'] < 40:
-            new_state = new_state and (room_dewp > box_dewp)
-        if light_on == True:
-            new_state = True
-
-        self.__state = new_state
+        self.__state = fan_state(box_values['TEMP'], box_values['HUM'], room_values['TEMP'],
+                                 box_dewp, room_dewp, light_on, self.__limits)
         GPIO.output(self.__pin, self.__state)
 
     def __del__(self):
         pass
 
 
+def get_fan_limits(params):
+    """Liefert das Normklima aus params, fehlende Werte aus FAN_LIMITS."""
+    return {key: params.get(key, value) for key, value in FAN_LIMITS.items()}
+
+def fan_state(box_temp, box_hum, room_temp, box_dewp, room_dewp, light_on, limits = FAN_LIMITS):
+    """Entscheidung von Fan: Außerhalb des Normklimas wird eingeschalten, wenn das Ansaugen der
+    Raumluft die Abweichung verringert. Bei eingeschaltetem Licht läuft der Lüfter immer. Die
+    Werte können Zahlen oder NumPy Arrays sein (replay.py), es werden nur Vergleiche und & bzw. |
+    verwendet.
+
+    Returns:
+        bool: Der neue Zustand (bei Arrays ein Array aus bool).
+    """
+    # Normklima erreicht? Den Ventilator ausschalten
+    state = (box_temp < limits['temp_min']) | (box_temp > limits['temp_max']) | \
+            (box_hum < limits['hum_min']) | (box_hum > limits['hum_max'])
+    # Bei Abweichungen einschalten, wenn das Sinn machen würde.
+    state = state & ((box_temp <= limits['temp_max']) | (room_temp < limits['temp_max']))
+    state = state & ((box_temp >= limits['temp_min']) | (room_temp > limits['temp_min']))
+    state = state & ((box_hum <= limits['hum_max']) | (room_dewp < box_dewp - limits['dewp_margin']))
+    state = state & ((box_hum >= limits['hum_min']) | (room_dewp > box_dewp))
+    return state | (light_on == True)
+
+def get_relais_windows(params):
+    """Liefert die Zeitspannen onFrom bis onTo und offFrom bis offTo aus params als Tupel
+    (von, bis) in Sekunden seit Mitternacht, None wenn eine Angabe fehlt."""
+    def window(start, end):
+        if start not in params or end not in params:
+            return None
+        return tuple(seconds_of_day(datetime.strptime(params[key], "%H:%M")) for key in (start, end))
+    return window('onFrom', 'onTo'), window('offFrom', 'offTo')
+
+def relais_state(seconds, on = None, off = None, state = None):
+    """Zustand von Relais zur Uhrzeit seconds (Sekunden seit Mitternacht, Ortszeit, eine Zahl oder
+    ein NumPy Array): 1 innerhalb von on, 0 innerhalb von off (jeweils inklusive der Grenzen),
+    sonst state."""
+    if on is not None:
+        return 1 * ((on[0] <= seconds) & (seconds <= on[1]))
+    if off is not None:
+        return 1 * ((seconds < off[0]) | (seconds > off[1]))
+    return state
+
+def seconds_of_day(value):
+    """Sekunden seit Mitternacht (Ortszeit) eines UNIX Timestamps oder eines datetime."""
+    if not isinstance(value, datetime):
+        value = datetime.fromtimestamp(value)
+    return value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1e6
+
+
 # --------------------------------------------------------------------------------------------------
 # --------------------------------------------------------------------------------------------------
 class Cam:
-    """Klasse für das Aufnehmen eines Bilder der Webcam
+    """Klasse für das Aufnehmen eines Bilder der Webcam. Ist OpenCV installiert, bleibt das
+    Videogerät dauerhaft geöffnet und es wird bei jedem Aufruf nur ein Bild gelesen. Sonst wird
+    wie bisher /usr/bin/v4lctl aufgerufen. Die Bilder werden immer über eine temporäre Datei und
+    os.replace geschrieben, damit der Webserver keine halb geschriebene Datei ausliefert.
     """
 
+    # Werden erst bei Bedarf gesetzt, siehe Adc.__stop.
+    __capture = None
+    __archive = None
+
     def __init__(self, params):
         """Konstruktor. Initialisiert den Dateinamen der Bilddatei und setzt das Timeout.
 
         Args:
             params (dict): {
                 timeout: Timeout in Sekunden für den Video4Linux Prozess. Standardwert ist 5.
+                filename (optional): Bilddatei. Standardwert ist /home/alarm/webserver/static/webcam.jpg.
+                backend (optional): opencv, v4lctl oder auto (opencv, wenn installiert). Standardwert ist auto.
+                device (optional): Videogerät. Standardwert ist das erste Gerät in /dev/video*.
+                thumbnail_width (optional): Breite des Vorschaubildes (filename mit _thumb), 0 für
+                    kein Vorschaubild. Benötigt OpenCV. Standardwert ist 320.
+                archive_dir (optional): Verzeichnis für das Zeitraffer Archiv. Ohne Angabe wird nichts archiviert.
+                archive_max (optional): Maximale Anzahl der Bilder im Archiv. Standardwert ist 1440.
             }
         """
-        self.__filename = '/home/alarm/webserver/static/webcam.jpg'
+        self.__filename = params.get('filename', '/home/alarm/webserver/static/webcam.jpg')
         self.__timeout = int(params.get('timeout', "5"))
+        self.__backend = params.get('backend', 'auto')
+        if self.__backend == 'auto':
+            self.__backend = 'opencv' if cv2._is_available() else 'v4lctl'
+        if self.__backend == 'opencv' and not cv2._is_available():
+            raise Exception('Das Backend opencv benötigt das Paket opencv-python.')
+        self.__device = params.get('device', None)
+        self.__thumbnail_width = int(params.get('thumbnail_width', 320))
+        self.__archive_dir = params.get('archive_dir', None)
+        self.__archive_max = int(params.get('archive_max', 1440))
 
     def __enter__(self):
         return self
@@ -276,21 +496,28 @@ class Cam:
         pass
 
     def do_work(self, current_values={}):
-        """Nimmt durch das externe Programm /usr/bin/v4lctl ein Bild auf. Dabei wird das erste
-        Gerät verwendet, das in /dev/video* gefunden wird. Es wird der Befehl
+        """Nimmt ein Bild auf. Mit dem Backend opencv wird vom dauerhaft geöffneten Gerät gelesen,
+        mit dem Backend v4lctl wird der Befehl
         /usr/bin/v4lctl -c (video_device) snap jpeg full (filename)
-        abgesetzt. Konnte kein Bild aufgenommen werden (Prozess lieferte Timeout oder ungleich 0), 
-        wird das alte Bild - wenn es mehr als 1 Stunde alt ist - gelöscht. 
+        abgesetzt. Danach werden das Vorschaubild und das Archiv aktualisiert. Konnte kein Bild
+        aufgenommen werden (Prozess lieferte Timeout oder ungleich 0), wird das alte Bild - wenn es
+        mehr als 1 Stunde alt ist - gelöscht. 
 
         Args:
             current_values (dict, optional): Die vom Cronmodul übergebenen aktuellen Werte aller Sensoren. Defaults to {}.
         """
         try:
-            video_device = sorted([x.path for x in os.scandir(path='/dev') if 'video' in x.name])[0]
-            command = ['/usr/bin/v4lctl', '-c', video_device,
-                       'snap', 'jpeg', 'full', self.__filename]
-            subprocess.run(command, timeout=self.__timeout, stdout=subprocess.DEVNULL,
-                           stderr=subprocess.DEVNULL, check=True)
+            if self.__backend == 'opencv':
+                frame = self.__grab_frame()
+                _write_atomic(self.__filename, cv2.imencode('.jpg', frame)[1].tobytes())
+            else:
+                frame = None
+                tmp_filename = self.__filename + '.tmp.jpg'
+                command = ['/usr/bin/v4lctl', '-c', self.__get_device(),
+                           'snap', 'jpeg', 'full', tmp_filename]
+                subprocess.run(command, timeout=self.__timeout, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL, check=True)
+                os.replace(tmp_filename, self.__filename)
         except Exception:
             try:
                 if time.time() - os.path.getmtime(self.__filename) > 3600:
@@ -299,8 +526,82 @@ class Cam:
                 pass
             raise
 
+        try:
+            self.__write_thumbnail(frame)
+            self.__add_to_archive()
+        except Exception:
+            logging.exception('Fehler beim Erstellen des Vorschaubildes oder Archivieren.')
+
+    def close(self):
+        """Gibt das dauerhaft geöffnete Videogerät frei."""
+        if self.__capture is not None:
+            self.__capture.release()
+            self.__capture = None
+
+    def __get_device(self):
+        if self.__device is not None:
+            return self.__device
+        return sorted([x.path for x in os.scandir(path='/dev') if 'video' in x.name])[0]
+
+    def __grab_frame(self):
+        """Liest ein aktuelles Bild vom dauerhaft geöffneten Gerät. Ältere Bilder im Puffer des
+        Treibers werden verworfen. Bei einem Fehler wird das Gerät beim nächsten Aufruf neu geöffnet."""
+        if self.__capture is None:
+            capture = cv2.VideoCapture(self.__get_device())
+            if not capture.isOpened():
+                raise Exception('Videogerät {} konnte nicht geöffnet werden.'.format(self.__get_device()))
+            capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            self.__capture = capture
+        for i in range(2):
+            self.__capture.grab()
+        ok, frame = self.__capture.read()
+        if not ok:
+            self.close()
+            raise Exception('Kein Bild vom Videogerät erhalten.')
+        return frame
+
+    def __write_thumbnail(self, frame):
+        """Schreibt das verkleinerte Bild nach (filename)_thumb.jpg, wenn OpenCV installiert ist."""
+        if self.__thumbnail_width <= 0 or not cv2._is_available():
+            return
+        if frame is None:
+            frame = cv2.imread(self.__filename)
+        height, width = frame.shape[:2]
+        size = (self.__thumbnail_width, max(1, height * self.__thumbnail_width // width))
+        thumbnail = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        root, ext = os.path.splitext(self.__filename)
+        _write_atomic(root + '_thumb' + ext, cv2.imencode('.jpg', thumbnail)[1].tobytes())
+
+    def __add_to_archive(self):
+        """Legt das Bild als Hardlink (bzw. Kopie) im Archiv ab und löscht die ältesten Bilder,
+        wenn mehr als archive_max vorhanden sind. Da das Bild immer ersetzt und nie überschrieben
+        wird, bleibt der Hardlink unverändert."""
+        if self.__archive_dir is None:
+            return
+        if self.__archive is None:
+            os.makedirs(self.__archive_dir, exist_ok=True)
+            self.__archive = sorted(x.path for x in os.scandir(self.__archive_dir) if x.name.endswith('.jpg'))
+        target = os.path.join(self.__archive_dir, datetime.now().strftime('%Y%m%d-%H%M%S') + '.jpg')
+        try:
+            os.link(self.__filename, target)
+        except OSError:
+            shutil.copyfile(self.__filename, target)
+        self.__archive.append(target)
+        while len(self.__archive) > self.__archive_max:
+            try:
+                os.remove(self.__archive.pop(0))
+            except FileNotFoundError:
+                pass
+
     def __del__(self):
-        pass
+        self.close()
+
+
+def _write_atomic(filename, data):
+    """Schreibt die Datei über eine temporäre Datei und os.replace."""
+    with open(filename + '.tmp', 'wb') as file:
+        file.write(data)
+    os.replace(filename + '.tmp', filename)
 
 
 # --------------------------------------------------------------------------------------------------
@@ -311,6 +612,10 @@ class Relaymonitor:
     Da in der Datenbank für jeden Wert eine Spalte angelegt wird, müssen die Namen generisch sein.
     """
 
+    # Die gelesenen Pins CH1 bis CH4, die der Cronjob wie die Pins von Relais sperrt (siehe
+    # _get_resources in cronjob.py).
+    resources = {'pin': [25, 24, 23, 18]}
+
     def __init__(self, params):
         pass
 
@@ -335,7 +640,7 @@ class Relaymonitor:
             }
         """
         states = []           
-        for channel in [25, 24, 23, 18]:
+        for channel in self.resources['pin']:
             try:
                 states.append(int(GPIO.input(channel)))
             except:
@@ -348,9 +653,17 @@ class Relaymonitor:
 # --------------------------------------------------------------------------------------------------
 # --------------------------------------------------------------------------------------------------
 class Adc:
-    """Liest die 4 Kanäle des ADS1115 AD Wandlers ein.
+    """Liest die 4 Kanäle des ADS1115 AD Wandlers ein. Ist sample_rate angegeben, liest ein
+    Hintergrundthread die Kanäle laufend in einen Ringpuffer (numpy Array) und do_work liefert
+    Mittelwert, Minimum, Maximum und Standardabweichung seit dem letzten Aufruf.
     """
 
+    # Gesperrte Ressourcen, siehe Bme280
+    resources = {'bus': 1}
+    # Wird erst im Dauerbetrieb gesetzt. Als Klassenattribut kann close (und __del__) auch nach
+    # einem Fehler im Konstruktor aufgerufen werden.
+    __stop = None
+
     def __init__(self, params):
         """Konstruktor
 
@@ -365,11 +678,26 @@ class Adc:
                       4 = +/-1.024V
                       8 = +/-0.512V
                      16 = +/-0.256V
+                sample_rate (optional): Messungen (aller 4 Kanäle) pro Sekunde im Dauerbetrieb.
+                    Ohne Angabe wird bei jedem Aufruf von do_work einmal gelesen.
+                window (optional): Größe des Ringpuffers in Sekunden. Standardwert ist 60.
+                data_rate (optional): Wandlungen pro Sekunde des ADS1115. Standardwert ist 860.
             }
         """
         self.__address = int(params.get('i2c_address', "0x48"), 16)
-        self.__bus = params.get('bus', 1)
+        self.__bus = params.get('bus', self.resources['bus'])
         self.__gain = params.get('gain', 1)
+        self.__data_rate = params.get('data_rate', 860)
+        self.__sample_rate = params.get('sample_rate', None)
+        if self.__sample_rate is not None:
+            capacity = max(1, int(self.__sample_rate * params.get('window', 60)))
+            self.__buffer = np.zeros((capacity, 4), dtype=np.int16)
+            self.__written = 0
+            self.__read = 0
+            self.__buffer_lock = threading.Lock()
+            self.__stop = threading.Event()
+            self.__thread = threading.Thread(target=self.__sample_loop, name='adc-sampling', daemon=True)
+            self.__thread.start()
 
     def __enter__(self):
         return self
@@ -378,7 +706,8 @@ class Adc:
         pass
 
     def do_work(self, current_values={}):
-        """Liest einmalig alle 4 Kanäle des AD Wandlers.
+        """Liest einmalig alle 4 Kanäle des AD Wandlers. Im Dauerbetrieb (sample_rate) wird die
+        Statistik über die seit dem letzten Aufruf gelesenen Werte im Ringpuffer geliefert.
         
         Args:
             current_values (dict, optional): Die vom Cronmodul übergebenen aktuellen Werte aller Sensoren. Defaults to {}.
@@ -390,12 +719,13 @@ class Adc:
                 CH3: Wert des Kanals 3 (16 bit signed int), 
                 CH4: Wert des Kanals 4 (16 bit signed int)
             }
+            Im Dauerbetrieb ist CHx der Mittelwert, zusätzlich gibt es CHx_MIN, CHx_MAX, CHx_STD
+            und SAMPLES (Anzahl der Messungen). Gibt es keine neuen Messungen, wird None geliefert.
         """
-        
-        adc = Adafruit_ADS1x15.ADS1115(address=self.__address, busnum=self.__bus)
-        values = [0] * 4
-        for i in range(4):
-            values[i] = adc.read_adc(i, gain=self.__gain)
+        if self.__sample_rate is not None:
+            return self.__get_statistics()
+
+        values = i2c_buses.run(self.__bus, self.__read_channels)
 
         return {
             'CH1': values[0],
@@ -404,5 +734,51 @@ class Adc:
             'CH4': values[3]
         }
 
+    def close(self):
+        """Beendet den Hintergrundthread des Dauerbetriebes."""
+        if self.__stop is not None:
+            self.__stop.set()
+
+    def __read_channels(self, smbus):
+        adc = i2c_buses.get_cached(self.__bus, self.__address, 'driver',
+                                   lambda: Adafruit_ADS1x15.ADS1115(address=self.__address, busnum=self.__bus,
+                                                                    i2c=i2c_buses.provider(self.__bus)))
+        return [adc.read_adc(i, gain=self.__gain, data_rate=self.__data_rate) for i in range(4)]
+
+    def __sample_loop(self):
+        """Liest die Kanäle im Takt von sample_rate in den Ringpuffer. Kommt der Thread nicht nach,
+        wird ohne Pause weitergelesen."""
+        interval = 1 / self.__sample_rate
+        next_sample = time.monotonic()
+        while not self.__stop.is_set():
+            try:
+                values = i2c_buses.run(self.__bus, self.__read_channels)
+                with self.__buffer_lock:
+                    self.__buffer[self.__written % len(self.__buffer)] = values
+                    self.__written += 1
+            except Exception:
+                logging.exception('Fehler beim Lesen des AD Wandlers im Dauerbetrieb.')
+                self.__stop.wait(1)
+            next_sample = max(next_sample + interval, time.monotonic() - interval)
+            self.__stop.wait(max(0, next_sample - time.monotonic()))
+
+    def __get_statistics(self):
+        """Berechnet die Statistik der Messungen seit dem letzten Aufruf (höchstens window Sekunden)."""
+        with self.__buffer_lock:
+            count = min(self.__written - self.__read, len(self.__buffer))
+            samples = self.__buffer[np.arange(self.__written - count, self.__written) % len(self.__buffer)]
+            self.__read = self.__written
+        if count == 0:
+            return None
+        samples = samples.astype(np.float64)
+        result = {'SAMPLES': count}
+        for name, mean, minimum, maximum, std in zip(['CH1', 'CH2', 'CH3', 'CH4'], samples.mean(axis=0),
+                                                     samples.min(axis=0), samples.max(axis=0), samples.std(axis=0)):
+            result[name] = round(float(mean), 1)
+            result[name + '_MIN'] = int(minimum)
+            result[name + '_MAX'] = int(maximum)
+            result[name + '_STD'] = round(float(std), 2)
+        return result
+
     def __del__(self):
-        pass
+        self.close()
@@ -0,0 +1,438 @@
+"""Spielt gespeicherte Messwerte schneller als in Echtzeit durch die Regelung (Fan und Relais), um
+geänderte Schwellwerte oder Schaltzeiten vorher an den Daten der Vergangenheit zu prüfen:
+
+    python3 replay.py [cronjobs.json] [--db ../data/sensordata.db] [--from 2024-01-01] [--to 2025-01-01]
+                      [--set FAN.temp_max=26] [--set LIGHT.onTo=18:00] [--exact] [--decisions] [--json]
+
+Die Jobs der Klassen aus CONTROLLERS werden mit ihren params (und den Änderungen aus --set)
+berechnet. Die Werte ihrer Eingänge (z. B. boxsensor und roomsensor bei Fan) werden aus der
+Datenbank (eine Datei, Partitionen oder das schmale Layout, siehe query.py) im Raster --interval
+rekonstruiert, für verdichtete Sensoren linear oder stufig wie in compress.py. Ist ein Eingang
+selbst eine Regelung (lightstate bei Fan), wird dessen neu berechneter Zustand verwendet.
+
+Ohne --exact werden die zustandslosen Regeln (rasp.fan_state und rasp.relais_state) mit NumPy für
+das ganze Raster auf einmal berechnet, ein Jahr Minutenwerte dauert wenige Sekunden. Mit --exact
+laufen die echten Klassen aus rasp.py im Cronjob: Die Zeit liefert eine virtuelle Uhr
+(Cronjob.run_until), GPIO ist durch MockGPIO ersetzt und die übrigen Jobs liefern mit Playback die
+gespeicherten Werte. Termine, Eingänge, debounce und smooth verhalten sich dann wie im Betrieb,
+die Wiedergabe ist aber deutlich langsamer. Fan mit smooth ist nur mit --exact möglich.
+
+Ausgegeben werden pro Regelung die Anzahl der Läufe und Schaltvorgänge, die Stunden und der Anteil
+eingeschaltet und bei Fan die Stunden, in denen das Klima der Box außerhalb des Normklimas lag
+(gesamt, davon mit laufendem Lüfter und je Ursache). Ohne --exact ist jeder Punkt des Rasters ein
+Lauf. Mit --exact zählen als Läufe die Termine aus run_at; die Läufe, die neue Werte der Eingänge
+zusätzlich auslösen (siehe cronjob.py, bei Fan meist einer pro Termin der Sensoren), werden getrennt
+als reactive_runs ausgegeben. Am ersten Termin fehlen Fan die Werte der Eingänge noch, er läuft
+dort erst ausgelöst. Der Zustand, den Fan im Konstruktor setzt, zählt nicht als Schaltvorgang. Die gespeicherten Messwerte werden dabei nicht
+verändert: Wie sich ein anderes Schalten auf das Klima ausgewirkt hätte, wird nicht simuliert.
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import numpy as np               # pip install numpy
+from croniter import croniter
+import cronjob
+import derived
+import rasp
+from query import Query
+
+# Klassen, deren Entscheidungen berechnet werden
+CONTROLLERS = ('Fan', 'Relais')
+# Werttypen der Eingänge, die die Regelung liest
+VALUETYPES = ('TEMP', 'HUM', 'DEWP', 'VALUE')
+# Raster der Rekonstruktion in Sekunden
+DEFAULT_INTERVAL = 60
+# Längste Lücke zwischen zwei gespeicherten Werten in Sekunden, über die noch rekonstruiert wird
+# (mehr als ein heartbeat aus compress.py). In längeren Lücken fehlt der Eingang.
+MAX_GAP = 1800
+
+class VirtualClock:
+    """Uhr für Cronjob, History und rasp, die nur durch set weiterläuft."""
+
+    def __init__(self, timestamp):
+        self.__now = timestamp
+
+    def time(self):
+        return self.__now
+
+    def set(self, timestamp):
+        self.__now = timestamp
+
+class MockGPIO:
+    """Ersatz für RPi.GPIO. Zeichnet pro Pin die Änderungen des Zustandes und die Aufrufe von output
+    mit der Zeit der Uhr auf. input liefert den zuletzt gesetzten Zustand."""
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+
+    def __init__(self, clock):
+        self.__clock = clock
+        self.__states = {}
+        # Pin -> Liste (Zeit, Zustand) der Änderungen
+        self.changes = {}
+        # Pin -> Liste der Zeiten, zu denen output aufgerufen wurde
+        self.calls = {}
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, channels, direction, **kwargs):
+        pass
+
+    def output(self, channels, state):
+        state = int(state)
+        for channel in _as_list(channels):
+            self.calls.setdefault(channel, []).append(self.__clock.time())
+            if self.__states.get(channel) != state:
+                self.__states[channel] = state
+                self.changes.setdefault(channel, []).append((self.__clock.time(), state))
+
+    def input(self, channel):
+        return self.__states.get(channel, self.LOW)
+
+    def cleanup(self, *args):
+        pass
+
+class Playback:
+    """Treiber, der die rekonstruierten Werte eines Sensors zur Zeit der Uhr liefert (None, wenn
+    kein Wert vorliegt). Liefert der Sensor nur VALUE, wird wie beim echten Treiber eine Zahl
+    geliefert."""
+
+    def __init__(self, series, clock):
+        """Konstruktor
+
+        Args:
+            series (dict): TIMESTAMP (Raster) und die Arrays der Werttypen, siehe _load_series.
+            clock (VirtualClock): Die Uhr des Cronjobs.
+        """
+        self.__timestamps = series['TIMESTAMP']
+        self.__values = {key: value for key, value in series.items() if key != 'TIMESTAMP'}
+        self.__clock = clock
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def do_work(self, current_values = {}):
+        index = int(np.searchsorted(self.__timestamps, self.__clock.time(), side = 'right')) - 1
+        if index < 0:
+            return None
+        values = {key: float(value[index]) for key, value in self.__values.items() if not np.isnan(value[index])}
+        if len(values) == 0:
+            return None
+        return values['VALUE'] if list(values) == ['VALUE'] else values
+
+class _Drivers:
+    """Treiber für den Cronjob: Die Regelungen aus rasp, alle übrigen Jobs als Playback."""
+
+    def __init__(self, series, clock):
+        self.__series = series
+        self.__clock = clock
+
+    def Playback(self, params):
+        return Playback(self.__series[params['sensor']], self.__clock)
+
+    def __getattr__(self, name):
+        if name not in CONTROLLERS:
+            raise AttributeError(name)
+        return getattr(rasp, name)
+
+def replay(config, filename, start, end, interval = DEFAULT_INTERVAL, exact = False):
+    """Berechnet die Entscheidungen der Regelungen im Zeitraum start bis end.
+
+    Args:
+        config (dict): Inhalt von cronjobs.json (mit den geänderten params).
+        filename (str): Datenbank oder Verzeichnis der Partitionen.
+        start (int): Beginn als UNIX Timestamp.
+        end (int): Ende als UNIX Timestamp.
+        interval (int, optional): Raster der Eingänge in Sekunden. Defaults to DEFAULT_INTERVAL.
+        exact (bool, optional): Die Klassen aus rasp im Cronjob ausführen. Defaults to False.
+
+    Returns:
+        dict: Job ID -> runs, switches, on_hours, duty_cycle, decisions (Liste der Schaltvorgänge
+              als TIMESTAMP und Zustand), mit exact reactive_runs und bei Fan out_of_range_hours,
+              out_of_range_fan_on_hours und out_of_range_by_cause. Jobs, die nie laufen, fehlen.
+    """
+    controllers = {job_id: elem for job_id, elem in config.items() if elem['class'] in CONTROLLERS}
+    inputs = {job_id: _get_inputs(elem) for job_id, elem in controllers.items()}
+    sources = set(name for names in inputs.values() for name in names if name not in controllers)
+    for job_id in sources:
+        if job_id not in config:
+            raise ValueError('Eingang {} ist nicht in der Konfiguration.'.format(job_id))
+    with Query(filename) as query:
+        series = {job_id: _load_series(query, job_id, config[job_id], start, end, interval) for job_id in sorted(sources)}
+    grid = np.arange(-(-start // interval) * interval, end, interval, dtype = np.int64)
+    if exact:
+        timelines = _replay_exact(config, controllers, series, start, end)
+    else:
+        timelines = _replay_vectorized(controllers, inputs, series, grid)
+    result = {}
+    for job_id, (timestamps, states, runs, reactive_runs) in timelines.items():
+        summary = _summarize(timestamps, states, runs, start, end)
+        if reactive_runs is not None:
+            summary['reactive_runs'] = reactive_runs
+        if controllers[job_id]['class'] == 'Fan':
+            params = controllers[job_id]['params']
+            summary.update(_out_of_range(series[params['boxsensor']], grid, timestamps, states,
+                                         rasp.get_fan_limits(params), interval))
+        result[job_id] = summary
+    return result
+
+def _replay_vectorized(controllers, inputs, series, grid):
+    """Berechnet die zustandslosen Regeln für das ganze Raster.
+
+    Returns:
+        dict: Job ID -> (TIMESTAMPs, Zustände, Anzahl der Läufe, None).
+    """
+    timelines = {}
+    computed = {}
+    # Regelungen, die den Zustand einer anderen lesen (lightstate), nach dieser berechnen.
+    ranks = cronjob._sort_jobs({job_id: tuple(name for name in names if name in controllers)
+                                for job_id, names in inputs.items()})
+    for job_id in sorted(controllers, key = ranks.get):
+        elem = controllers[job_id]
+        params = elem.get('params', {})
+        if elem['class'] == 'Relais':
+            on, off = rasp.get_relais_windows(params)
+            state = rasp.relais_state(_local_seconds_of_day(grid), on, off, params.get('state', None))
+            if state is None:
+                continue
+            states = np.broadcast_to(np.asarray(state, dtype = np.int64), grid.shape)
+        else:
+            if params.get('smooth') is not None:
+                raise ValueError('Job {}: smooth ist nur mit --exact möglich.'.format(job_id))
+            box = series[params['boxsensor']]
+            room = series[params['roomsensor']]
+            light = computed[params['lightstate']].astype(np.float64) if params['lightstate'] in computed \
+                else series[params['lightstate']]['VALUE']
+            box_dewp, room_dewp = _get_dewpoint(box), _get_dewpoint(room)
+            with np.errstate(invalid = 'ignore'):
+                state = rasp.fan_state(box['TEMP'], box['HUM'], room['TEMP'], box_dewp, room_dewp, light,
+                                       rasp.get_fan_limits(params))
+            # Fehlt ein Eingang, läuft der Job nicht und der Lüfter behält seinen Zustand.
+            valid = ~(np.isnan(box['TEMP']) | np.isnan(box['HUM']) | np.isnan(room['TEMP']) |
+                      np.isnan(box_dewp) | np.isnan(room_dewp) | np.isnan(light))
+            last = np.maximum.accumulate(np.where(valid, np.arange(len(grid)), -1))
+            states = np.where(last >= 0, state[np.maximum(last, 0)], False).astype(np.int64)
+        computed[job_id] = states
+        timelines[job_id] = (grid, states, len(grid), None)
+    return timelines
+
+def _replay_exact(config, controllers, series, start, end):
+    """Führt die Regelungen mit einer virtuellen Uhr im Cronjob aus.
+
+    Returns:
+        dict: Job ID -> (TIMESTAMPs der Änderungen, Zustände, Anzahl der Läufe zu den Terminen aus
+              run_at, Anzahl der durch neue Werte der Eingänge ausgelösten Läufe).
+    """
+    jobs = dict(controllers)
+    for job_id in series:
+        jobs[job_id] = {'run_at': config[job_id]['run_at'], 'class': 'Playback', 'params': {'sensor': job_id}}
+    # Die ersten Termine liegen nach der Zeit der Uhr, der erste also auf start.
+    clock = VirtualClock(start - 1)
+    gpio = MockGPIO(clock)
+    saved = rasp.GPIO, rasp.clock
+    rasp.GPIO, rasp.clock = gpio, clock
+    with tempfile.NamedTemporaryFile('w', suffix = '.json', prefix = 'growmonitor-replay-', delete = False) as configfile:
+        json.dump(jobs, configfile)
+    try:
+        runner = cronjob.Cronjob(configfile.name, drivers = _Drivers(series, clock), clock = clock)
+        runner.run_until(end - 1)
+    finally:
+        rasp.GPIO, rasp.clock = saved
+        os.remove(configfile.name)
+
+    timelines = {}
+    slots = {}
+    for job_id, elem in controllers.items():
+        pin = _as_list(elem['params']['pin'])[0]
+        # Was Fan im Konstruktor (vor start) setzt, ist weder ein Lauf noch ein Schaltvorgang. Behält
+        # der erste Lauf diesen Zustand bei, beginnt der Verlauf mit ihm.
+        calls = [timestamp for timestamp in gpio.calls.get(pin, []) if timestamp >= start]
+        if len(calls) == 0:
+            continue
+        initial = [(timestamp, state) for timestamp, state in gpio.changes[pin] if timestamp < start]
+        changes = [(timestamp, state) for timestamp, state in gpio.changes[pin] if timestamp >= start]
+        if len(initial) > 0 and (len(changes) == 0 or changes[0][0] > calls[0]):
+            changes.insert(0, (calls[0], initial[-1][1]))
+        if elem['run_at'] not in slots:
+            slots[elem['run_at']] = _get_slots(elem['run_at'], start, end)
+        runs = sum(1 for timestamp in calls if timestamp in slots[elem['run_at']])
+        timestamps = np.array([timestamp for timestamp, state in changes], dtype = np.float64)
+        states = np.array([state for timestamp, state in changes], dtype = np.int64)
+        timelines[job_id] = (timestamps, states, runs, len(calls) - runs)
+    return timelines
+
+def _summarize(timestamps, states, runs, start, end):
+    """Fasst einen Verlauf von Zuständen zusammen. Jeder Zustand gilt bis zum nächsten."""
+    timestamps = np.clip(np.asarray(timestamps, dtype = np.float64), start, end)
+    states = np.asarray(states)
+    durations = np.diff(np.append(timestamps, end))
+    on = float(durations[states != 0].sum())
+    changed = np.flatnonzero(states[1:] != states[:-1]) + 1
+    return {
+        'runs': int(runs),
+        'switches': len(changed),
+        'on_hours': round(on / 3600, 2),
+        'duty_cycle': round(on / max(end - start, 1), 4),
+        'decisions': [(int(timestamps[index]), int(states[index])) for index in np.concatenate(([0], changed))]
+                     if len(states) > 0 else []
+    }
+
+def _out_of_range(box, grid, timestamps, states, limits, interval):
+    """Stunden, in denen TEMP und HUM der Box außerhalb des Normklimas lagen, gesamt, mit laufendem
+    Lüfter und je Ursache. Jeder Punkt des Rasters zählt interval Sekunden."""
+    index = np.searchsorted(np.asarray(timestamps, dtype = np.float64), grid, side = 'right') - 1
+    fan_on = (index >= 0) & (np.asarray(states)[np.maximum(index, 0)] != 0)
+    with np.errstate(invalid = 'ignore'):
+        causes = {
+            'temp_low': box['TEMP'] < limits['temp_min'],
+            'temp_high': box['TEMP'] > limits['temp_max'],
+            'hum_low': box['HUM'] < limits['hum_min'],
+            'hum_high': box['HUM'] > limits['hum_max']
+        }
+    outside = causes['temp_low'] | causes['temp_high'] | causes['hum_low'] | causes['hum_high']
+    hours = interval / 3600
+    return {
+        'out_of_range_hours': round(outside.sum() * hours, 2),
+        'out_of_range_fan_on_hours': round((outside & fan_on).sum() * hours, 2),
+        'out_of_range_by_cause': {key: round(value.sum() * hours, 2) for key, value in causes.items()}
+    }
+
+def _load_series(query, sensor, elem, start, end, interval):
+    """Liest die Werttypen aus VALUETYPES eines Sensors im Raster interval von start bis vor end.
+    Verdichtete Sensoren (siehe compress.py) werden bei swinging_door linear, sonst stufig
+    rekonstruiert.
+
+    Returns:
+        dict: TIMESTAMP und ein Array pro Werttyp (NaN, wo kein Wert vorliegt).
+    """
+    method = 'linear' if elem.get('compress', {}).get('method') == 'swinging_door' else 'step'
+    valuetypes = [name for name in query.get_valuetypes(sensor, start - MAX_GAP, end) if name.upper() in VALUETYPES]
+    if len(valuetypes) == 0:
+        raise ValueError('Keine gespeicherten Werte für {} gefunden.'.format(sensor))
+    series = {}
+    for valuetype in valuetypes:
+        data = query.get_series(sensor, valuetype, start, end - 1, fill = method, interval = interval, max_gap = MAX_GAP)
+        series['TIMESTAMP'] = data['TIMESTAMP']
+        series[valuetype.upper()] = data['VALUE']
+    return series
+
+def _get_inputs(elem):
+    """Liefert die IDs der Eingänge einer Regelung wie cronjob._get_inputs."""
+    if 'inputs' in elem:
+        return tuple(elem['inputs'])
+    params = elem.get('params', {})
+    return tuple(params[name] for name in getattr(getattr(rasp, elem['class']), 'inputs', ()) if name in params)
+
+def _get_dewpoint(values):
+    """Liefert DEWP wie derived.get_dewpoint für Arrays: Fehlende Werte werden berechnet."""
+    calculated = derived.calculate(values['TEMP'], values['HUM'])['DEWP']
+    if 'DEWP' not in values:
+        return calculated
+    return np.where(np.isnan(values['DEWP']), calculated, values['DEWP'])
+
+def _local_seconds_of_day(timestamps):
+    """Wie rasp.seconds_of_day für ein Array von UNIX Timestamps. Der Abstand zu UTC wird pro
+    Stunde einmal bestimmt."""
+    hours, inverse = np.unique(timestamps // 3600, return_inverse = True)
+    offsets = np.array([time.localtime(int(hour) * 3600).tm_gmtoff for hour in hours], dtype = np.int64)
+    return (timestamps + offsets[inverse]) % 86400
+
+def _get_slots(run_at, start, end):
+    """Liefert die Termine aus run_at von start (inklusive) bis end (exklusive) als Menge."""
+    cron = croniter(run_at, start - 1)
+    slots = set()
+    timestamp = int(cron.get_next())
+    while timestamp < end:
+        slots.add(timestamp)
+        timestamp = int(cron.get_next())
+    return slots
+
+def _as_list(channels):
+    return channels if isinstance(channels, (list, tuple)) else [channels]
+
+def _parse_time(value):
+    """Liefert den UNIX Timestamp eines Datums (JJJJ-MM-TT, Ortszeit) oder eines Timestamps."""
+    try:
+        return int(value)
+    except ValueError:
+        return int(time.mktime(time.strptime(value, '%Y-%m-%d')))
+
+def _apply_setting(config, setting):
+    """Übernimmt eine Änderung JOB.param=Wert aus --set in die params. Der Wert wird als JSON gelesen,
+    sonst als Text übernommen (z. B. 18:00)."""
+    key, value = setting.split('=', 1)
+    job_id, name = key.split('.', 1)
+    if job_id not in config:
+        raise ValueError('Job {} ist nicht in der Konfiguration.'.format(job_id))
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    config[job_id].setdefault('params', {})[name] = value
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Spielt gespeicherte Messwerte durch die Regelung.')
+    parser.add_argument('configfile', nargs = '?', default = 'cronjobs.json')
+    parser.add_argument('--db', default = '../data/sensordata.db', help = 'Datenbank oder Verzeichnis der Partitionen.')
+    parser.add_argument('--from', dest = 'start', help = 'Beginn (JJJJ-MM-TT). Standardwert ist --to minus 365 Tage.')
+    parser.add_argument('--to', dest = 'end', help = 'Ende exklusive (JJJJ-MM-TT). Standardwert ist jetzt.')
+    parser.add_argument('--set', action = 'append', default = [], help = 'Geänderter Parameter, z. B. FAN.temp_max=26.')
+    parser.add_argument('--interval', type = int, default = DEFAULT_INTERVAL, help = 'Raster der Eingänge in Sekunden.')
+    parser.add_argument('--exact', action = 'store_true', help = 'Die Klassen aus rasp.py im Cronjob ausführen.')
+    parser.add_argument('--decisions', action = 'store_true', help = 'Alle Schaltvorgänge ausgeben.')
+    parser.add_argument('--json', action = 'store_true', help = 'Ergebnis als JSON ausgeben.')
+    args = parser.parse_args()
+
+    with open(args.configfile, 'r') as json_file:
+        config = json.load(json_file)
+    for setting in args.set:
+        _apply_setting(config, setting)
+    end = _parse_time(args.end) if args.end is not None else int(time.time())
+    start = _parse_time(args.start) if args.start is not None else end - 365 * 86400
+
+    started = time.time()
+    result = replay(config, args.db, start, end, args.interval, args.exact)
+    elapsed = time.time() - started
+    if not args.decisions:
+        for summary in result.values():
+            del summary['decisions']
+    if args.json:
+        print(json.dumps(result, indent = 2))
+        return
+
+    print('Wiedergabe von {} bis {} ({:.1f} Tage) in {:.1f} s ({:.0f}-fach Echtzeit)'.format(
+        time.strftime('%Y-%m-%d %H:%M', time.localtime(start)), time.strftime('%Y-%m-%d %H:%M', time.localtime(end)),
+        (end - start) / 86400, elapsed, (end - start) / max(elapsed, 1e-6)))
+    print('{:<16} {:>8} {:>10} {:>8} {:>9} {:>7} {:>12} {:>12}'.format(
+        'Job', 'Läufe', 'Ausgelöst', 'Schalten', 'Ein h', 'Ein %', 'Außerhalb h', 'davon Ein h'))
+    for job_id, summary in sorted(result.items()):
+        print('{:<16} {:>8} {:>10} {:>8} {:>9.1f} {:>7.1f} {:>12} {:>12}'.format(
+            job_id, summary['runs'], summary.get('reactive_runs', ''), summary['switches'], summary['on_hours'],
+            summary['duty_cycle'] * 100,
+            summary.get('out_of_range_hours', ''), summary.get('out_of_range_fan_on_hours', '')))
+        if 'out_of_range_by_cause' in summary:
+            print('{:<16} {}'.format('', ', '.join('{} {} h'.format(key, value)
+                                                  for key, value in summary['out_of_range_by_cause'].items())))
+    if args.decisions:
+        for job_id, summary in sorted(result.items()):
+            for timestamp, state in summary['decisions']:
+                print('{}  {:<16} {}'.format(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)), job_id, state))
+
+if __name__ == '__main__':
+    logging.basicConfig(format = '%(asctime)s %(message)s', level = logging.WARNING)
+    main()
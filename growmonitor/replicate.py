@@ -0,0 +1,306 @@
+"""Überträgt die lokal geschriebenen Sensortabellen (data_*) im Hintergrund auf einen SQL Server.
+
+Die Sensoren schreiben immer nur in die lokale SQLite Datenbank. Welche Zeilen noch übertragen
+werden müssen, bestimmt die Reihenfolge des Einfügens, nicht der TIMESTAMP: Ein Trigger pro Tabelle
+schreibt jede neue Zeile in die Tabelle replication_log (fortlaufende SEQ, Tabelle, TIMESTAMP).
+Zeilen mit älterem TIMESTAMP, die später kommen (Warteschlange nach einem Ausfall, importlog.py),
+werden so ebenfalls übertragen. Der Replicator liest in einem eigenen Thread pro Tabelle bis zu
+batch_size Einträge nach der zuletzt übertragenen SEQ und schreibt die Zeilen in einer Transaktion
+(INSERTs mit bis zu 1000 Zeilen) auf den Server. Erst nach dem commit auf dem Server wird die SEQ
+in der lokalen Tabelle replication_state weitergesetzt, übertragene Einträge werden aus dem Log
+gelöscht. Das INSERT überspringt vorhandene TIMESTAMPs, ein nach einem Abbruch wiederholter Block
+erzeugt daher keine doppelten Zeilen.
+
+Zeilen, die vor dem Anlegen des Triggers geschrieben wurden, werden einmalig nach TIMESTAMP
+geordnet übertragen (Spalte COPIED, NULL wenn fertig). Eine replication_state Tabelle älterer
+Versionen (Hochwassermarke als TIMESTAMP) wird verworfen und alles einmal neu übertragen, damit
+auch die dort übersehenen Zeilen ankommen.
+
+Ist der Server nicht erreichbar, wird die Verbindung verworfen und mit wachsender Pause (bis
+max_backoff) neu versucht. Nach dem Ausfall werden die fehlenden Zeilen ohne Pause zwischen den
+Blöcken nachgeliefert. Die Hauptschleife wartet nie auf den Server. Die Zugangsdaten stehen in
+Umgebungsvariablen (siehe mssql_from_environment), nicht im Code.
+
+    python3 replicate.py ../data/sensordata.db   (einmalig alles übertragen)
+"""
+
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import metrics
+
+# Zeilen, die pro Durchlauf und Tabelle gelesen werden
+BATCH_SIZE = 5000
+# Maximale Anzahl Zeilen und Parameter eines INSERT auf dem SQL Server
+MAX_INSERT_ROWS = 1000
+MAX_INSERT_PARAMS = 2000
+STATE_TABLE = 'replication_state'
+LOG_TABLE = 'replication_log'
+# Umgebungsvariablen mit den Zugangsdaten des SQL Servers
+ENVIRONMENT = ('GROWMONITOR_MSSQL_HOST', 'GROWMONITOR_MSSQL_USER', 'GROWMONITOR_MSSQL_PASSWORD', 'GROWMONITOR_MSSQL_DATABASE')
+
+rows_replicated = metrics.registry.counter('growmonitor_replication_rows_total', 'Anzahl der übertragenen Zeilen.', 'target')
+replication_errors = metrics.registry.counter('growmonitor_replication_errors_total', 'Anzahl der fehlgeschlagenen Durchläufe.', 'target')
+replication_lag = metrics.registry.gauge('growmonitor_replication_lag_seconds', 'Alter der ältesten nicht übertragenen Zeile.', 'target')
+
+class Replicator:
+    """Überträgt die Sensortabellen einer SQLite Datenbank auf eine entfernte Datenbank."""
+
+    def __init__(self, filename, connect_func, target = 'mssql', table_prefix = 'data', interval = 60,
+                 batch_size = BATCH_SIZE, max_backoff = 3600):
+        """Konstruktor
+
+        Args:
+            filename (str): Dateiname der lokalen SQLite Datenbank.
+            connect_func (function): Liefert eine neue DB-API Verbindung zum Ziel (paramstyle format).
+            target (str, optional): Name des Ziels in replication_state. Defaults to 'mssql'.
+            table_prefix (str, optional): Prefix der Sensortabellen. Defaults to 'data'.
+            interval (int, optional): Sekunden zwischen zwei Durchläufen. Defaults to 60.
+            batch_size (int, optional): Zeilen pro Tabelle und Durchlauf. Defaults to BATCH_SIZE.
+            max_backoff (int, optional): Maximale Pause nach Fehlern in Sekunden. Defaults to 3600.
+        """
+        self.__filename = filename
+        self.__connect_func = connect_func
+        self.__target = target
+        self.__table_prefix = table_prefix
+        self.__interval = interval
+        self.__batch_size = batch_size
+        self.__max_backoff = max_backoff
+        self.__local = None
+        self.__remote = None
+        self.__remote_columns = {}
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    @staticmethod
+    def mssql(filename, host, user, passwd, dbname, **kwargs):
+        """Erstellt einen Replicator für eine SQL Server Datenbank (siehe db.Database.mssql)."""
+        import pymssql                     # pacman -S freetds && pip install cython &&  pip install pymssql
+        return Replicator(filename, lambda: pymssql.connect(host, user, passwd, dbname),
+                          target = '{}/{}'.format(host, dbname), **kwargs)
+
+    @staticmethod
+    def mssql_from_environment(filename, **kwargs):
+        """Erstellt einen Replicator für den SQL Server aus den Umgebungsvariablen in ENVIRONMENT
+        (z. B. aus einer EnvironmentFile des systemd Service, siehe README).
+
+        Raises:
+            KeyError: Wenn eine der Variablen fehlt.
+        """
+        missing = [name for name in ENVIRONMENT if name not in os.environ]
+        if len(missing) > 0:
+            raise KeyError('Für die Replikation fehlen die Umgebungsvariablen {}.'.format(', '.join(missing)))
+        return Replicator.mssql(filename, *(os.environ[name] for name in ENVIRONMENT), **kwargs)
+
+    def start(self):
+        """Startet die Übertragung in einem eigenen Thread."""
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target = self.__work, name = 'replicate', daemon = True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """Beendet den Thread nach dem laufenden Block."""
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def replicate(self):
+        """Führt einen Durchlauf aus: Pro Tabelle werden bis zu batch_size Zeilen übertragen.
+
+        Returns:
+            bool: True, wenn noch Zeilen warten (eine Tabelle hatte mehr als batch_size neue Zeilen).
+        """
+        local = self.__get_local()
+        if self.__remote is None:
+            self.__remote = self.__connect_func()
+            self.__remote_columns = self.__read_remote_columns()
+        pending = False
+        oldest = None
+        tables = [val[0] for val in local.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'",
+            (self.__table_prefix + '\\_%',))]
+        for tablename in tables:
+            state = get_state(local, tablename, self.__target)
+            if state is None:
+                # Zuerst der Trigger, dann die Kopie: Keine Zeile fällt zwischen beide.
+                create_trigger(local, tablename)
+                state = (0, -2**62)
+                set_state(local, tablename, self.__target, *state)
+            seq, copied = state
+            columns = [val[1] for val in local.execute('PRAGMA table_info({})'.format(tablename))]
+            if copied is not None:
+                rows = local.execute('SELECT {} FROM {} WHERE TIMESTAMP > ? ORDER BY TIMESTAMP LIMIT ?'
+                                     .format(', '.join(columns), tablename), (copied, self.__batch_size)).fetchall()
+                if len(rows) > 0:
+                    self.__write_remote(tablename.lower(), columns, rows)
+                    rows_replicated.inc(len(rows), self.__target)
+                    oldest = _min(oldest, rows[0][columns.index('TIMESTAMP')])
+                copied = rows[-1][columns.index('TIMESTAMP')] if len(rows) == self.__batch_size else None
+                set_state(local, tablename, self.__target, seq, copied)
+                pending = pending or copied is not None
+            # Zeilen, die seit dem Eintrag gelöscht wurden (archive.py), fehlen im LEFT JOIN.
+            entries = local.execute('SELECT l.SEQ, {} FROM {} l LEFT JOIN {} t ON t.TIMESTAMP = l.TIMESTAMP '
+                                    'WHERE l.TABLENAME = ? AND l.SEQ > ? ORDER BY l.SEQ LIMIT ?'
+                                    .format(', '.join('t.' + column for column in columns), LOG_TABLE, tablename),
+                                    (tablename.lower(), seq, self.__batch_size)).fetchall()
+            if len(entries) == 0:
+                continue
+            # Wird eine Zeile mehrmals eingefügt (INSERT OR REPLACE), nur den letzten Stand senden.
+            rows = list({row[1 + columns.index('TIMESTAMP')]: row[1:] for row in entries
+                         if row[1 + columns.index('TIMESTAMP')] is not None}.values())
+            if len(rows) > 0:
+                self.__write_remote(tablename.lower(), columns, rows)
+                rows_replicated.inc(len(rows), self.__target)
+                oldest = _min(oldest, min(row[columns.index('TIMESTAMP')] for row in rows))
+            set_state(local, tablename, self.__target, entries[-1][0], copied)
+            prune_log(local, tablename)
+            pending = pending or len(entries) == self.__batch_size
+        replication_lag.set(time.time() - oldest if pending and oldest is not None else 0, self.__target)
+        return pending
+
+    def __work(self):
+        backoff = 0
+        while not self.__stopped.is_set():
+            try:
+                pending = self.replicate()
+                backoff = 0
+            except Exception:
+                logging.exception('Fehler bei der Replikation nach %s.', self.__target)
+                replication_errors.inc(1, self.__target)
+                self.__close_remote()
+                pending = False
+                backoff = min(max(2 * backoff, 10), self.__max_backoff)
+            # Solange Zeilen warten (z. B. nach einem Ausfall), geht es ohne Pause weiter.
+            if not pending:
+                self.__stopped.wait(backoff if backoff > 0 else self.__interval)
+        self.__close_remote()
+        if self.__local is not None:
+            self.__local.close()
+            self.__local = None
+
+    def __get_local(self):
+        if self.__local is None:
+            self.__local = sqlite3.connect(self.__filename, timeout = 60)
+            create_tables(self.__local)
+        return self.__local
+
+    def __read_remote_columns(self):
+        """Liefert die Spalten der vorhandenen Tabellen am Ziel als dict Tabelle -> set(Spalten)."""
+        cursor = self.__remote.cursor()
+        cursor.execute('SELECT TABLE_NAME, COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS')
+        columns = {}
+        for tablename, column in cursor.fetchall():
+            columns.setdefault(tablename.lower(), set()).add(column.upper())
+        return columns
+
+    def __write_remote(self, tablename, columns, rows):
+        """Schreibt die Zeilen in einer Transaktion. Fehlende Tabellen und Spalten werden angelegt."""
+        cursor = self.__remote.cursor()
+        existing = self.__remote_columns.get(tablename)
+        values = [column for column in columns if column.upper() not in ('TIMESTAMP', 'OFFSET', 'SENSOR')]
+        if existing is None:
+            cursor.execute('CREATE TABLE {} (TIMESTAMP BIGINT, OFFSET REAL, SENSOR CHAR(16), {}, PRIMARY KEY (TIMESTAMP))'
+                           .format(tablename, ', '.join(column + ' FLOAT' for column in values)))
+            existing = self.__remote_columns[tablename] = set(column.upper() for column in columns)
+        for column in values:
+            if column.upper() not in existing:
+                cursor.execute('ALTER TABLE {} ADD {} FLOAT'.format(tablename, column))
+                existing.add(column.upper())
+        # Nach einem Fehler wird die Verbindung verworfen und die Spalten beim Verbinden neu gelesen.
+        size = max(1, min(MAX_INSERT_ROWS, MAX_INSERT_PARAMS // len(columns)))
+        for i in range(0, len(rows), size):
+            block = rows[i:i + size]
+            cursor.execute(_get_insert_stmt(tablename, columns, len(block)), tuple(value for row in block for value in row))
+        self.__remote.commit()
+
+    def __close_remote(self):
+        if self.__remote is not None:
+            try:
+                self.__remote.close()
+            except Exception:
+                pass
+            self.__remote = None
+
+def create_tables(conn):
+    """Legt die Tabelle mit dem Stand der Übertragung und das Log der eingefügten Zeilen an. Eine
+    replication_state Tabelle mit Hochwassermarken als TIMESTAMP wird verworfen."""
+    columns = [val[1].upper() for val in conn.execute('PRAGMA table_info({})'.format(STATE_TABLE))]
+    if 'HIGH_WATER' in columns:
+        logging.warning('Die Hochwassermarken aus %s werden verworfen, alle Zeilen werden erneut übertragen.', STATE_TABLE)
+        conn.execute('DROP TABLE {}'.format(STATE_TABLE))
+    conn.execute('CREATE TABLE IF NOT EXISTS {} (TARGET TEXT, TABLENAME TEXT, SEQ INTEGER, COPIED INTEGER, '
+                 'PRIMARY KEY (TARGET, TABLENAME)) WITHOUT ROWID'.format(STATE_TABLE))
+    conn.execute('CREATE TABLE IF NOT EXISTS {} (SEQ INTEGER PRIMARY KEY AUTOINCREMENT, TABLENAME TEXT, '
+                 'TIMESTAMP INTEGER)'.format(LOG_TABLE))
+    conn.execute('CREATE INDEX IF NOT EXISTS {0}_tablename ON {0} (TABLENAME, SEQ)'.format(LOG_TABLE))
+    conn.commit()
+
+def create_trigger(conn, tablename):
+    """Legt den Trigger an, der jede in die Sensortabelle eingefügte Zeile in das Log schreibt."""
+    conn.execute("CREATE TRIGGER IF NOT EXISTS {0}_replication AFTER INSERT ON {0} BEGIN "
+                 "INSERT INTO {1} (TABLENAME, TIMESTAMP) VALUES ('{2}', NEW.TIMESTAMP); END"
+                 .format(tablename, LOG_TABLE, tablename.lower()))
+    conn.commit()
+
+def get_state(conn, tablename, target):
+    """Liefert (SEQ, COPIED) der Tabelle für das Ziel oder None, wenn sie noch nie übertragen wurde."""
+    row = conn.execute('SELECT SEQ, COPIED FROM {} WHERE TARGET = ? AND TABLENAME = ?'.format(STATE_TABLE),
+                       (target, tablename.lower())).fetchone()
+    return tuple(row) if row is not None else None
+
+def set_state(conn, tablename, target, seq, copied):
+    conn.execute('INSERT INTO {} (TARGET, TABLENAME, SEQ, COPIED) VALUES (?, ?, ?, ?) '
+                 'ON CONFLICT (TARGET, TABLENAME) DO UPDATE SET SEQ = excluded.SEQ, COPIED = excluded.COPIED'.format(STATE_TABLE),
+                 (target, tablename.lower(), seq, copied))
+    conn.commit()
+
+def prune_log(conn, tablename):
+    """Löscht die Einträge des Logs, die an alle Ziele übertragen sind."""
+    conn.execute('DELETE FROM {} WHERE TABLENAME = ? AND SEQ <= (SELECT MIN(SEQ) FROM {} WHERE TABLENAME = ?)'
+                 .format(LOG_TABLE, STATE_TABLE), (tablename.lower(), tablename.lower()))
+    conn.commit()
+
+def get_replicated_until(conn, tablename):
+    """Liefert den TIMESTAMP, vor dem alle Zeilen der Tabelle an alle Ziele übertragen sind (None,
+    wenn keine Zeile mehr wartet). Wurde die Tabelle an ein Ziel noch nie übertragen, ist es das
+    Minimum, es darf dann nichts archiviert werden."""
+    until = None
+    for (target,) in conn.execute('SELECT DISTINCT TARGET FROM {}'.format(STATE_TABLE)).fetchall():
+        state = get_state(conn, tablename, target)
+        if state is None:
+            return -2**62
+        seq, copied = state
+        # Die Kopie ist bis einschließlich COPIED übertragen, spätere ältere Zeilen stehen im Log.
+        if copied is not None:
+            until = _min(until, copied + 1)
+        row = conn.execute('SELECT MIN(TIMESTAMP) FROM {} WHERE TABLENAME = ? AND SEQ > ?'.format(LOG_TABLE),
+                           (tablename.lower(), seq)).fetchone()
+        if row[0] is not None:
+            until = _min(until, row[0])
+    return until
+
+def is_replicated(conn):
+    """Liefert True, wenn die Datenbank repliziert wird (replication_state existiert)."""
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                        (STATE_TABLE,)).fetchone() is not None
+
+def _min(value, other):
+    return other if value is None else min(value, other)
+
+def _get_insert_stmt(tablename, columns, count):
+    """Liefert ein INSERT für count Zeilen, das vorhandene TIMESTAMPs überspringt."""
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    return 'INSERT INTO {0} ({1}) SELECT {1} FROM (VALUES {2}) AS v ({1}) ' \
+           'WHERE NOT EXISTS (SELECT 1 FROM {0} t WHERE t.TIMESTAMP = v.TIMESTAMP)' \
+           .format(tablename, ', '.join(columns), ', '.join([row] * count))
+
+if __name__ == '__main__':
+    logging.basicConfig(format = '%(asctime)s %(message)s', level = logging.INFO)
+    replicator = Replicator.mssql_from_environment(sys.argv[1] if len(sys.argv) > 1 else '../data/sensordata.db')
+    while replicator.replicate():
+        pass
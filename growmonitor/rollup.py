@@ -0,0 +1,178 @@
+"""Verdichtete Tabellen (Rollups) mit MIN, MAX, SUM und CNT pro Sensor, Werttyp und Zeitblock.
+
+Die Tabellen rollup_60, rollup_600 und rollup_3600 werden von db.Database beim Schreiben
+inkrementell aktualisiert. Für bestehende Datenbanken werden sie mit
+
+    python3 rollup.py ../data/sensordata.db
+
+aus den data_* Tabellen aufgebaut. Der Mittelwert eines Blocks ist SUM / CNT. Monate, deren
+Rohdaten archiviert sind (siehe archive.py), werden dabei nicht neu berechnet.
+"""
+
+import logging
+import sqlite3
+import sys
+import narrow
+
+# Blockgrößen in Sekunden (1 min, 10 min, 1 h)
+LEVELS = [60, 600, 3600]
+
+def table_name(level):
+    """Liefert den Namen der Rollup Tabelle für die Blockgröße in Sekunden."""
+    return 'rollup_{}'.format(level)
+
+def create_tables(cursor, tables):
+    """Legt die Rollup Tabellen an, wenn sie in tables (Namen in Kleinbuchstaben) fehlen."""
+    for level in LEVELS:
+        tablename = table_name(level)
+        if tablename not in tables:
+            cursor.execute(
+                'CREATE TABLE IF NOT EXISTS {} (SENSOR TEXT, VALUETYPE TEXT, BUCKET INTEGER, '
+                'CNT INTEGER, SUM REAL, MIN REAL, MAX REAL, '
+                'PRIMARY KEY (SENSOR, VALUETYPE, BUCKET)) WITHOUT ROWID'.format(tablename))
+            tables.add(tablename)
+
+def aggregate(records, level):
+    """Verdichtet die Datensätze (Format von db._prepare_record) in Blöcke der angegebenen Größe.
+    OFFSET wird wie ein eigener Werttyp behandelt, leere Werte werden ignoriert.
+
+    Returns:
+        list: Tupel (SENSOR, VALUETYPE, BUCKET, CNT, SUM, MIN, MAX)
+    """
+    buckets = {}
+    for record in records:
+        bucket = record['TIMESTAMP'] // level * level
+        values = dict(record['VALUE'])
+        values['OFFSET'] = record['OFFSET']
+        for valuetype, value in values.items():
+            if value is None:
+                continue
+            value = float(value)
+            key = (record['SENSOR'], valuetype, bucket)
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [1, value, value, value]
+            else:
+                agg[0] += 1
+                agg[1] += value
+                agg[2] = min(agg[2], value)
+                agg[3] = max(agg[3], value)
+    return [key + tuple(agg) for key, agg in buckets.items()]
+
+def update(cursor, records):
+    """Addiert die Datensätze zu den bestehenden Blöcken aller Rollup Tabellen. Läuft in der
+    Transaktion des Aufrufers, damit Rohdaten und Rollups immer zusammenpassen."""
+    for level in LEVELS:
+        rows = aggregate(records, level)
+        if len(rows) == 0:
+            continue
+        cursor.executemany(
+            'INSERT INTO {} (SENSOR, VALUETYPE, BUCKET, CNT, SUM, MIN, MAX) VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (SENSOR, VALUETYPE, BUCKET) DO UPDATE SET '
+            'CNT = CNT + excluded.CNT, SUM = SUM + excluded.SUM, '
+            'MIN = min(MIN, excluded.MIN), MAX = max(MAX, excluded.MAX)'.format(table_name(level)), rows)
+
+def backfill(conn, table_prefix = 'data', tables = None, start = None, end = None):
+    """Baut die Rollups aus den Rohdaten neu auf. Pro Tabelle werden die betroffenen Blöcke in einer
+    Transaktion gelöscht und mit GROUP BY neu berechnet. Der laufende Writer kann dazwischen schreiben.
+
+    conn         -- Offene SQLite Verbindung.
+    table_prefix -- Prefix der Sensortabellen.
+    tables       -- Liste der Sensortabellen. Standardmäßig alle Tabellen mit table_prefix und
+                    die Tabelle des schmalen Layouts (siehe narrow.py), wenn sie existiert.
+    start, end   -- Zeitraum (TIMESTAMP), der neu berechnet wird. Standardmäßig alles. Der Beginn
+                    wird pro Tabelle auf das Ende der archivierten Monate gesetzt, da deren Blöcke
+                    nicht mehr aus den Rohdaten berechnet werden können.
+    """
+    # Erst hier importiert: archive lädt numpy und importiert (über partition) dieses Modul.
+    import archive
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    existing = set(val[0].lower() for val in cursor.fetchall())
+    if tables is None:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'", (table_prefix + '\\_%',))
+        tables = [val[0] for val in cursor.fetchall()]
+        if narrow.MEASUREMENT_TABLE in existing:
+            tables.append(narrow.MEASUREMENT_TABLE)
+    create_tables(cursor, existing)
+    conn.commit()
+
+    for tablename in tables:
+        if tablename == narrow.MEASUREMENT_TABLE:
+            _backfill_narrow(conn, cursor, start, end)
+            continue
+        archived = archive.get_archived_until(conn, tablename)
+        table_start = start if archived is None or (start is not None and start > archived) else archived
+        if table_start is not None and end is not None and table_start > end:
+            continue
+        cursor.execute('PRAGMA table_info({})'.format(tablename))
+        valuetypes = [val[1] for val in cursor.fetchall() if val[1].upper() not in ('TIMESTAMP', 'SENSOR')]
+        try:
+            cursor.execute('SELECT DISTINCT TRIM(SENSOR) FROM {}'.format(tablename))
+            sensors = [val[0] for val in cursor.fetchall()]
+            condition = 'SENSOR IN ({})'.format(', '.join(['?'] * len(sensors)))
+            for i, level in enumerate(LEVELS):
+                # Die Monatsgrenze aus archive_state ist ein Vielfaches jeder Blockgröße.
+                lower = table_start // level * level if table_start is not None else -2**62
+                upper = end // level * level + level if end is not None else 2**62
+                cursor.execute('DELETE FROM {} WHERE {} AND BUCKET >= ? AND BUCKET < ?'.format(table_name(level), condition),
+                               sensors + [lower, upper])
+                if i > 0:
+                    _derive(cursor, LEVELS[i - 1], level, condition, sensors, lower, upper)
+                    continue
+                for valuetype in valuetypes:
+                    cursor.execute(
+                        'INSERT INTO {0} (SENSOR, VALUETYPE, BUCKET, CNT, SUM, MIN, MAX) '
+                        'SELECT TRIM(SENSOR), ?, TIMESTAMP / {1} * {1}, COUNT({2}), SUM({2}), MIN({2}), MAX({2}) '
+                        'FROM {3} WHERE {2} IS NOT NULL AND TIMESTAMP >= ? AND TIMESTAMP < ? '
+                        'GROUP BY TRIM(SENSOR), TIMESTAMP / {1}'.format(table_name(level), level, valuetype, tablename),
+                        (valuetype, lower, upper))
+            conn.commit()
+            logging.info('Rollups für %s neu berechnet.', tablename)
+        except Exception:
+            conn.rollback()
+            raise
+
+def _derive(cursor, finer, level, condition, params, lower, upper):
+    """Berechnet die Blöcke von level aus der nächstfeineren Rollup Tabelle statt aus den Rohdaten.
+    Die Blockgrößen in LEVELS sind jeweils ein Vielfaches der vorherigen."""
+    cursor.execute(
+        'INSERT INTO {0} (SENSOR, VALUETYPE, BUCKET, CNT, SUM, MIN, MAX) '
+        'SELECT SENSOR, VALUETYPE, BUCKET / {1} * {1}, SUM(CNT), SUM(SUM), MIN(MIN), MAX(MAX) FROM {2} '
+        'WHERE {3} AND BUCKET >= ? AND BUCKET < ? GROUP BY SENSOR, VALUETYPE, BUCKET / {1}'
+        .format(table_name(level), level, table_name(finer), condition), list(params) + [lower, upper])
+
+def _backfill_narrow(conn, cursor, start, end):
+    """Baut die Rollups aller Sensoren in der Tabelle measurement in einer Transaktion neu auf."""
+    condition = 'SENSOR IN (SELECT NAME FROM {})'.format(narrow.SENSOR_TABLE)
+    try:
+        for i, level in enumerate(LEVELS):
+            lower = start // level * level if start is not None else -2**62
+            upper = end // level * level + level if end is not None else 2**62
+            cursor.execute('DELETE FROM {} WHERE {} AND BUCKET >= ? AND BUCKET < ?'.format(table_name(level), condition),
+                           (lower, upper))
+            if i > 0:
+                _derive(cursor, LEVELS[i - 1], level, condition, [], lower, upper)
+                continue
+            cursor.execute(
+                'INSERT INTO {0} (SENSOR, VALUETYPE, BUCKET, CNT, SUM, MIN, MAX) '
+                'SELECT s.NAME, v.NAME, m.TIMESTAMP / {1} * {1}, COUNT(m.VALUE), SUM(m.VALUE), MIN(m.VALUE), MAX(m.VALUE) '
+                'FROM {2} s CROSS JOIN {3} v JOIN {4} m ON m.SENSOR_ID = s.ID AND m.VALUETYPE_ID = v.ID '
+                'WHERE m.VALUE IS NOT NULL AND m.TIMESTAMP >= ? AND m.TIMESTAMP < ? '
+                'GROUP BY s.NAME, v.NAME, m.TIMESTAMP / {1}'.format(
+                    table_name(level), level, narrow.SENSOR_TABLE, narrow.VALUETYPE_TABLE, narrow.MEASUREMENT_TABLE),
+                (lower, upper))
+        conn.commit()
+        logging.info('Rollups für %s neu berechnet.', narrow.MEASUREMENT_TABLE)
+    except Exception:
+        conn.rollback()
+        raise
+
+if __name__ == '__main__':
+    logging.basicConfig(format = '%(asctime)s %(message)s', level = logging.INFO)
+    filename = sys.argv[1] if len(sys.argv) > 1 else '../data/sensordata.db'
+    conn = sqlite3.connect(filename, timeout = 60)
+    try:
+        backfill(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,89 @@
+"""Laufzeitumgebung auf Basis von asyncio (python3 main.py --async). Statt eines Schreibthreads pro
+write_queue Aufruf gibt es eine Eventloop mit folgenden Tasks:
+
+    Cronjob.start_working_async  Plant die Jobs, async Treiber laufen in der Eventloop, alle
+                                 anderen im Threadpool des Cronjobs.
+    Datenbank                    Liest aus einer begrenzten asyncio.Queue und schreibt alle
+                                 wartenden Datensätze mit Database.flush in einem eigenen Thread.
+    Textdateien                  Liest aus einer eigenen Queue und schreibt mit TextLog.
+
+Ist eine Queue voll, wartet der Cronjob, bis wieder Platz ist, statt den Speicher zu füllen. Weitere
+Empfänger (z. B. PushServer.publish) werden als listeners übergeben und direkt in der Eventloop
+aufgerufen, sie dürfen daher nicht blockieren. Mit compressor gehen nur die von Compressor.filter
+gelieferten Datensätze in die Queues, die listeners erhalten alle.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+async def run(jobs, database, textlog = None, queue_size = 1000, disable_cron = False, catch_up = False,
+              listeners = (), compressor = None):
+    """Führt die Jobs aus, bis jobs.stop() aufgerufen oder der Task abgebrochen wird. Danach werden
+    die Queues noch geleert.
+
+    Args:
+        jobs (Cronjob): Die Jobs.
+        database (db.Database): Ziel der Datensätze.
+        textlog (TextLog, optional): Ziel der Textdateien. Defaults to None.
+        queue_size (int, optional): Maximale Anzahl der wartenden Datensätze pro Queue. Defaults to 1000.
+        disable_cron (bool, optional): Siehe Cronjob.start_working. Defaults to False.
+        catch_up (bool, optional): Siehe Cronjob.start_working. Defaults to False.
+        listeners (list, optional): Funktionen, die jeden Datensatz sofort erhalten. Defaults to ().
+        compressor (compress.Compressor, optional): Verdichtung vor dem Speichern. Defaults to None.
+    """
+    # Ein eigener Thread für die Datenbank, damit immer nur ein Schreibvorgang läuft.
+    with ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'database') as db_executor:
+        consumers = [(asyncio.Queue(queue_size), lambda batch: _write_database(database, batch), db_executor)]
+        if textlog is not None:
+            consumers.append((asyncio.Queue(queue_size), lambda batch: _write_textlog(textlog, batch), None))
+        tasks = [asyncio.create_task(consume(queue, handler, executor)) for queue, handler, executor in consumers]
+
+        async def on_job_ready(data):
+            for listener in listeners:
+                try:
+                    listener(data)
+                except Exception:
+                    logging.exception('Fehler beim Weitergeben von %s.', data)
+            for record in compressor.filter(data) if compressor is not None else [data]:
+                for queue, handler, executor in consumers:
+                    await queue.put(record)
+
+        try:
+            await jobs.start_working_async(disable_cron = disable_cron, on_job_ready = on_job_ready,
+                                           catch_up = catch_up)
+        finally:
+            # Ende der Queue: Die Consumer schreiben die restlichen Datensätze und beenden sich.
+            for record in compressor.flush() if compressor is not None else []:
+                for queue, handler, executor in consumers:
+                    await queue.put(record)
+            for queue, handler, executor in consumers:
+                await queue.put(None)
+            await asyncio.gather(*tasks, return_exceptions = True)
+
+async def consume(queue, handler, executor = None):
+    """Liest Datensätze aus der Queue und übergibt alle bereits wartenden als Liste an handler, der
+    im executor (None für den Standard Threadpool) läuft. Endet mit dem Datensatz None."""
+    loop = asyncio.get_running_loop()
+    finished = False
+    while not finished:
+        batch = [await queue.get()]
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch[-1] is None:
+            finished = True
+            batch.pop()
+        if len(batch) > 0:
+            try:
+                await loop.run_in_executor(executor, handler, batch)
+            except Exception:
+                logging.exception('Fehler beim Verarbeiten von %d Datensätzen.', len(batch))
+
+def _write_database(database, batch):
+    for data in batch:
+        database.enqueue(data)
+    database.flush()
+
+def _write_textlog(textlog, batch):
+    for data in batch:
+        textlog.write(data)
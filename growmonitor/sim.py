@@ -0,0 +1,188 @@
+"""Simulierte Treiber mit denselben Klassennamen und Parametern wie rasp.py. Sie benötigen keine
+Hardware und können dem Cronjob über den Parameter drivers übergeben werden:
+
+    import sim
+    jobs = Cronjob('cronjobs.json', drivers = sim)
+
+Zusätzlich zu den Parametern der echten Klassen verstehen alle Klassen folgende params:
+    latency (optional): Mittlere Dauer von do_work in Sekunden. Standardwert siehe DEFAULT_LATENCY.
+    jitter (optional): Relative Schwankung der Dauer (0.2 = +/-20 %). Standardwert ist 0.2.
+    failure_rate (optional): Wahrscheinlichkeit, dass do_work einen OSError wirft. Standardwert ist 0.
+    seed (optional): Startwert des Zufallsgenerators für reproduzierbare Werte.
+"""
+
+import math
+import random
+import threading
+import time
+from datetime import datetime
+import history
+import derived
+import rasp
+
+# Typische Dauer eines Aufrufes auf dem Raspberry Pi in Sekunden
+DEFAULT_LATENCY = {
+    'Bme280': 0.01,
+    'Tsl2561': 0.015,
+    'Relais': 0.0005,
+    'Fan': 0.0005,
+    'Cam': 1.0,
+    'Relaymonitor': 0.0005,
+    'Adc': 0.01
+}
+
+# Aufrufe und simulierte Fehler aller Instanzen (für benchmark.py)
+statistics = {'calls': 0, 'failures': 0}
+_statistics_lock = threading.Lock()
+
+def reset_statistics():
+    with _statistics_lock:
+        statistics['calls'] = 0
+        statistics['failures'] = 0
+
+def _count(failed):
+    with _statistics_lock:
+        statistics['calls'] += 1
+        statistics['failures'] += 1 if failed else 0
+
+class _Simulated:
+    """Basisklasse: Wartet die eingestellte Dauer und wirft mit der eingestellten Wahrscheinlichkeit
+    einen Fehler, bevor der Wert geliefert wird."""
+
+    def __init__(self, params):
+        self._latency = params.get('latency', DEFAULT_LATENCY.get(type(self).__name__, 0))
+        self._jitter = params.get('jitter', 0.2)
+        self._failure_rate = params.get('failure_rate', 0)
+        self._random = random.Random(params.get('seed'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def _simulate(self):
+        if self._latency > 0:
+            time.sleep(self._latency * (1 + self._random.uniform(-self._jitter, self._jitter)))
+        failed = self._random.random() < self._failure_rate
+        _count(failed)
+        if failed:
+            raise OSError('Simulierter Fehler in {}.'.format(type(self).__name__))
+
+class Bme280(_Simulated):
+    """Liefert Temperatur, Feuchte und Druck als Zufallsbewegung um typische Werte der Box."""
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.__temp = self._random.uniform(18, 26)
+        self.__hum = self._random.uniform(40, 70)
+        self.__pres = self._random.uniform(960, 1020)
+
+    def do_work(self, current_values={}):
+        self._simulate()
+        self.__temp = min(35, max(10, self.__temp + self._random.gauss(0, 0.1)))
+        self.__hum = min(95, max(20, self.__hum + self._random.gauss(0, 0.3)))
+        self.__pres = self.__pres + self._random.gauss(0, 0.05)
+        return {
+            'HUM': round(self.__hum, 1),
+            'TEMP': round(self.__temp, 1),
+            'PRES': round(self.__pres, 1)
+        }
+
+    @staticmethod
+    def calc_dewp(temp, hum):
+        """Berechnet den Taupunkt wie rasp.Bme280.calc_dewp."""
+        return derived.dewpoint(temp, hum)
+
+class Tsl2561(_Simulated):
+    """Liefert einen Luxwert, der dem Tagesverlauf folgt."""
+
+    def do_work(self, current_values={}):
+        self._simulate()
+        hour = datetime.now().hour + datetime.now().minute / 60
+        daylight = max(0, math.sin((hour - 6) / 12 * math.pi))
+        return int(daylight * 20000 + self._random.uniform(0, 50))
+
+class Relais(_Simulated):
+    """Schaltet nach onFrom/onTo bzw. offFrom/offTo, aber ohne GPIO. Die Entscheidung trifft wie
+    bei rasp.Relais die Funktion rasp.relais_state."""
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.__state = params.get('state', None)
+        self.__on, self.__off = rasp.get_relais_windows(params)
+
+    def do_work(self, current_values={}):
+        self._simulate()
+        self.__state = rasp.relais_state(rasp.seconds_of_day(time.time()), self.__on, self.__off, self.__state)
+        return self.__state
+
+class Fan(_Simulated):
+    """Regelt den Lüfter mit rasp.fan_state (inklusive smooth) wie rasp.Fan, setzt aber keinen GPIO
+    Pin. Wie rasp.Fan wird kein Wert geliefert, der Zustand steht in state."""
+
+    # Wie rasp.Fan.inputs
+    inputs = ('boxsensor', 'roomsensor', 'lightstate')
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.__boxsensor = params['boxsensor']
+        self.__roomsensor = params['roomsensor']
+        self.__lightstate = params['lightstate']
+        self.__smooth = params.get('smooth', None)
+        self.__limits = rasp.get_fan_limits(params)
+        self.state = False
+
+    def do_work(self, current_values):
+        self._simulate()
+        box_values = history.get_values(current_values, self.__boxsensor, self.__smooth)
+        room_values = history.get_values(current_values, self.__roomsensor, self.__smooth)
+        self.state = rasp.fan_state(box_values['TEMP'], box_values['HUM'], room_values['TEMP'],
+                                    derived.get_dewpoint(box_values), derived.get_dewpoint(room_values),
+                                    current_values[self.__lightstate]['VALUE'], self.__limits)
+
+class Cam(_Simulated):
+    """Simuliert die Aufnahme eines Bildes. Ist filename angegeben, werden size Bytes (Standardwert
+    50000) geschrieben, sonst wird nur gewartet."""
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.__filename = params.get('filename', None)
+        self.__size = int(params.get('size', 50000))
+
+    def do_work(self, current_values={}):
+        self._simulate()
+        if self.__filename is not None:
+            with open(self.__filename, 'wb') as file:
+                file.write(self._random.randbytes(self.__size))
+
+    def close(self):
+        pass
+
+class Relaymonitor(_Simulated):
+    """Liefert die Zustände der 4 Relaiskanäle. Der Zustand eines Kanals wechselt selten."""
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.__states = [0, 0, 0, 0]
+
+    def do_work(self, current_values={}):
+        self._simulate()
+        self.__states = [1 - state if self._random.random() < 0.01 else state for state in self.__states]
+        return dict(zip(['CH1', 'CH2', 'CH3', 'CH4'], self.__states))
+
+class Adc(_Simulated):
+    """Liefert verrauschte Werte der 4 Kanäle des AD Wandlers (Einzelmessung wie rasp.Adc ohne
+    sample_rate)."""
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.__levels = [self._random.randint(0, 32767) for i in range(4)]
+
+    def do_work(self, current_values={}):
+        self._simulate()
+        values = [min(32767, max(-32768, int(level + self._random.gauss(0, 20)))) for level in self.__levels]
+        return dict(zip(['CH1', 'CH2', 'CH3', 'CH4'], values))
+
+    def close(self):
+        pass
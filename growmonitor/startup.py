@@ -0,0 +1,90 @@
+"""Misst einen Kaltstart von main.py, ohne Jobs auszuführen:
+
+    python3 startup.py [cronjobs.json] [--sim] [--runs 5] [--json]
+
+Jeder Lauf startet einen neuen Python Prozess, der die Module von main.py importiert, die SQLite
+Datenbank (in einem temporären Verzeichnis) öffnet und alle Treiber der Konfiguration wie der
+Cronjob erzeugt. Mit --sim werden die simulierten Treiber verwendet (läuft ohne Raspberry Pi).
+Ausgegeben werden pro Lauf:
+    imports   Sekunden vom Start des Prozesses bis alle Module importiert sind
+    ready     Sekunden vom Start des Prozesses bis alle Treiber erzeugt sind
+    modules   Anzahl der geladenen Module
+    rss       Maximaler Speicherverbrauch des Prozesses in MB
+    loaded    Geladene Bibliotheken aus LIBRARIES
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Module, die main.py beim Start importiert
+MODULES = ('cronjob', 'textlog', 'db', 'metrics', 'push')
+# Bibliotheken, die den Start verlangsamen, wenn sie unnötig geladen werden
+LIBRARIES = ('numpy', 'RPi.GPIO', 'smbus2', 'bme280', 'tsl2561', 'Adafruit_ADS1x15', 'cv2', 'pymssql', 'asyncio')
+
+def measure(configfile, sim):
+    """Startet einen Prozess mit --single und liefert dessen Ergebnis mit den Zeiten ab dem Start."""
+    command = [sys.executable, os.path.abspath(__file__), '--single', os.path.abspath(configfile)] + (['--sim'] if sim else [])
+    started = time.time()
+    output = subprocess.run(command, stdout = subprocess.PIPE, check = True).stdout
+    result = json.loads(output.decode().splitlines()[-1])
+    result['imports'] = round(result['imports'] - started, 3)
+    result['ready'] = round(result['ready'] - started, 3)
+    return result
+
+def run_single(configfile, sim):
+    """Läuft im gemessenen Prozess. Die Zeiten werden als UNIX Timestamps geliefert."""
+    import importlib
+    for name in MODULES:
+        importlib.import_module(name)
+    imported = time.time()
+
+    import cronjob
+    import db
+    drivers = importlib.import_module('sim') if sim else cronjob.Registry()
+    with open(configfile, 'r') as json_file:
+        config = json.load(json_file)
+    with tempfile.TemporaryDirectory(prefix = 'growmonitor-startup-') as directory:
+        with db.Database.sqlite(os.path.join(directory, 'sensordata.db'), persistent = True, rollups = True):
+            instances = [getattr(drivers, elem['class'])(elem.get('params', {})) for elem in config.values()]
+        ready = time.time()
+        for instance in instances:
+            cronjob._close_instance(instance)
+    return {
+        'imports': imported,
+        'ready': ready,
+        'modules': len(sys.modules),
+        # ru_maxrss ist unter Linux in KB angegeben.
+        'rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'loaded': [name for name in LIBRARIES if name in sys.modules]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Misst Startzeit und Speicherverbrauch von main.py.')
+    parser.add_argument('configfile', nargs = '?', default = 'cronjobs.json')
+    parser.add_argument('--sim', action = 'store_true', help = 'Simulierte Treiber (sim.py) verwenden.')
+    parser.add_argument('--runs', type = int, default = 5, help = 'Anzahl der Kaltstarts.')
+    parser.add_argument('--json', action = 'store_true', help = 'Ergebnisse als JSON ausgeben.')
+    parser.add_argument('--single', action = 'store_true', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_single(args.configfile, args.sim)))
+        return
+
+    results = [measure(args.configfile, args.sim) for i in range(args.runs)]
+    if args.json:
+        print(json.dumps(results, indent = 2))
+        return
+    print('{:>8} {:>8} {:>8} {:>8}  {}'.format('imports', 'ready', 'modules', 'rss MB', 'loaded'))
+    for result in results:
+        print('{:>8} {:>8} {:>8} {:>8}  {}'.format(result['imports'], result['ready'], result['modules'],
+                                                   result['rss_mb'], ', '.join(result['loaded'])), flush = True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+"""Die Module liegen flach in growmonitor/ und werden dort ohne Paket importiert (wie beim Start mit
+python3 main.py). Die Tests laufen ohne Hardware: python -m pytest -q growmonitor/tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
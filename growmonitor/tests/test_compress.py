@@ -0,0 +1,77 @@
+"""Verdichtung mit deadband und swinging_door und Rekonstruktion mit reconstruct."""
+
+import math
+import random
+import numpy as np
+from compress import Compressor, reconstruct
+
+# 2024-01-01 00:00:00 UTC
+START = 1704067200
+
+def _series(count = 1440):
+    """Temperatur mit Tagesgang, Sprüngen (Licht an und aus) und Rauschen, ein Wert pro Minute."""
+    generator = random.Random(1)
+    return [{'TIMESTAMP': START + 60 * i, 'OFFSET': 0.1, 'SENSOR': 'box',
+             'VALUE': {'TEMP': round(22 + 3 * math.sin(i / 229) + (2 if 360 <= i < 1080 else 0) + generator.gauss(0, 0.03), 2),
+                       'HUM': round(55 + 10 * math.cos(i / 300), 1)}}
+            for i in range(count)]
+
+def _compress(records, settings):
+    compressor = Compressor(settings = {'box': settings})
+    stored = [result for record in records for result in compressor.filter(record)]
+    return stored + compressor.flush()
+
+def _max_error(records, stored, key, method):
+    timestamps = np.array([record['TIMESTAMP'] for record in records])
+    values = np.array([record['VALUE'][key] for record in records])
+    restored = reconstruct([record['TIMESTAMP'] for record in stored], [record['VALUE'][key] for record in stored],
+                           timestamps, method)
+    assert not np.isnan(restored).any()
+    return np.abs(restored - values).max()
+
+def test_swinging_door_round_trip(tmp_path):
+    records = _series()
+    deviation = {'TEMP': 0.1, 'HUM': 0.5}
+    stored = _compress(records, {'method': 'swinging_door', 'deviation': deviation, 'heartbeat': 30})
+    assert len(stored) < len(records) / 4
+    # Gespeichert werden Datensätze aus der Serie, aufsteigend und ohne doppelte.
+    timestamps = [record['TIMESTAMP'] for record in stored]
+    assert timestamps == sorted(set(timestamps))
+    assert all(record in records for record in stored)
+    assert stored[0] == records[0] and stored[-1] == records[-1]
+    for key in deviation:
+        assert _max_error(records, stored, key, 'linear') <= 2 * deviation[key] + 1e-9
+    # heartbeat: Zwischen zwei gespeicherten Datensätzen liegen höchstens 30 Minuten.
+    assert max(np.diff(timestamps)) <= 30 * 60
+
+def test_deadband_round_trip(tmp_path):
+    records = _series()
+    stored = _compress(records, {'method': 'deadband', 'deviation': {'TEMP': 0.2, 'HUM': 1}})
+    assert len(stored) < len(records) / 2
+    assert _max_error(records, stored, 'TEMP', 'step') <= 0.2 + 1e-9
+    assert _max_error(records, stored, 'HUM', 'step') <= 1 + 1e-9
+    assert max(np.diff([record['TIMESTAMP'] for record in stored])) <= 10 * 60
+
+def test_changes_that_are_always_stored():
+    compressor = Compressor(settings = {'relais': {'method': 'swinging_door', 'deviation': 1}})
+    first = {'TIMESTAMP': START, 'OFFSET': 0, 'SENSOR': 'relais', 'VALUE': {'STATE': 'on', 'TEMP': 20}}
+    second = {'TIMESTAMP': START + 60, 'OFFSET': 0, 'SENSOR': 'relais', 'VALUE': {'STATE': 'on', 'TEMP': 20.1}}
+    third = {'TIMESTAMP': START + 120, 'OFFSET': 0, 'SENSOR': 'relais', 'VALUE': {'STATE': 'off', 'TEMP': 20.1}}
+    fourth = {'TIMESTAMP': START + 180, 'OFFSET': 0, 'SENSOR': 'relais', 'VALUE': {'TEMP': 20.1}}
+    assert compressor.filter(first) == [first]
+    assert compressor.filter(second) == []
+    # Ein geänderter Text speichert den zurückgehaltenen und den neuen Datensatz.
+    assert compressor.filter(third) == [second, third]
+    assert compressor.filter(fourth) == [fourth]
+    assert compressor.flush() == []
+    # Sensoren ohne Eintrag werden nicht verdichtet.
+    other = dict(first, SENSOR = 'other')
+    assert compressor.filter(other) == [other]
+
+def test_reconstruct_gaps():
+    timestamps, values = [0, 60, 3600], [1.0, 2.0, 4.0]
+    grid = np.array([-60, 0, 30, 60, 1800, 3600, 3660])
+    step = reconstruct(timestamps, values, grid, 'step', max_gap = 600)
+    assert np.array_equal(step, [np.nan, 1, 1, 2, np.nan, 4, 4], equal_nan = True)
+    linear = reconstruct(timestamps, values, grid, 'linear', max_gap = 600)
+    assert np.array_equal(linear, [np.nan, 1, 1.5, 2, np.nan, 4, np.nan], equal_nan = True)
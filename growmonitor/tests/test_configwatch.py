@@ -0,0 +1,104 @@
+"""Neueinlesen der Konfiguration im laufenden Cronjob: Unveränderte Jobs behalten ihre Instanz."""
+
+import json
+import os
+import threading
+import time
+import types
+from cronjob import Cronjob
+
+class Instance:
+    """Liefert die laufende Nummer der Instanz als Wert."""
+    created = []
+
+    def __init__(self, params):
+        self.params = params
+        self.closed = False
+        self.number = len(Instance.created)
+        Instance.created.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def do_work(self, current_values = {}):
+        return self.number
+
+    def close(self):
+        self.closed = True
+
+class _Runner:
+    """Führt start_working in einem eigenen Thread aus und sammelt die Datensätze."""
+
+    def __init__(self, filename):
+        self.records = []
+        self.__changed = threading.Condition()
+        self.jobs = Cronjob(filename, poll_interval = 0.1, drivers = types.SimpleNamespace(Instance = Instance),
+                            transforms = [])
+        self.__thread = threading.Thread(target = self.jobs.start_working,
+                                         kwargs = {'on_job_ready': self.__on_job_ready}, daemon = True)
+
+    def __on_job_ready(self, record):
+        with self.__changed:
+            self.records.append(record)
+            self.__changed.notify_all()
+
+    def wait_for(self, condition, timeout = 10):
+        """Wartet, bis condition für einen neuen Datensatz True liefert."""
+        with self.__changed:
+            start = len(self.records)
+            assert self.__changed.wait_for(lambda: any(condition(record) for record in self.records[start:]), timeout)
+
+    def __enter__(self):
+        self.__thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.jobs.stop()
+        self.__thread.join(10)
+
+def _write_config(filename, config):
+    # Wie ein Editor: neue Datei schreiben und umbenennen.
+    with open(filename + '.tmp', 'w') as file:
+        json.dump(config, file)
+    os.replace(filename + '.tmp', filename)
+
+def test_reload_keeps_unchanged_instances(tmp_path):
+    Instance.created = []
+    filename = str(tmp_path / 'cronjobs.json')
+    _write_config(filename, {
+        'a': {'run_at': '* * * * * *', 'class': 'Instance', 'params': {'x': 1}},
+        'b': {'run_at': '* * * * * *', 'class': 'Instance'}
+    })
+    with _Runner(filename) as runner:
+        runner.wait_for(lambda record: record['SENSOR'] == 'b')
+        a, b = Instance.created
+
+        # Nur run_at von a ändert sich, b wird entfernt und c kommt hinzu.
+        _write_config(filename, {
+            'a': {'run_at': '* * * * * */2', 'class': 'Instance', 'params': {'x': 1}},
+            'c': {'run_at': '* * * * * *', 'class': 'Instance'}
+        })
+        runner.wait_for(lambda record: record['SENSOR'] == 'c')
+        runner.wait_for(lambda record: record['SENSOR'] == 'a')
+        assert len(Instance.created) == 3
+        assert not a.closed and b.closed
+        first_c = next(i for i, record in enumerate(runner.records) if record['SENSOR'] == 'c')
+        assert all(record['SENSOR'] != 'b' for record in runner.records[first_c:])
+
+        # Geänderte params erzeugen eine neue Instanz, die alte wird geschlossen.
+        _write_config(filename, {
+            'a': {'run_at': '* * * * * *', 'class': 'Instance', 'params': {'x': 2}},
+            'c': {'run_at': '* * * * * *', 'class': 'Instance'}
+        })
+        runner.wait_for(lambda record: record['SENSOR'] == 'a' and record['VALUE'] == 3)
+        assert a.closed and not Instance.created[2].closed
+
+        # Eine fehlerhafte Konfiguration wird abgelehnt, die bisherigen Jobs laufen weiter.
+        _write_config(filename, {'a': {'run_at': '* * * * * *', 'class': 'Unbekannt'}})
+        time.sleep(0.5)
+        runner.wait_for(lambda record: record['SENSOR'] == 'c' and record['VALUE'] == 2)
+        assert len(Instance.created) == 4
+        assert not any(instance.closed for instance in Instance.created[2:])
@@ -0,0 +1,123 @@
+"""Heap Scheduler, catch_up und von den Eingängen ausgelöste Läufe mit virtueller Uhr (run_until)."""
+
+import json
+import types
+from cronjob import Cronjob
+from replay import VirtualClock
+
+# 2024-01-01 00:00:00 UTC
+START = 1704067200
+# Uhr des laufenden Tests, Counter stellt sie mit hang vor.
+CLOCK = None
+
+class Counter:
+    """Liefert die Anzahl der Läufe als Wert."""
+
+    def __init__(self, params):
+        self.runs = 0
+        self.hang = params.get('hang')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def do_work(self, current_values = {}):
+        self.runs += 1
+        # Beim ersten Lauf hängt das System hang Sekunden.
+        if self.hang is not None and self.runs == 1:
+            CLOCK.set(CLOCK.time() + self.hang)
+        return self.runs
+
+def _create(tmp_path, config, drivers = None, **kwargs):
+    global CLOCK
+    CLOCK = VirtualClock(START)
+    filename = tmp_path / 'cronjobs.json'
+    filename.write_text(json.dumps(config))
+    drivers = drivers or types.SimpleNamespace(Counter = Counter)
+    return Cronjob(str(filename), drivers = drivers, transforms = [], clock = CLOCK, **kwargs)
+
+def test_schedule_runs_jobs_at_their_times(tmp_path):
+    jobs = _create(tmp_path, {
+        'fast': {'run_at': '* * * * *', 'class': 'Counter'},
+        'slow': {'run_at': '*/5 * * * *', 'class': 'Counter'}
+    })
+    records = []
+    count = jobs.run_until(START + 600, on_job_ready = records.append)
+    assert count == 12
+    assert [record['TIMESTAMP'] for record in records if record['SENSOR'] == 'fast'] == \
+           [START + 60 * i for i in range(1, 11)]
+    assert [record['TIMESTAMP'] for record in records if record['SENSOR'] == 'slow'] == [START + 300, START + 600]
+    assert CLOCK.time() == START + 600
+
+def test_missed_runs_are_skipped(tmp_path):
+    jobs = _create(tmp_path, {'job': {'run_at': '* * * * *', 'class': 'Counter', 'params': {'hang': 300}}})
+    records = []
+    jobs.run_until(START + 600, on_job_ready = records.append)
+    timestamps = [record['TIMESTAMP'] for record in records]
+    # Die Termine während des Hängens (bis START + 360) werden ausgelassen.
+    assert timestamps == [START + 60] + [START + 60 * i for i in range(7, 11)]
+
+def test_missed_runs_are_caught_up(tmp_path):
+    jobs = _create(tmp_path, {'job': {'run_at': '* * * * *', 'class': 'Counter', 'params': {'hang': 300}}})
+    records = []
+    jobs.run_until(START + 600, on_job_ready = records.append, catch_up = True)
+    assert [record['TIMESTAMP'] for record in records] == [START + 60 * i for i in range(1, 11)]
+    # Die nachgeholten Termine behalten ihren TIMESTAMP, OFFSET zeigt die Verspätung.
+    assert records[1]['OFFSET'] == 360 - 120
+
+def test_max_catch_up_limits_the_missed_runs(tmp_path):
+    jobs = _create(tmp_path, {'job': {'run_at': '* * * * *', 'class': 'Counter', 'params': {'hang': 300}}},
+                   max_catch_up = 120)
+    records = []
+    jobs.run_until(START + 600, on_job_ready = records.append, catch_up = True)
+    # Nach dem Hängen (bis START + 360) werden nur die letzten 120 Sekunden nachgeholt.
+    assert [record['TIMESTAMP'] for record in records] == [START + 60] + [START + 60 * i for i in range(5, 11)]
+
+class Dependent(Counter):
+    """Liefert die Summe der Werte der Jobs aus first und second."""
+    inputs = ('first', 'second')
+
+    def __init__(self, params):
+        super().__init__(params)
+        self.params = params
+
+    def do_work(self, current_values = {}):
+        self.runs += 1
+        return sum(current_values[self.params[name]]['VALUE'] for name in self.inputs)
+
+def test_dependent_job_runs_when_all_inputs_are_fresh(tmp_path):
+    jobs = _create(tmp_path, {
+        'a': {'run_at': '* * * * *', 'class': 'Counter'},
+        'b': {'run_at': '*/2 * * * *', 'class': 'Counter'},
+        # Ohne Eingänge liefe der Job nur einmal im Jahr.
+        'sum': {'run_at': '0 0 1 1 *', 'class': 'Dependent', 'params': {'first': 'a', 'second': 'b'}}
+    }, types.SimpleNamespace(Counter = Counter, Dependent = Dependent))
+    records = []
+    jobs.run_until(START + 600, on_job_ready = records.append)
+    timestamps = [record['TIMESTAMP'] for record in records if record['SENSOR'] == 'sum']
+    # Ausgelöst wird jeweils debounce Sekunden nach dem Termin von b, zu dem a und b neue Werte haben.
+    # Der letzte Lauf (START + 600.5) liegt nach dem Ende.
+    assert timestamps == [START + 120 * i for i in range(1, 5)]
+    # Der Job liest die Werte, die a und b bei seinem Start geliefert hatten.
+    assert [record['VALUE'] for record in records if record['SENSOR'] == 'sum'] == [2 * i + i for i in range(1, 5)]
+    assert [record['OFFSET'] for record in records if record['SENSOR'] == 'sum'] == [0.5] * 4
+
+def test_dependent_job_is_not_run_without_values(tmp_path):
+    jobs = _create(tmp_path, {
+        'a': {'run_at': '0 0 1 1 *', 'class': 'Counter'},
+        'b': {'run_at': '* * * * *', 'class': 'Counter'},
+        'sum': {'run_at': '* * * * *', 'class': 'Dependent', 'params': {'first': 'a', 'second': 'b'}}
+    }, types.SimpleNamespace(Counter = Counter, Dependent = Dependent))
+    records = []
+    jobs.run_until(START + 600, on_job_ready = records.append)
+    # a hat noch keinen Wert geliefert, auch die Termine in run_at werden ausgelassen.
+    assert [record for record in records if record['SENSOR'] == 'sum'] == []
+
+def test_cyclic_inputs_are_rejected(tmp_path):
+    jobs = _create(tmp_path, {
+        'a': {'run_at': '* * * * *', 'class': 'Counter', 'inputs': ['b']},
+        'b': {'run_at': '* * * * *', 'class': 'Counter', 'inputs': ['a']}
+    })
+    assert jobs.run_until(START + 600) == 0
@@ -0,0 +1,80 @@
+"""Schreiben der Warteschlange mit der dauerhaft offenen Verbindung (persistent) und einzelnes
+Schreiben nach einer fehlgeschlagenen Transaktion."""
+
+import sqlite3
+import db
+
+START = 1704067200
+
+def _record(sensor, timestamp, **values):
+    return {'TIMESTAMP': timestamp, 'OFFSET': 0.1, 'SENSOR': sensor, 'VALUE': values}
+
+def _rows(filename, tablename):
+    conn = sqlite3.connect(filename)
+    try:
+        return conn.execute('SELECT TIMESTAMP, OFFSET, SENSOR, TEMP FROM {} ORDER BY TIMESTAMP'.format(tablename)).fetchall()
+    finally:
+        conn.close()
+
+def test_batch_writes_all_tables_in_wal_mode(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    with db.Database.sqlite(filename, persistent = True) as database:
+        for i in range(10):
+            database.enqueue(_record('box', START + 60 * i, TEMP = 20 + i, HUM = 50))
+            database.enqueue(_record('room', START + 60 * i, TEMP = 18))
+        database.write_queue()
+        database.flush()
+        assert len(_rows(filename, 'data_box')) == 10
+        assert len(_rows(filename, 'data_room')) == 10
+    conn = sqlite3.connect(filename)
+    try:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    finally:
+        conn.close()
+
+def test_batch_adds_new_columns(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    with db.Database.sqlite(filename, persistent = True) as database:
+        database.enqueue(_record('box', START, TEMP = 20))
+        database.flush()
+        # Die Werte aus derived.py kommen z. B. erst nach einem Update hinzu.
+        database.enqueue(_record('box', START + 60, TEMP = 21, DEWP = 10.5))
+        database.flush()
+    conn = sqlite3.connect(filename)
+    try:
+        assert conn.execute('SELECT TIMESTAMP, TEMP, DEWP FROM data_box ORDER BY TIMESTAMP').fetchall() == \
+               [(START, 20, None), (START + 60, 21, 10.5)]
+    finally:
+        conn.close()
+
+def test_failed_record_does_not_block_the_batch(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    with db.Database.sqlite(filename, persistent = True) as database:
+        database.enqueue(_record('box', START, TEMP = 20))
+        database.flush()
+        # Der doppelte TIMESTAMP lässt die Transaktion scheitern, die übrigen Datensätze werden
+        # einzeln geschrieben.
+        database.enqueue(_record('box', START + 60, TEMP = 21))
+        database.enqueue(_record('box', START, TEMP = 99))
+        database.enqueue(_record('room', START, TEMP = 18))
+        database.flush()
+        assert _rows(filename, 'data_box') == [(START, 0.1, 'box', 20), (START + 60, 0.1, 'box', 21)]
+        assert _rows(filename, 'data_room') == [(START, 0.1, 'room', 18)]
+
+        # Der fehlgeschlagene Datensatz bleibt in der Warteschlange und wird beim nächsten Mal geschrieben.
+        conn = sqlite3.connect(filename)
+        try:
+            conn.execute('DELETE FROM data_box WHERE TIMESTAMP = ?', (START,))
+            conn.commit()
+        finally:
+            conn.close()
+        database.flush()
+        assert _rows(filename, 'data_box') == [(START, 0.1, 'box', 99), (START + 60, 0.1, 'box', 21)]
+
+def test_single_writes_without_persistent_connection(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    database = db.Database.sqlite(filename)
+    database.enqueue(_record('box', START, TEMP = 20))
+    database.enqueue(_record('box', START, TEMP = 99))
+    database.flush()
+    assert _rows(filename, 'data_box') == [(START, 0.1, 'box', 20)]
@@ -0,0 +1,78 @@
+"""Abgeleitete Werte (DEWP, VPD, AHUM) beim Schreiben und beim Nachtragen mit backfill."""
+
+import sqlite3
+import numpy as np
+import db
+import derived
+import importlog
+import rollup
+
+# 2024-01-01 00:00:00 UTC
+START = 1704067200
+
+def test_scalar_and_numpy_formulas_agree():
+    temps = np.repeat(np.arange(-10, 45, 0.7), 25)
+    hums = np.tile(np.arange(0, 100, 4.1), len(temps) // 25)
+    vectorized = derived.calculate(temps, hums)
+    for i, (temp, hum) in enumerate(zip(temps.tolist(), hums.tolist())):
+        values = derived.calculate_values(temp, hum)
+        for key in derived.VALUETYPES:
+            if hum <= 0:
+                assert values[key] is None and np.isnan(vectorized[key][i])
+            else:
+                assert values[key] == vectorized[key][i], (key, temp, hum)
+    # Der Taupunkt bei 100 % ist die Temperatur, bei 20 °C und 50 % etwa 9,3 °C.
+    assert derived.dewpoint(20, 100) == 20.0
+    assert derived.dewpoint(20, 50) == 9.3
+
+def test_add_derived():
+    record = {'TIMESTAMP': START, 'OFFSET': 0.1, 'SENSOR': 'box', 'VALUE': {'TEMP': 20, 'HUM': 50, 'VPD': 1.5}}
+    values = derived.add_derived(record)['VALUE']
+    assert values['DEWP'] == 9.3 and values['AHUM'] == derived.calculate_values(20, 50)['AHUM']
+    # Vom Treiber gelieferte Werte bleiben, der ursprüngliche Datensatz wird nicht verändert.
+    assert values['VPD'] == 1.5 and 'DEWP' not in record['VALUE']
+    for other in ({'VALUE': 1}, {'VALUE': {'TEMP': 20}}, {'VALUE': {'TEMP': 20, 'HUM': None}}):
+        assert derived.add_derived(other) is other
+
+def test_backfill_fills_only_null_rows(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    with db.Database.sqlite(filename, persistent = True, rollups = True) as database:
+        for i in range(10):
+            database.enqueue({'TIMESTAMP': START + 60 * i, 'OFFSET': 0.1, 'SENSOR': 'box',
+                              'VALUE': {'TEMP': 20 + i, 'HUM': None if i == 9 else 40 + i}})
+        database.enqueue({'TIMESTAMP': START, 'OFFSET': 0.1, 'SENSOR': 'light', 'VALUE': 100})
+        database.flush()
+        # Neuere Zeilen enthalten die Werte bereits.
+        database.enqueue(derived.add_derived({'TIMESTAMP': START + 600, 'OFFSET': 0.1, 'SENSOR': 'box',
+                                              'VALUE': {'TEMP': 30, 'HUM': 50}}))
+        database.flush()
+    conn = sqlite3.connect(filename)
+    try:
+        conn.execute('UPDATE data_box SET DEWP = 99 WHERE TIMESTAMP = ?', (START,))
+        conn.commit()
+        assert derived.backfill(conn, chunk_size = 3) == 8
+        rows = conn.execute('SELECT TEMP, HUM, DEWP, VPD, AHUM FROM data_box ORDER BY TIMESTAMP').fetchall()
+        assert rows[0][2] == 99 and rows[0][3] is None
+        for temp, hum, dewp, vpd, ahum in rows[1:9] + rows[10:]:
+            assert (dewp, vpd, ahum) == tuple(derived.calculate_values(temp, hum)[key] for key in derived.VALUETYPES)
+        assert rows[9][2:] == (None, None, None)
+        assert derived.backfill(conn) == 0
+        # Die Rollups enthalten die nachgetragenen und die beim Schreiben berechneten Werte.
+        assert conn.execute('SELECT SUM(CNT) FROM {} WHERE VALUETYPE = ?'.format(rollup.table_name(3600)),
+                            ('VPD',)).fetchone()[0] == 9
+        assert 'DEWP' not in [val[1] for val in conn.execute('PRAGMA table_info(data_light)')]
+    finally:
+        conn.close()
+
+def test_write_line_writes_a_header_for_new_columns(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    record = {'TIMESTAMP': START, 'OFFSET': 0.1, 'SENSOR': 'box', 'VALUE': {'TEMP': 20.0, 'HUM': 50}}
+    db.write_line(record)
+    db.write_line(derived.add_derived(dict(record, TIMESTAMP = START + 60)))
+    db.write_line(derived.add_derived(dict(record, TIMESTAMP = START + 120)))
+    conn = sqlite3.connect(str(tmp_path / 'sensordata.db'))
+    try:
+        assert importlog.import_files(conn, [str(tmp_path / 'data_box.txt')]) == 3
+        assert [row[0] for row in conn.execute('SELECT DEWP FROM data_box ORDER BY TIMESTAMP')] == [None, 9.3, 9.3]
+    finally:
+        conn.close()
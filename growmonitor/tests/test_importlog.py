@@ -0,0 +1,86 @@
+"""Laden der Textdateien mit Fortsetzen an der gespeicherten Position."""
+
+import gzip
+import sqlite3
+import archive
+import db
+import importlog
+import rollup
+
+# 2024-01-01 00:00:00 UTC
+START = 1704067200
+
+def _lines(timestamps, header = True, sensor = 'box'):
+    lines = ['TIMESTAMP\tOFFSET\tSENSOR\tTEMP\r\n'] if header else []
+    return ''.join(lines + ['{}\t0.1\t{}\t{}\r\n'.format(timestamp, sensor, 20 + timestamp % 7) for timestamp in timestamps])
+
+def _timestamps(conn, tablename = 'data_box'):
+    return [val[0] for val in conn.execute('SELECT TIMESTAMP FROM {} ORDER BY TIMESTAMP'.format(tablename))]
+
+def test_resume_reads_only_new_lines(tmp_path):
+    filename = tmp_path / 'data_box.txt'
+    filename.write_text(_lines([START + 60 * i for i in range(100)]))
+    conn = sqlite3.connect(str(tmp_path / 'sensordata.db'))
+    try:
+        assert importlog.import_files(conn, [str(filename)], chunk_size = 16) == 100
+        with open(filename, 'a') as file:
+            # Die letzte Zeile wird gerade geschrieben.
+            file.write(_lines([START + 60 * i for i in range(100, 110)], header = False) + str(START + 60 * 110))
+        assert importlog.import_files(conn, [str(filename)], chunk_size = 16) == 10
+        with open(filename, 'a') as file:
+            file.write('\t0.1\tbox\t21\r\n')
+        assert importlog.import_files(conn, [str(filename)], chunk_size = 16) == 1
+        assert importlog.import_files(conn, [str(filename)]) == 0
+        assert _timestamps(conn) == [START + 60 * i for i in range(111)]
+    finally:
+        conn.close()
+
+def test_unchanged_gz_file_is_skipped(tmp_path):
+    filename = str(tmp_path / 'data_box_2024-01.txt.gz')
+    with gzip.open(filename, 'wt') as file:
+        file.write(_lines([START + 60 * i for i in range(100)]))
+    conn = sqlite3.connect(str(tmp_path / 'sensordata.db'))
+    try:
+        assert importlog.import_files(conn, [filename]) == 100
+        conn.execute('DELETE FROM data_box')
+        conn.commit()
+        # Die Datei ist vollständig übernommen und wird nicht noch einmal gelesen.
+        assert importlog.import_files(conn, [filename]) == 0
+    finally:
+        conn.close()
+
+def test_rotated_file_is_read_from_the_start(tmp_path):
+    filename = tmp_path / 'data_box.txt'
+    filename.write_text(_lines([START + 60 * i for i in range(10)]))
+    conn = sqlite3.connect(str(tmp_path / 'sensordata.db'))
+    try:
+        assert importlog.import_files(conn, [str(filename)]) == 10
+        # Rotiert und neu begonnen, die neue Datei ist schon länger als die alte Position.
+        filename.write_text(_lines([START + 86400 + 60 * i for i in range(20)]))
+        assert importlog.import_files(conn, [str(filename)]) == 20
+        assert len(_timestamps(conn)) == 30
+    finally:
+        conn.close()
+
+def test_archived_months_are_not_imported(tmp_path):
+    february = START + 31 * 86400
+    database = str(tmp_path / 'sensordata.db')
+    with db.Database.sqlite(database, persistent = True, rollups = True) as writer:
+        for i in range(10):
+            writer.enqueue({'TIMESTAMP': START + 3600 * i, 'OFFSET': 0.1, 'SENSOR': 'box', 'VALUE': {'TEMP': 20}})
+        writer.flush()
+    conn = sqlite3.connect(database)
+    try:
+        archive.archive(conn, str(tmp_path / 'archive'), max_age = 0, pause = 0, now = february)
+        rollups = conn.execute('SELECT * FROM {} ORDER BY BUCKET'.format(rollup.table_name(3600))).fetchall()
+        filename = tmp_path / 'data_box.txt'
+        filename.write_text(_lines([START + 3600 * i for i in range(20)] + [february + 60 * i for i in range(5)]))
+        assert importlog.import_files(conn, [str(filename)]) == 5
+        assert _timestamps(conn) == [february + 60 * i for i in range(5)]
+        # Die Rollups des archivierten Monats bleiben, der Februar wird ergänzt.
+        assert conn.execute('SELECT * FROM {} WHERE BUCKET < ? ORDER BY BUCKET'.format(rollup.table_name(3600)),
+                            (february,)).fetchall() == rollups
+        assert conn.execute('SELECT SUM(CNT) FROM {} WHERE BUCKET >= ? AND VALUETYPE = ?'.format(rollup.table_name(3600)),
+                            (february, 'TEMP')).fetchone()[0] == 5
+    finally:
+        conn.close()
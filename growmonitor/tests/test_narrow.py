@@ -0,0 +1,81 @@
+"""Schmales Layout (measurement) beim Schreiben, Lesen mit query.Query und migrate.py."""
+
+import sqlite3
+import numpy as np
+import pytest
+import db
+import migrate
+import narrow
+import rollup
+from query import Query
+
+START = 1704067200
+
+def _records(count):
+    return [{'TIMESTAMP': START + 60 * i, 'OFFSET': 0.2, 'SENSOR': sensor,
+             'VALUE': {'TEMP': 20 + i % 5, 'HUM': None if i % 4 == 0 else 50 + i}}
+            for i in range(count) for sensor in ('box', 'room')]
+
+def _write(filename, records, layout):
+    with db.Database.sqlite(filename, persistent = True, rollups = True, layout = layout) as database:
+        for record in records:
+            database.enqueue(record)
+        database.flush()
+
+def _series(filename, sensor, valuetype, **kwargs):
+    with Query(filename) as query:
+        series = query.get_series(sensor, valuetype, START, START + 86400, **kwargs)
+    if 'VALUE' in series:
+        valid = ~np.isnan(series['VALUE'])
+        return series['TIMESTAMP'][valid].tolist(), series['VALUE'][valid].tolist()
+    return {key: values.tolist() for key, values in series.items()}
+
+def test_narrow_layout_reads_like_wide(tmp_path):
+    wide, long = str(tmp_path / 'wide.db'), str(tmp_path / 'narrow.db')
+    _write(wide, _records(200), 'wide')
+    _write(long, _records(200), 'narrow')
+    conn = sqlite3.connect(long)
+    try:
+        tables = set(val[0] for val in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+        assert not any(name.startswith('data_') for name in tables)
+        # Leere Werte werden nicht gespeichert: 2 Sensoren, 200 Zeitpunkte, TEMP, OFFSET und 3/4 HUM.
+        assert conn.execute('SELECT COUNT(*) FROM {}'.format(narrow.MEASUREMENT_TABLE)).fetchone()[0] == 2 * (400 + 150)
+    finally:
+        conn.close()
+    for sensor in ('box', 'room'):
+        for valuetype in ('TEMP', 'HUM', 'OFFSET'):
+            assert _series(long, sensor, valuetype) == _series(wide, sensor, valuetype)
+            assert _series(long, sensor, valuetype, bucket = 3600) == _series(wide, sensor, valuetype, bucket = 3600)
+
+def test_narrow_rollups_match_backfill(tmp_path):
+    filename = str(tmp_path / 'narrow.db')
+    _write(filename, _records(200), 'narrow')
+    conn = sqlite3.connect(filename)
+    try:
+        query = 'SELECT SENSOR, VALUETYPE, BUCKET, CNT, SUM, MIN, MAX FROM {} ORDER BY 1, 2, 3'
+        incremental = [conn.execute(query.format(rollup.table_name(level))).fetchall() for level in rollup.LEVELS]
+        rollup.backfill(conn)
+        for level, rows in zip(rollup.LEVELS, incremental):
+            backfilled = conn.execute(query.format(rollup.table_name(level))).fetchall()
+            assert [row[:3] for row in backfilled] == [row[:3] for row in rows]
+            assert [value for row in backfilled for value in row[3:]] == pytest.approx([value for row in rows for value in row[3:]])
+    finally:
+        conn.close()
+
+def test_migrate_copies_resumes_and_drops(tmp_path):
+    wide, long = str(tmp_path / 'wide.db'), str(tmp_path / 'narrow.db')
+    _write(wide, _records(200), 'wide')
+    expected = {(sensor, valuetype): _series(wide, sensor, valuetype) for sensor in ('box', 'room')
+                for valuetype in ('TEMP', 'HUM', 'OFFSET')}
+    source, target = sqlite3.connect(wide), sqlite3.connect(long)
+    try:
+        assert migrate.migrate(source, target, chunk_size = 64) == 2 * (400 + 150)
+        # Ein weiterer Lauf setzt beim letzten TIMESTAMP fort und fügt nichts doppelt ein.
+        assert migrate.migrate(source, target, chunk_size = 64) == 0
+        migrate.migrate(source, target, drop = True)
+        assert source.execute("SELECT COUNT(*) FROM sqlite_master WHERE name LIKE 'data\\_%' ESCAPE '\\'").fetchone()[0] == 0
+    finally:
+        source.close()
+        target.close()
+    for (sensor, valuetype), series in expected.items():
+        assert _series(long, sensor, valuetype) == series
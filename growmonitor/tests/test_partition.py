@@ -0,0 +1,94 @@
+"""Eine Datenbank pro Monat: Zuordnung beim Schreiben, Abschließen, Lesen mit query.Query und split."""
+
+import os
+import sqlite3
+import db
+import partition
+import rollup
+from query import Query
+
+# 2024-01-01 00:00:00 UTC
+START = 1704067200
+FEBRUARY = START + 31 * 86400
+MARCH = FEBRUARY + 29 * 86400
+
+def _record(timestamp, temp = 20.0):
+    return {'TIMESTAMP': timestamp, 'OFFSET': 0.1, 'SENSOR': 'box', 'VALUE': {'TEMP': temp}}
+
+def _count(path, tablename = 'data_box'):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM {}'.format(tablename)).fetchone()[0]
+    finally:
+        conn.close()
+
+def test_records_are_routed_by_month(tmp_path):
+    directory = str(tmp_path / 'partitions')
+    with db.Database.partitioned(directory, rollups = True) as database:
+        for timestamp in range(FEBRUARY - 3600, FEBRUARY + 3600, 600):
+            database.enqueue(_record(timestamp))
+        database.flush()
+    found = partition.find(directory)
+    assert [(begin, end) for begin, end, path in found] == [(START, FEBRUARY), (FEBRUARY, MARCH)]
+    assert [_count(path) for begin, end, path in found] == [6, 6]
+    # Die Blöcke der Rollups enden an der Monatsgrenze.
+    assert _count(found[0][2], rollup.table_name(3600)) == 2
+    assert partition.find(directory, FEBRUARY, FEBRUARY) == found[1:]
+
+def test_query_reads_across_partitions(tmp_path):
+    directory = str(tmp_path / 'partitions')
+    with db.Database.partitioned(directory, rollups = True) as database:
+        for i, timestamp in enumerate(range(FEBRUARY - 7200, FEBRUARY + 7200, 60)):
+            database.enqueue(_record(timestamp, float(i)))
+        database.flush()
+    with Query(directory) as query:
+        series = query.get_series('box', 'TEMP', FEBRUARY - 7200, FEBRUARY + 7199)
+        assert series['VALUE'].tolist() == [float(i) for i in range(240)]
+        blocks = query.get_series('box', 'TEMP', FEBRUARY - 7200, FEBRUARY + 7199, bucket = 3600)
+        assert blocks['CNT'].tolist() == [60] * 4
+        assert blocks['AVG'].tolist() == [29.5, 89.5, 149.5, 209.5]
+
+def test_past_months_are_closed_and_reopened(tmp_path):
+    directory = str(tmp_path / 'partitions')
+    january = partition.filename(directory, START)
+    with db.Database.partitioned(directory, close_after = 0) as database:
+        database.enqueue(_record(START))
+        database.flush()
+        # Der gerade geschriebene Monat bleibt bis zum nächsten Schreiben offen.
+        assert not partition.is_closed(january)
+        database.enqueue(_record(FEBRUARY))
+        database.flush()
+        assert partition.is_closed(january)
+        assert not os.path.exists(january + '-wal')
+        # Ein verspäteter Datensatz öffnet den Monat wieder.
+        database.enqueue(_record(START + 60))
+        database.flush()
+        assert not partition.is_closed(january)
+    assert partition.is_closed(january)
+    assert _count(january) == 2
+
+def test_split_and_remove(tmp_path):
+    source = str(tmp_path / 'sensordata.db')
+    with db.Database.sqlite(source, persistent = True, rollups = True) as database:
+        for timestamp in range(START, MARCH + 86400, 3600):
+            database.enqueue(_record(timestamp))
+        database.flush()
+    directory = str(tmp_path / 'partitions')
+    assert partition.split(source, directory) == _count(source)
+    found = partition.find(directory)
+    assert [_count(path) for begin, end, path in found] == [31 * 24, 29 * 24, 24]
+    conn = sqlite3.connect(source)
+    try:
+        expected = conn.execute('SELECT * FROM {} ORDER BY BUCKET'.format(rollup.table_name(3600))).fetchall()
+    finally:
+        conn.close()
+    actual = []
+    for begin, end, path in found:
+        conn = sqlite3.connect(path)
+        try:
+            actual += conn.execute('SELECT * FROM {} ORDER BY BUCKET'.format(rollup.table_name(3600))).fetchall()
+        finally:
+            conn.close()
+    assert sorted(actual) == sorted(expected)
+    assert partition.remove(directory, MARCH) == [path for begin, end, path in found[:2]]
+    assert partition.find(directory) == found[2:]
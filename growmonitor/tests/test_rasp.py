@@ -0,0 +1,20 @@
+"""Treiber aus rasp.py, die sich ohne Hardware erzeugen lassen."""
+
+import gc
+import sys
+import pytest
+import rasp
+
+@pytest.mark.parametrize('cls, params', [
+    (rasp.Cam, {'timeout': 'x'}),
+    (rasp.Cam, {'backend': 'unbekannt', 'thumbnail_width': 'x'}),
+    (rasp.Adc, {'i2c_address': 'x'})
+])
+def test_failed_constructor_can_be_collected(monkeypatch, cls, params):
+    # Fehler in __del__ werden nur über sys.unraisablehook gemeldet.
+    errors = []
+    monkeypatch.setattr(sys, 'unraisablehook', errors.append)
+    with pytest.raises(ValueError):
+        cls(params)
+    gc.collect()
+    assert errors == []
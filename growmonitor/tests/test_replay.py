@@ -0,0 +1,46 @@
+"""Wiedergabe gespeicherter Messwerte: NumPy und die Klassen aus rasp im Cronjob (--exact)."""
+
+import math
+import db
+import replay
+
+# 2024-01-01 00:00:00 UTC
+START = 1704067200
+END = START + 36000
+
+def _get_config():
+    return {
+        'box': {'run_at': '* * * * *', 'class': 'Playback'},
+        'room': {'run_at': '* * * * *', 'class': 'Playback'},
+        'LIGHT': {'run_at': '* * * * *', 'class': 'Relais', 'params': {'pin': 5, 'onFrom': '02:00', 'onTo': '04:00'}},
+        'FAN': {'run_at': '* * * * *', 'class': 'Fan',
+                'params': {'pin': 17, 'boxsensor': 'box', 'roomsensor': 'room', 'lightstate': 'LIGHT'}}
+    }
+
+def test_vectorized_and_exact_agree(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    with db.Database.sqlite(filename, persistent = True) as database:
+        for i in range(600):
+            # Die Box ist zu Beginn zu warm, der Lüfter läuft also ab dem ersten Lauf.
+            database.enqueue({'TIMESTAMP': START + 60 * i, 'OFFSET': 0.1, 'SENSOR': 'box',
+                              'VALUE': {'TEMP': round(23 + 4 * math.cos(i / 40), 1), 'HUM': 55}})
+            database.enqueue({'TIMESTAMP': START + 60 * i, 'OFFSET': 0.1, 'SENSOR': 'room',
+                              'VALUE': {'TEMP': 20, 'HUM': 50}})
+        database.flush()
+    vectorized = replay.replay(_get_config(), filename, START, END)
+    exact = replay.replay(_get_config(), filename, START, END, exact = True)
+    assert sorted(vectorized) == sorted(exact) == ['FAN', 'LIGHT']
+    assert vectorized['FAN']['decisions'][0] == (START, 1) and vectorized['FAN']['switches'] > 2
+    for job_id in ('FAN', 'LIGHT'):
+        assert 'reactive_runs' not in vectorized[job_id]
+        for key in ('switches', 'on_hours', 'duty_cycle'):
+            assert exact[job_id][key] == vectorized[job_id][key], (job_id, key)
+        # Mit --exact schaltet Fan eine Sekunde nach dem Termin, im Lauf, den die neuen Werte auslösen.
+        assert [state for timestamp, state in exact[job_id]['decisions']] == \
+               [state for timestamp, state in vectorized[job_id]['decisions']]
+        for (timestamp, _), (expected, _) in zip(exact[job_id]['decisions'], vectorized[job_id]['decisions']):
+            assert 0 <= timestamp - expected <= 1
+    # Am ersten Termin fehlen Fan die Eingänge noch, dazu kommt ein ausgelöster Lauf pro Minute.
+    assert (exact['LIGHT']['runs'], exact['LIGHT']['reactive_runs']) == (600, 0)
+    assert (exact['FAN']['runs'], exact['FAN']['reactive_runs']) == (599, 600)
+    assert vectorized['FAN']['runs'] == vectorized['LIGHT']['runs'] == 600
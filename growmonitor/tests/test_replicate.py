@@ -0,0 +1,139 @@
+"""Übertragung nach der Reihenfolge des Einfügens (replication_log) mit einem Ziel im Speicher."""
+
+import re
+import sqlite3
+import pytest
+import archive
+import db
+import replicate
+from replicate import Replicator
+
+# 2024-01-01 00:00:00 UTC
+START = 1704067200
+
+class FakeRemote:
+    """DB-API Verbindung, die die Statements aus replicate.py im Speicher ausführt. Eingefügte Zeilen
+    gelten erst nach commit, fail_on_commit lässt den nächsten commit fehlschlagen."""
+
+    def __init__(self):
+        self.tables = {}
+        self.fail_on_commit = False
+        self.__pending = []
+
+    def connect(self):
+        self.__pending = []
+        return self
+
+    def cursor(self):
+        return self
+
+    def execute(self, stmt, params = ()):
+        if stmt.startswith('SELECT TABLE_NAME, COLUMN_NAME'):
+            self.__result = [(tablename, column) for tablename, (columns, rows) in self.tables.items() for column in columns]
+        elif stmt.startswith('CREATE TABLE'):
+            match = re.match(r'CREATE TABLE (\w+) \((.*)\)$', stmt)
+            columns = [column.split()[0] for column in match.group(2).split(', ') if not column.startswith('PRIMARY')]
+            self.tables[match.group(1)] = (columns, {})
+        elif stmt.startswith('ALTER TABLE'):
+            match = re.match(r'ALTER TABLE (\w+) ADD (\w+) FLOAT$', stmt)
+            self.tables[match.group(1)][0].append(match.group(2))
+        elif stmt.startswith('INSERT INTO'):
+            match = re.match(r'INSERT INTO (\w+) \(([^)]*)\)', stmt)
+            columns = match.group(2).split(', ')
+            for i in range(0, len(params), len(columns)):
+                self.__pending.append((match.group(1), dict(zip(columns, params[i:i + len(columns)]))))
+        else:
+            raise ValueError(stmt)
+
+    def fetchall(self):
+        return self.__result
+
+    def commit(self):
+        if self.fail_on_commit:
+            self.fail_on_commit = False
+            raise ConnectionError('Verbindung unterbrochen')
+        for tablename, row in self.__pending:
+            # WHERE NOT EXISTS: vorhandene TIMESTAMPs bleiben unverändert.
+            self.tables[tablename][1].setdefault(row['TIMESTAMP'], row)
+        self.__pending = []
+
+    def close(self):
+        self.__pending = []
+
+    def timestamps(self, tablename):
+        return sorted(self.tables[tablename][1])
+
+def _write(filename, timestamps, sensor = 'box'):
+    with db.Database.sqlite(filename, persistent = True) as database:
+        for timestamp in timestamps:
+            database.enqueue({'TIMESTAMP': timestamp, 'OFFSET': 0.1, 'SENSOR': sensor, 'VALUE': {'TEMP': 20.5}})
+        database.flush()
+
+def _log_size(filename):
+    conn = sqlite3.connect(filename)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM {}'.format(replicate.LOG_TABLE)).fetchone()[0]
+    finally:
+        conn.close()
+
+def test_initial_copy_in_batches(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    _write(filename, [START + 60 * i for i in range(25)])
+    remote = FakeRemote()
+    replicator = Replicator(filename, remote.connect, batch_size = 10)
+    assert replicator.replicate()
+    assert replicator.replicate()
+    assert not replicator.replicate()
+    assert remote.timestamps('data_box') == [START + 60 * i for i in range(25)]
+    assert remote.tables['data_box'][1][START]['TEMP'] == 20.5
+
+def test_late_rows_with_old_timestamps_are_replicated(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    _write(filename, [START + 60 * i for i in range(10, 20)])
+    remote = FakeRemote()
+    replicator = Replicator(filename, remote.connect)
+    assert not replicator.replicate()
+    # Nach einem Ausfall kommen Zeilen, die älter als alle übertragenen sind, und neue Zeilen.
+    _write(filename, [START + 60 * i for i in range(0, 5)] + [START + 60 * i for i in range(20, 25)])
+    assert _log_size(filename) == 10
+    assert not replicator.replicate()
+    assert remote.timestamps('data_box') == [START + 60 * i for i in list(range(0, 5)) + list(range(10, 25))]
+    # Übertragene Einträge werden aus dem Log gelöscht.
+    assert _log_size(filename) == 0
+
+def test_failed_commit_is_repeated(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    _write(filename, [START])
+    remote = FakeRemote()
+    replicator = Replicator(filename, remote.connect)
+    replicator.replicate()
+    _write(filename, [START + 60, START + 120])
+    remote.fail_on_commit = True
+    with pytest.raises(ConnectionError):
+        replicator.replicate()
+    assert remote.timestamps('data_box') == [START]
+    # Der Stand wurde nicht weitergesetzt, die Zeilen werden beim nächsten Durchlauf gesendet.
+    assert _log_size(filename) == 2
+    replicator.replicate()
+    assert remote.timestamps('data_box') == [START, START + 60, START + 120]
+
+def test_archive_keeps_months_that_wait_for_replication(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    february = START + 31 * 86400
+    _write(filename, [START + 3600 * i for i in range(10)] + [february + 3600 * i for i in range(10)])
+    remote = FakeRemote()
+    replicator = Replicator(filename, remote.connect)
+    replicator.replicate()
+    # Eine verspätete Zeile aus dem Januar wartet noch auf die Übertragung.
+    _write(filename, [START + 86400])
+    conn = sqlite3.connect(filename)
+    try:
+        assert replicate.get_replicated_until(conn, 'data_box') == START + 86400
+        assert archive.archive(conn, str(tmp_path / 'archive'), max_age = 0, pause = 0, now = february + 31 * 86400) == 0
+        replicator.replicate()
+        assert replicate.get_replicated_until(conn, 'data_box') is None
+        # Nach der Übertragung werden Januar und Februar archiviert.
+        assert archive.archive(conn, str(tmp_path / 'archive'), max_age = 0, pause = 0, now = february + 31 * 86400) == 21
+    finally:
+        conn.close()
+    assert len(remote.timestamps('data_box')) == 21
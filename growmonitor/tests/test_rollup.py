@@ -0,0 +1,93 @@
+"""Inkrementelle Rollups beim Schreiben im Vergleich zum Neuaufbau mit backfill."""
+
+import random
+import sqlite3
+import pytest
+import archive
+import db
+import rollup
+
+# 2024-01-01 00:00:00 UTC
+START = 1704067200
+
+def _write(filename, records):
+    with db.Database.sqlite(filename, persistent = True, rollups = True) as database:
+        for record in records:
+            database.enqueue(record)
+        database.flush()
+
+def _records(start, count, interval = 37):
+    """Unregelmäßige Werte mit Lücken (None) über mehrere Stunden."""
+    generator = random.Random(1)
+    return [{'TIMESTAMP': start + interval * i, 'OFFSET': round(generator.random(), 1), 'SENSOR': 'box',
+             'VALUE': {'TEMP': round(generator.uniform(15, 30), 2), 'HUM': None if i % 7 == 0 else generator.randint(30, 90)}}
+            for i in range(count)]
+
+def _dump(conn, level):
+    return {row[:3]: row[3:] for row in conn.execute(
+        'SELECT SENSOR, VALUETYPE, BUCKET, CNT, SUM, MIN, MAX FROM {}'.format(rollup.table_name(level)))}
+
+def _assert_equal(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, values in expected.items():
+        assert actual[key] == pytest.approx(values), key
+
+def test_backfill_matches_incremental_update(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    _write(filename, _records(START, 500))
+    conn = sqlite3.connect(filename)
+    try:
+        incremental = {level: _dump(conn, level) for level in rollup.LEVELS}
+        assert len(incremental[3600]) == 3 * 6
+        rollup.backfill(conn)
+        for level in rollup.LEVELS:
+            _assert_equal(_dump(conn, level), incremental[level])
+    finally:
+        conn.close()
+
+def test_derived_levels_match_raw_data(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    _write(filename, _records(START, 500))
+    conn = sqlite3.connect(filename)
+    try:
+        rollup.backfill(conn)
+        for level in rollup.LEVELS[1:]:
+            expected = {('box', 'TEMP', row[0]): row[1:] for row in conn.execute(
+                'SELECT TIMESTAMP / {0} * {0}, COUNT(TEMP), SUM(TEMP), MIN(TEMP), MAX(TEMP) FROM data_box '
+                'GROUP BY TIMESTAMP / {0}'.format(level))}
+            actual = {key: values for key, values in _dump(conn, level).items() if key[1] == 'TEMP'}
+            _assert_equal(actual, expected)
+    finally:
+        conn.close()
+
+def test_backfill_only_replaces_the_range(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    _write(filename, _records(START, 500))
+    conn = sqlite3.connect(filename)
+    try:
+        before = _dump(conn, 3600)
+        conn.execute('UPDATE data_box SET TEMP = 100')
+        conn.commit()
+        rollup.backfill(conn, start = START + 3600, end = START + 7199)
+        after = _dump(conn, 3600)
+        assert after[('box', 'TEMP', START)] == before[('box', 'TEMP', START)]
+        assert after[('box', 'TEMP', START + 3600)][2:] == (100, 100)
+        assert after[('box', 'TEMP', START + 7200)] == before[('box', 'TEMP', START + 7200)]
+    finally:
+        conn.close()
+
+def test_backfill_keeps_archived_months(tmp_path):
+    filename = str(tmp_path / 'sensordata.db')
+    # Januar und Februar 2024
+    _write(filename, _records(START, 200, 3600) + _records(START + 31 * 86400, 200, 3600))
+    conn = sqlite3.connect(filename)
+    try:
+        before = _dump(conn, 3600)
+        # Archiviert wird der Januar, die Rohdaten liegen danach nur noch im Archiv.
+        archive.archive(conn, str(tmp_path / 'archive'), max_age = 0, pause = 0, now = START + 31 * 86400)
+        assert archive.get_archived_until(conn, 'data_box') == START + 31 * 86400
+        assert conn.execute('SELECT COUNT(*) FROM data_box WHERE TIMESTAMP < ?', (START + 31 * 86400,)).fetchone()[0] == 0
+        rollup.backfill(conn)
+        _assert_equal(_dump(conn, 3600), before)
+    finally:
+        conn.close()
@@ -0,0 +1,45 @@
+"""Gepufferte Textdateien mit TextLog und ihr Import mit importlog.py."""
+
+import sqlite3
+import db
+import importlog
+from textlog import TextLog
+
+# 2024-01-01 00:00:00 UTC
+START = 1704067200
+
+def _record(timestamp, **values):
+    return {'TIMESTAMP': timestamp, 'OFFSET': 0.1, 'SENSOR': 'box', 'VALUE': values}
+
+def test_reopened_file_gets_a_header_for_new_columns(tmp_path):
+    with TextLog(str(tmp_path), rotate = None) as textlog:
+        textlog.write(_record(START, TEMP = 20.5, HUM = 50))
+    # Neustart mit zusätzlichen Spalten (z. B. DEWP aus derived.py).
+    with TextLog(str(tmp_path), rotate = None) as textlog:
+        textlog.write(_record(START + 60, TEMP = 21.0, HUM = 51, DEWP = 10.2))
+    # Neustart mit unveränderten Spalten schreibt keine weitere Kopfzeile.
+    with TextLog(str(tmp_path), rotate = None) as textlog:
+        textlog.write(_record(START + 120, TEMP = 21.5, HUM = 52, DEWP = 10.9))
+    filename = str(tmp_path / 'data_box.txt')
+    with open(filename) as file:
+        headers = [line.rstrip('\n') for line in file if line.startswith('TIMESTAMP\t')]
+    assert headers == ['TIMESTAMP\tOFFSET\tSENSOR\tTEMP\tHUM', 'TIMESTAMP\tOFFSET\tSENSOR\tTEMP\tHUM\tDEWP']
+    assert db._read_last_header(filename) == headers[-1]
+
+    conn = sqlite3.connect(str(tmp_path / 'sensordata.db'))
+    try:
+        assert importlog.import_files(conn, [filename]) == 3
+        assert conn.execute('SELECT TIMESTAMP, TEMP, HUM, DEWP FROM data_box ORDER BY TIMESTAMP').fetchall() == \
+               [(START, 20.5, 50, None), (START + 60, 21.0, 51, 10.2), (START + 120, 21.5, 52, 10.9)]
+    finally:
+        conn.close()
+
+def test_read_last_header_across_blocks(tmp_path):
+    filename = tmp_path / 'data_box.txt'
+    lines = ['TIMESTAMP\tOFFSET\tSENSOR\tTEMP\r\n'] + ['{}\t0.1\tbox\t20\r\n'.format(START + i) for i in range(100)]
+    lines += ['TIMESTAMP\tOFFSET\tSENSOR\tTEMP\tHUM\r\n'] + ['{}\t0.1\tbox\t20\t50\r\n'.format(START + i) for i in range(100, 200)]
+    filename.write_bytes(''.join(lines).encode())
+    for block_size in (7, 16, 100, 65536):
+        assert db._read_last_header(str(filename), block_size) == 'TIMESTAMP\tOFFSET\tSENSOR\tTEMP\tHUM'
+    filename.write_bytes(b'1\t0.1\tbox\t20\r\n')
+    assert db._read_last_header(str(filename), 4) is None
@@ -0,0 +1,166 @@
+import gzip
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+import db
+
+class TextLog:
+    """Gepufferte Variante von db.write_line. Die Dateien data_sensorname.txt bleiben offen, die
+    Zeilen werden gesammelt und erst nach flush_interval Sekunden oder max_lines Zeilen geschrieben.
+    Die Datei data_sensorname_latest.txt wird nur beim flush über eine temporäre Datei und
+    os.replace atomar ersetzt. Beginnt ein neuer Tag bzw. Monat, wird die Logdatei in
+    data_sensorname_(Zeitraum).txt.gz umbenannt und komprimiert.
+    """
+
+    __periods = {'day': '%Y-%m-%d', 'month': '%Y-%m', None: None}
+
+    def __init__(self, directory = '.', flush_interval = 60, max_lines = 1000, rotate = 'month', table_prefix = 'data'):
+        """Konstruktor
+
+        Args:
+            directory (str, optional): Verzeichnis der Logdateien. Defaults to '.'.
+            flush_interval (int, optional): Sekunden, nach denen spätestens geschrieben wird. Defaults to 60.
+            max_lines (int, optional): Anzahl der gepufferten Zeilen, ab der geschrieben wird. Defaults to 1000.
+            rotate (str, optional): 'day', 'month' oder None (keine Rotation). Defaults to 'month'.
+            table_prefix (str, optional): Prefix der Dateinamen. Defaults to 'data'.
+        """
+        if rotate not in self.__periods:
+            raise Exception('Ungültiger Wert für rotate: {}'.format(rotate))
+        self.__directory = directory
+        self.__flush_interval = flush_interval
+        self.__max_lines = max_lines
+        self.__period_format = self.__periods[rotate]
+        self.__table_prefix = table_prefix
+        self.__files = {}
+        self.__pending = 0
+        self.__last_flush = time.time()
+        self.__lock = threading.RLock()
+
+    def write(self, data):
+        """Puffert den Datensatz und schreibt die Puffer, wenn flush_interval oder max_lines
+        erreicht ist. Fehler werden wie bei db.write_line nur protokolliert."""
+        try:
+            filename, record = db._prepare_record(data, self.__table_prefix)
+            header = ['TIMESTAMP', 'OFFSET', 'SENSOR'] + \
+                     [v for v in record['VALUE'].keys()]
+            values = [str(record['TIMESTAMP']), str(record['OFFSET']), str(record['SENSOR'])] + \
+                     [str(v) for v in record['VALUE'].values()]
+            period = self.__get_period(record['TIMESTAMP'])
+            with self.__lock:
+                entry = self.__files.get(filename)
+                if entry is None:
+                    entry = self.__open_entry(filename, period)
+                # Ältere Datensätze (z. B. nachgeholte Termine) lösen keine Rotation aus.
+                if period is not None and period > entry['period']:
+                    self.__flush_entry(filename, entry)
+                    self.__rotate(filename, entry)
+                    entry['period'] = period
+                entry['lines'].append(('\t'.join(header), '\t'.join(values)))
+                self.__pending += 1
+                due = self.__pending >= self.__max_lines or \
+                      time.time() - self.__last_flush >= self.__flush_interval
+            if due:
+                self.flush()
+        except Exception:
+            logging.exception('Fehler beim Schreiben in die Textdatei.')
+
+    def flush(self):
+        """Schreibt alle gepufferten Zeilen und ersetzt die _latest Dateien."""
+        with self.__lock:
+            for filename, entry in self.__files.items():
+                try:
+                    self.__flush_entry(filename, entry)
+                except Exception:
+                    logging.exception('Fehler beim Schreiben in die Textdatei %s.', filename)
+            self.__pending = 0
+            self.__last_flush = time.time()
+
+    def close(self):
+        """Schreibt die Puffer und schließt alle Dateien."""
+        with self.__lock:
+            self.flush()
+            for entry in self.__files.values():
+                if entry['handle'] is not None:
+                    entry['handle'].close()
+                    entry['handle'] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __get_period(self, timestamp):
+        if self.__period_format is None:
+            return None
+        return datetime.fromtimestamp(timestamp).strftime(self.__period_format)
+
+    def __open_entry(self, filename, period):
+        """Legt den Eintrag für eine Logdatei an. Stammt eine vorhandene Datei aus einem früheren
+        Zeitraum (z. B. nach einem Neustart), wird sie zuerst rotiert."""
+        path = os.path.join(self.__directory, filename + '.txt')
+        entry = {'handle': None, 'header': None, 'lines': [], 'period': period}
+        if os.path.isfile(path):
+            entry['period'] = self.__get_period(os.path.getmtime(path))
+            if period is not None and entry['period'] < period:
+                self.__rotate(filename, entry)
+                entry['period'] = period
+        self.__files[filename] = entry
+        return entry
+
+    def __flush_entry(self, filename, entry):
+        """Hängt die gepufferten Zeilen an die Logdatei an und ersetzt die _latest Datei. Die
+        Kopfzeile wird geschrieben, wenn die Datei neu ist oder sich die Spalten geändert haben."""
+        if len(entry['lines']) == 0:
+            return
+        path = os.path.join(self.__directory, filename)
+        if entry['handle'] is None:
+            entry['handle'] = open(path + '.txt', 'a')
+            # Bei einer bestehenden Datei (z. B. nach einem Neustart) gilt ihre letzte Kopfzeile. Haben
+            # sich die Spalten seitdem geändert, wird eine neue Kopfzeile geschrieben.
+            entry['header'] = None if entry['handle'].tell() == 0 else db._read_last_header(path + '.txt')
+        output = []
+        for header, values in entry['lines']:
+            if header != entry['header']:
+                output.append(header + '\r\n')
+                entry['header'] = header
+            output.append(values + '\r\n')
+        entry['handle'].write(''.join(output))
+        entry['handle'].flush()
+
+        header, values = entry['lines'][-1]
+        with open(path + '_latest.txt.tmp', 'w') as logfile:
+            logfile.write(header + '\r\n')
+            logfile.write(values + '\r\n')
+        os.replace(path + '_latest.txt.tmp', path + '_latest.txt')
+        entry['lines'] = []
+
+    def __rotate(self, filename, entry):
+        """Benennt die Logdatei in data_sensorname_(Zeitraum).txt um und komprimiert sie in einem
+        eigenen Thread, damit die Messungen nicht warten müssen."""
+        if entry['handle'] is not None:
+            entry['handle'].close()
+            entry['handle'] = None
+        entry['header'] = None
+        path = os.path.join(self.__directory, filename + '.txt')
+        if entry['period'] is None or not os.path.isfile(path):
+            return
+        target = os.path.join(self.__directory, '{}_{}.txt'.format(filename, entry['period']))
+        suffix = 1
+        while os.path.exists(target) or os.path.exists(target + '.gz'):
+            target = os.path.join(self.__directory, '{}_{}_{}.txt'.format(filename, entry['period'], suffix))
+            suffix += 1
+        os.rename(path, target)
+        threading.Thread(target = _compress, args = (target,)).start()
+
+def _compress(filename):
+    """Komprimiert die Datei nach filename.gz und löscht das Original."""
+    try:
+        with open(filename, 'rb') as src, gzip.open(filename + '.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(filename)
+    except Exception:
+        logging.exception('Fehler beim Komprimieren von %s.', filename)
@@ -8,6 +8,11 @@ for(package in c("tidyverse", "skimr", "lubridate", "gridExtra", "scales", "DBI"
 
 database <- "../data/sensordata.db"
 #database <- "C:/Users/Michael/Desktop/sensordata.db"
+# Konfiguration von growmonitor mit den Einträgen compress (siehe growmonitor/compress.py)
+config_file <- "../growmonitor/cronjobs.growbox.json"
+# Größter Abstand zwischen zwei gespeicherten Werten eines verdichteten Sensors in Sekunden, über
+# den noch rekonstruiert wird (wie MAX_GAP in growmonitor/replay.py).
+max_gap <- 1800
 
 calc_dewpoint <- function(temp = NA, hum = NA) {
 	# http://old.wetterzentrale.de/cgi-bin/webbbs/wzarchive2004_2.pl?noframes;read=506422
@@ -20,6 +25,56 @@ calc_dewpoint <- function(temp = NA, hum = NA) {
 	const$b * log(e/const$E0) / (const$a-log(e/const$E0))
 }
 
+get_fill_methods <- function() {
+	# Liefert pro Tabelle (data_sensorname) die Rekonstruktion der verdichteten Sensoren: linear
+	# bei swinging_door, step bei deadband. Sensoren ohne compress fehlen.
+	methods <- list()
+	if (file.exists(config_file)) {
+		config <- jsonlite::fromJSON(config_file, simplifyVector = FALSE)
+		for (id in names(config)) {
+			method <- config[[id]]$compress$method
+			if (!is.null(method)) {
+				methods[[str_c("data_", str_to_lower(id))]] <- ifelse(method == "swinging_door", "linear", "step")
+			}
+		}
+	}
+	methods
+}
+
+fill_series <- function(result, starttime, endtime, interval, method) {
+	# Berechnet die Werte einer verdichteten Serie im Raster interval wie reconstruct in
+	# growmonitor/compress.py: step hält den letzten gespeicherten Wert, linear verbindet die
+	# gespeicherten Werte. Vor dem ersten Wert, nach dem letzten (linear) und in Lücken über
+	# max_gap wird keine Zeile geliefert.
+	result <- arrange(result, TIMESTAMP)
+	grid <- seq(ceiling(starttime / interval) * interval, endtime, by = interval)
+	if (nrow(result) == 0 || length(grid) == 0) {
+		return(result[0, ])
+	}
+	index <- findInterval(grid, result$TIMESTAMP)
+	previous <- result$TIMESTAMP[pmax(index, 1)]
+	if (method == "linear") {
+		# Ein gespeicherter Wert selbst gilt auch vor einer Lücke.
+		gap <- ifelse(grid == previous, 0, result$TIMESTAMP[pmin(index + 1, nrow(result))] - previous)
+		valid <- index > 0 & gap <= max_gap & grid <= max(result$TIMESTAMP)
+	} else {
+		valid <- index > 0 & grid - previous <= max_gap
+	}
+	filled <- tibble(TIMESTAMP = grid[valid], SENSOR = rep(result$SENSOR[1], sum(valid)))
+	for (column in setdiff(names(result), c("TIMESTAMP", "SENSOR"))) {
+		known <- !is.na(result[[column]])
+		if (sum(known) == 0 || sum(valid) == 0) {
+			filled[[column]] <- rep(NA_real_, sum(valid))
+		} else {
+			# approx benötigt für linear mindestens zwei Werte.
+			linear <- method == "linear" && sum(known) > 1
+			filled[[column]] <- approx(result$TIMESTAMP[known], result[[column]][known], xout = grid[valid],
+			                           method = ifelse(linear, "linear", "constant"), f = 0, rule = 2)$y
+		}
+	}
+	filled
+}
+
 get_data <- function(starttime = NA, endtime = NA, interval = NA, sensor = ".") {
 	# Liefert die Daten aller Tabellen in der Datenbank normalisiert im Format
 	# TIMESTAMP      SENSOR VALUETYPE  VAL
@@ -34,15 +89,32 @@ get_data <- function(starttime = NA, endtime = NA, interval = NA, sensor = ".")
 	interval <- replace_na(interval, 1)
 	
 	conn <- dbConnect(RSQLite::SQLite(), database)
-	tables <- dbListTables(conn)
+	# Nur die Sensortabellen, nicht die Rollup Tabellen von growmonitor.
+	tables <- dbListTables(conn) %>% keep(~ str_starts(str_to_lower(.x), "data_"))
+	methods <- get_fill_methods()
 	
 	data <- tables[str_detect(str_to_lower(tables), str_to_lower(sensor))] %>%
 		map_dfr(function(table) {
-			result <- dbGetQuery(conn, str_c("SELECT * FROM ", table, " WHERE TIMESTAMP >= ", starttime, " AND TIMESTAMP <= ", endtime, " AND TIMESTAMP % ", interval, "= 0")) %>%
-				mutate(SENSOR = str_trim(SENSOR))				
+			method <- methods[[str_to_lower(table)]]
+			if (is.null(method)) {
+				result <- dbGetQuery(conn, str_c("SELECT * FROM ", table, " WHERE TIMESTAMP >= ", starttime, " AND TIMESTAMP <= ", endtime, " AND TIMESTAMP % ", interval, "= 0")) %>%
+					mutate(SENSOR = str_trim(SENSOR))
+			} else {
+				# Verdichtete Sensoren speichern nur einzelne Werte. Sie werden mit den angrenzenden
+				# Werten gelesen und im Raster interval (mindestens 1 Minute) rekonstruiert.
+				result <- dbGetQuery(conn, str_c("SELECT * FROM ", table, " WHERE TIMESTAMP >= ", starttime - max_gap, " AND TIMESTAMP <= ", endtime + max_gap)) %>%
+					mutate(SENSOR = str_trim(SENSOR)) %>%
+					fill_series(starttime, endtime, max(interval, 60), method)
+			}
 			sensor <- str_to_lower(result$SENSOR[1])
-			if (str_starts(sensor, "bme280")) {
-				result <- mutate(result, DEWP = round(calc_dewpoint(TEMP, HUM), 1))
+			# Neuere Datensätze enthalten DEWP bereits (siehe growmonitor/derived.py). Ältere Zeilen
+			# (DEWP ist NA, auch wenn die Spalte später angelegt wurde) werden einzeln berechnet.
+			# Ohne Zeilen im Zeitraum ist sensor NA.
+			if (isTRUE(str_starts(sensor, "bme280"))) {
+				if (!("DEWP" %in% names(result))) {
+					result$DEWP <- NA_real_
+				}
+				result <- mutate(result, DEWP = coalesce(DEWP, round(calc_dewpoint(TEMP, HUM), 1)))
 			}
 			if (str_starts(sensor, "tsl2561")) {
 				result <- rename(result, LUX = VALUE)
@@ -54,6 +126,37 @@ get_data <- function(starttime = NA, endtime = NA, interval = NA, sensor = ".")
 	data
 }
 
+get_rollup <- function(starttime, endtime, level = 600) {
+	# Liefert die von growmonitor beim Schreiben verdichteten Werte (siehe rollup.py) im Format
+	# TIMESTAMP      SENSOR VALUETYPE  AVG  MIN  MAX
+	# Gibt es die Rollup Tabelle noch nicht, wird NULL geliefert. Bei verdichteten Sensoren ist AVG
+	# der Mittelwert der gespeicherten Werte und nicht über die Zeit gewichtet (siehe compress.py).
+	conn <- dbConnect(RSQLite::SQLite(), database)
+	table <- str_c("rollup_", level)
+	data <- NULL
+	if (dbExistsTable(conn, table)) {
+		data <- dbGetQuery(conn, str_c("SELECT BUCKET AS TIMESTAMP, SENSOR, VALUETYPE, SUM / CNT AS AVG, MIN, MAX FROM ", table,
+		                               " WHERE BUCKET >= ", starttime, " AND BUCKET <= ", endtime)) %>%
+			as_tibble() %>%
+			mutate(VALUETYPE = ifelse(str_starts(str_to_lower(SENSOR), "tsl2561") & VALUETYPE == "VALUE", "LUX", VALUETYPE))
+		# Der Taupunkt wird von growmonitor gespeichert. Nur für Blöcke ohne DEWP Werte (Zeilen von
+		# vor derived.py) wird er aus den Mittelwerten des Blocks berechnet.
+		stored <- data %>% filter(VALUETYPE == "DEWP" & !is.na(AVG)) %>% distinct(TIMESTAMP, SENSOR)
+		dewp <- data %>%
+			filter(str_starts(str_to_lower(SENSOR), "bme280") & VALUETYPE %in% c("TEMP", "HUM")) %>%
+			select(TIMESTAMP, SENSOR, VALUETYPE, AVG) %>%
+			anti_join(stored, by = c("TIMESTAMP", "SENSOR"))
+		if (nrow(dewp) > 0) {
+			dewp <- dewp %>%
+				spread(VALUETYPE, AVG) %>%
+				transmute(TIMESTAMP, SENSOR, VALUETYPE = "DEWP", AVG = round(calc_dewpoint(TEMP, HUM), 1), MIN = AVG, MAX = AVG)
+			data <- bind_rows(data, dewp)
+		}
+	}
+	dbDisconnect(conn)
+	data
+}
+
 #* @json
 #* @get /QutaqIyomi297FaxisUbaza575/getStats
 getStats <- function(hours = NA) {
@@ -65,15 +168,20 @@ getStats <- function(hours = NA) {
 	endtime <- trunc(now / 600) * 600
 	starttime <- endtime - hours * 3600
 	
-	# Werden über 7 Tage abgefragt, dann fragen wir nur die vollen 10 Minuten Werte aus der DB ab.
-	# Davor verwenden wir die Minutenwerte und bilden MAX/MIN/AVG lokal (exakter bei MAX/MIN).
-	interval <- ifelse(hours <= 7*24, 60, 600)
-	data10min <-  get_data(starttime, endtime, interval = interval) %>%
-		mutate(TIMESTAMP = trunc(TIMESTAMP / 600) * 600) %>%
-		group_by(SENSOR, VALUETYPE, TIMESTAMP) %>%
-		summarize(AVG = mean(VALUE, na.rm = TRUE),
-				  MIN = min(VALUE, na.rm = TRUE), 
-				  MAX = max(VALUE, na.rm = TRUE))		
+	# Die 10 Minuten Blöcke werden aus der Rollup Tabelle gelesen. Gibt es sie nicht, werden sie
+	# aus den Rohdaten berechnet.
+	data10min <- get_rollup(starttime, endtime, level = 600)
+	if (is.null(data10min) || nrow(data10min) == 0) {
+		# Werden über 7 Tage abgefragt, dann fragen wir nur die vollen 10 Minuten Werte aus der DB ab.
+		# Davor verwenden wir die Minutenwerte und bilden MAX/MIN/AVG lokal (exakter bei MAX/MIN).
+		interval <- ifelse(hours <= 7*24, 60, 600)
+		data10min <-  get_data(starttime, endtime, interval = interval) %>%
+			mutate(TIMESTAMP = trunc(TIMESTAMP / 600) * 600) %>%
+			group_by(SENSOR, VALUETYPE, TIMESTAMP) %>%
+			summarize(AVG = mean(VALUE, na.rm = TRUE),
+					  MIN = min(VALUE, na.rm = TRUE), 
+					  MAX = max(VALUE, na.rm = TRUE))		
+	}
 
 	# Den letzten Wert nur aus der letzten Stunde berücksichtigen. Sonst ist er nicht mehr aktuell.
 	last_values <- get_data(now - 3600, now) %>%
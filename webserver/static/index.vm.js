@@ -1,5 +1,5 @@
 /* jshint esversion: 8, strict:global */
-/* globals console, ko, fetch */
+/* globals console, ko, fetch, EventSource, location */
 "use strict";
 
 class AppViewModel {
@@ -21,6 +21,7 @@ class AppViewModel {
         this.bme280_raum_data = ko.observableArray();
         this.relaymonitor_data = ko.observableArray();
         this.refresh(1);
+        this.listen();
     }
     async refresh(days) {
         days = days || 1;
@@ -36,9 +37,7 @@ class AppViewModel {
 
         let last_timestamp = Math.max(...data.map(val => val.LAST_TIMESTAMP));
         if (!isNaN(last_timestamp)) {
-            let last = new Date(last_timestamp * 1000);
-            this.last_date(last.toLocaleDateString('de-DE', { weekday: 'short', month: 'numeric', day: 'numeric' }));
-            this.last_time(last.getHours() + ":" + ("00" + last.getMinutes()).slice(-2));
+            this.setLastTimestamp(last_timestamp);
         }
         this.bme280_box_data(data.filter(val => val.SENSOR == 'BME280_BOX' && ['TEMP', 'HUM', 'DEWP'].indexOf(val.VALUETYPE) !== -1));
         this.bme280_raum_data(data.filter(val => val.SENSOR == 'BME280_RAUM' && ['TEMP', 'HUM', 'DEWP'].indexOf(val.VALUETYPE) !== -1));
@@ -46,6 +45,37 @@ class AppViewModel {
 
     }
 
+    setLastTimestamp(timestamp) {
+        let last = new Date(timestamp * 1000);
+        this.last_date(last.toLocaleDateString('de-DE', { weekday: 'short', month: 'numeric', day: 'numeric' }));
+        this.last_time(last.getHours() + ":" + ("00" + last.getMinutes()).slice(-2));
+    }
+
+    /* Neue Messwerte kommen als Server-Sent Events vom PushServer (growmonitor/push.py, Port 9102).
+     * Der PushServer verwendet denselben geheimen Pfad wie die R API (GROWMONITOR_PUSH_TOKEN).
+     * Nach einem Verbindungsabbruch verbindet sich EventSource selbst neu und bekommt die
+     * verpassten Werte über Last-Event-ID nachgeliefert. */
+    listen() {
+        if (typeof EventSource === 'undefined') { return; }
+        let path = location.pathname.replace(/\/[^\/]*$/, '');
+        let source = new EventSource(location.protocol + '//' + location.hostname + ':9102' + path + '/events');
+        source.onmessage = event => this.updateLastValue(JSON.parse(event.data));
+    }
+
+    updateLastValue(data) {
+        let values = (data.VALUE !== null && typeof data.VALUE === 'object') ? data.VALUE : { VALUE: data.VALUE };
+        [this.bme280_box_data, this.bme280_raum_data, this.relaymonitor_data].forEach(list => {
+            let changed = false;
+            let items = list().map(val => {
+                if (val.SENSOR != data.SENSOR || values[val.VALUETYPE] === undefined) { return val; }
+                changed = true;
+                return Object.assign({}, val, { LAST_VALUE: values[val.VALUETYPE], LAST_TIMESTAMP: data.TIMESTAMP });
+            });
+            if (changed) { list(items); }
+        });
+        this.setLastTimestamp(data.TIMESTAMP);
+    }
+
     clearChart() {
         let chartSeries = this.chartSeries();
         Object.keys(chartSeries).forEach(id => chartSeries[id].remove());